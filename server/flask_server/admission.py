@@ -0,0 +1,86 @@
+import threading
+import time
+
+
+class AdmissionGate:
+    """
+    Bounded admission for detection requests within one worker process
+    At most max_concurrent requests run at once and at most max_queued wait
+    for a slot, each for up to queue_timeout seconds; anything beyond that is
+    rejected so overload shows up as fast 503s instead of growing latency.
+    close() rejects new work while admitted requests finish.
+    """
+
+    def __init__(self, max_concurrent, max_queued=0, queue_timeout=1.0):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queued = max(0, int(max_queued))
+        self.queue_timeout = queue_timeout
+        self._slots = threading.Semaphore(self.max_concurrent)
+        self._lock = threading.Condition()
+        self._waiting = 0
+        self._active = 0
+        self._closed = False
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0, 'draining': 0}
+
+    def acquire(self):
+        """Returns None when admitted (call release() afterwards), else the rejection reason"""
+        with self._lock:
+            if self._closed:
+                self.rejected['draining'] += 1
+                return 'draining'
+            if not self._slots.acquire(blocking=False):
+                if self._waiting >= self.max_queued:
+                    self.rejected['queue_full'] += 1
+                    return 'queue_full'
+                self._waiting += 1
+            else:
+                self._active += 1
+                self.admitted += 1
+                return None
+
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self.rejected['timeout'] += 1
+                return 'timeout'
+            self._active += 1
+            self.admitted += 1
+        return None
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+            self._lock.notify_all()
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+
+    def drain(self, timeout=None):
+        """Stop admitting and wait for admitted requests; returns True if none are left"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._closed = True
+            while self._active > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+            return self._active == 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': True,
+                'max_concurrent': self.max_concurrent,
+                'max_queued': self.max_queued,
+                'queue_timeout_s': self.queue_timeout,
+                'active': self._active,
+                'waiting': self._waiting,
+                'draining': self._closed,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected)
+            }
@@ -0,0 +1,358 @@
+"""
+Offline focus timeline for a recorded lecture
+
+Frames are streamed from the video with a configurable stride (skipped
+frames are grabbed but never decoded), handed to a pool of worker
+processes through a bounded queue, and each worker runs its own
+YOLODetector over the seat layout. Results are put back in frame order,
+smoothed per seat, and written to CSV or Parquet as they arrive, so memory
+stays bounded by the queue size regardless of the video length.
+
+    python analyze_video.py lecture.mp4 --model models/best.onnx --seats layout.json --output timeline.csv
+    python analyze_video.py lecture.mp4 --model models/best.pt --seats layout.json --every 0.5 --workers 4 --output timeline.parquet
+
+Parquet output needs pyarrow, which is optional and not in requirements.txt.
+
+The seat layout is the same list of {seat_id, x, y, width, height} objects
+sent as seat_positions to /api/detect-frame, optionally wrapped in
+{"seat_positions": [...]}.
+"""
+import argparse
+import csv
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2
+
+TIMELINE_COLUMNS = (
+    'timestamp_s', 'frame_index', 'seat_id', 'gesture_type', 'raw_gesture_type', 'confidence',
+    'face_detected', 'body_detected', 'bbox_x', 'bbox_y', 'bbox_width', 'bbox_height'
+)
+
+logger = logging.getLogger('analyze_video')
+
+
+def load_seat_layout(path):
+    with open(path) as f:
+        layout = json.load(f)
+    if isinstance(layout, dict):
+        layout = layout.get('seat_positions', [])
+    return layout
+
+
+def iter_frames(path, stride=1, start=0.0, end=None):
+    """
+    Yield (frame_index, timestamp_s, frame) for every stride-th frame
+    Only kept frames are decoded; the others are just grabbed
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video: {path}")
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    try:
+        if start > 0:
+            capture.set(cv2.CAP_PROP_POS_MSEC, start * 1000)
+        index = int(capture.get(cv2.CAP_PROP_POS_FRAMES))
+        while True:
+            if not capture.grab():
+                break
+            timestamp = index / fps
+            if end is not None and timestamp > end:
+                break
+            if index % stride == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                yield index, timestamp, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def _detect_worker(worker_id, model_path, detector_options, seat_positions, jobs, results, current, log_level):
+    """
+    Worker process: one detector, frames from jobs, detections to results
+    current holds (sequence, frame index, timestamp) of the frame being
+    analyzed, so the parent can account for it if the worker dies
+    """
+    from detector import YOLODetector
+
+    logging.getLogger().setLevel(log_level)
+    detector = YOLODetector(model_path, **detector_options)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        sequence, index, timestamp, frame = job
+        current[:] = (sequence, index, timestamp)
+        try:
+            results.put((sequence, index, timestamp, detector.detect_in_seats(frame, seat_positions), None))
+        except Exception as e:
+            results.put((sequence, index, timestamp, None, str(e)))
+        current[0] = -1
+    results.put((None, worker_id))
+
+
+class CsvTimelineWriter:
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(TIMELINE_COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetTimelineWriter:
+    """Buffers rows and writes one Parquet row group per row_group_size rows"""
+
+    def __init__(self, path, row_group_size=50000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ('timestamp_s', pa.float64()), ('frame_index', pa.int64()), ('seat_id', pa.string()),
+            ('gesture_type', pa.string()), ('raw_gesture_type', pa.string()), ('confidence', pa.float32()),
+            ('face_detected', pa.bool_()), ('body_detected', pa.bool_()),
+            ('bbox_x', pa.int32()), ('bbox_y', pa.int32()), ('bbox_width', pa.int32()), ('bbox_height', pa.int32())
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._rows = []
+        self.row_group_size = row_group_size
+
+    def write(self, rows):
+        self._rows.extend(rows)
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            columns = list(zip(*self._rows))
+            self._writer.write_table(self._pa.Table.from_arrays(
+                [self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+                schema=self._schema
+            ))
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_timeline_writer(path, output_format=None):
+    output_format = output_format or ('parquet' if path.endswith('.parquet') else 'csv')
+    if output_format == 'parquet':
+        return ParquetTimelineWriter(path)
+    return CsvTimelineWriter(path)
+
+
+def timeline_rows(timestamp, index, detections):
+    for d in detections:
+        bbox = d.get('bbox') or {}
+        yield (
+            round(timestamp, 3), index, d['seat_id'], d['gesture_type'],
+            d.get('raw_gesture_type', d['gesture_type']), round(float(d['confidence']), 4),
+            bool(d['face_detected']), bool(d['body_detected']),
+            bbox.get('x'), bbox.get('y'), bbox.get('width'), bbox.get('height')
+        )
+
+
+def analyze_video(video_path, model_path, seat_positions, writer, stride=1, start=0.0, end=None,
+                  workers=1, queue_size=8, detector_options=None, smoothing=True, log_level=logging.WARNING):
+    """
+    Run the detector over a video and write the seat timeline
+    Returns (frames processed, frames failed); a frame held by a worker
+    process that dies counts as failed, and RuntimeError is raised when
+    every worker is gone before the video is finished
+    """
+    from seat_state import SeatTracker
+
+    detector_options = dict(detector_options or {})
+    tracker = SeatTracker() if smoothing else None
+    frames = iter_frames(video_path, stride, start, end)
+    processed = failed = 0
+
+    def emit(index, timestamp, detections):
+        if tracker is not None:
+            detections = [tracker.smooth(d, True) for d in detections]
+        writer.write(list(timeline_rows(timestamp, index, detections)))
+
+    if workers <= 0:
+        from detector import YOLODetector
+
+        detector = YOLODetector(model_path, **detector_options)
+        for index, timestamp, frame in frames:
+            emit(index, timestamp, detector.detect_in_seats(frame, seat_positions))
+            processed += 1
+        return processed, failed
+
+    # spawn keeps the workers free of the parent's logging and scheduler threads
+    context = multiprocessing.get_context('spawn')
+    jobs = context.Queue(maxsize=queue_size)
+    results = context.Queue(maxsize=queue_size + workers)
+    current = [context.Array('d', (-1, -1, 0), lock=False) for _ in range(workers)]
+    pool = [
+        context.Process(
+            target=_detect_worker,
+            args=(i, model_path, detector_options, seat_positions, jobs, results, current[i], log_level),
+            name=f'detect-worker-{i}', daemon=True
+        )
+        for i in range(workers)
+    ]
+    for process in pool:
+        process.start()
+
+    def produce():
+        try:
+            for sequence, (index, timestamp, frame) in enumerate(frames):
+                jobs.put((sequence, index, timestamp, frame))
+        except Exception as e:
+            logger.error(f"Video decoding stopped: {e}")
+        finally:
+            for _ in pool:
+                jobs.put(None)
+
+    producer = threading.Thread(target=produce, name='video-decoder', daemon=True)
+    producer.start()
+
+    # Workers finish out of order; a small heap restores frame order for the
+    # tracker and writer. It holds at most the frames in flight behind the oldest one.
+    pending = []
+    next_sequence = 0
+    running = set(range(len(pool)))
+    lost = 0
+    started = time.perf_counter()
+    checked = time.monotonic()
+    while running:
+        try:
+            item = results.get(timeout=1.0)
+        except queue.Empty:
+            item = None
+        if item is not None and item[0] is None:
+            running.discard(item[1])
+        elif item is not None:
+            heapq.heappush(pending, item)
+
+        if item is None or time.monotonic() - checked >= 1.0:
+            # A dead worker never sends its sentinel; fail the frame it held so the heap can move on
+            checked = time.monotonic()
+            for worker_id in sorted(running):
+                process = pool[worker_id]
+                if process.is_alive():
+                    continue
+                running.discard(worker_id)
+                lost += 1
+                logger.error(f"{process.name} exited with code {process.exitcode}")
+                sequence, index, timestamp = current[worker_id][:]
+                sequence = int(sequence)
+                if sequence >= next_sequence and all(entry[0] != sequence for entry in pending):
+                    heapq.heappush(pending, (sequence, int(index), timestamp, None, f'{process.name} exited'))
+
+        # Once every worker is done nothing else can arrive, so gaps left by lost frames are skipped
+        while pending and (pending[0][0] == next_sequence or not running):
+            sequence, index, timestamp, detections, error = heapq.heappop(pending)
+            next_sequence = sequence + 1
+            if error is not None:
+                logger.warning(f"Frame {index} failed: {error}")
+                failed += 1
+                continue
+            emit(index, timestamp, detections)
+            processed += 1
+            if processed % 100 == 0:
+                rate = processed / (time.perf_counter() - started)
+                logger.info(f"{processed} frames ({timestamp:.1f} s of video, {rate:.1f} frames/s)")
+
+    if lost == len(pool):
+        # The decoder may be blocked on the full job queue; do not wait for it
+        jobs.cancel_join_thread()
+        raise RuntimeError(f'All {lost} detector workers exited after {processed + failed} frames')
+
+    producer.join()
+    for process in pool:
+        process.join()
+    return processed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a per-seat gesture timeline for a lecture video')
+    parser.add_argument('video')
+    parser.add_argument('--model', required=True, help='.pt/.onnx model path (anything else uses the mock model)')
+    parser.add_argument('--seats', required=True, help='seat layout JSON file')
+    parser.add_argument('--output', required=True, help='.csv or .parquet timeline')
+    parser.add_argument('--format', choices=('csv', 'parquet'), help='override the format implied by --output')
+    parser.add_argument('--stride', type=int, default=None, help='analyze every Nth frame')
+    parser.add_argument('--every', type=float, default=1.0, help='seconds between analyzed frames (if no --stride)')
+    parser.add_argument('--start', type=float, default=0.0, help='start offset in seconds')
+    parser.add_argument('--end', type=float, default=None, help='stop at this timestamp in seconds (measured from the start of the video, not from --start)')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help='detector processes (0 runs inline)')
+    parser.add_argument('--queue-size', type=int, default=8, help='decoded frames buffered ahead of the workers')
+    parser.add_argument('--inference-mode', default='whole_frame', choices=('per_seat', 'whole_frame', 'batched_roi', 'tiled'))
+    parser.add_argument('--confidence', type=float, default=0.5)
+    parser.add_argument('--iou', type=float, default=0.4)
+    parser.add_argument('--input-size', type=int, default=640)
+    parser.add_argument('--tile-size', type=int, default=None, help='tiled mode: tile side in pixels (default: input size)')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help='tiled mode: overlap between neighbouring tiles')
+    parser.add_argument('--no-smoothing', action='store_true', help='write raw per-frame gestures')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    stride = args.stride
+    if stride is None:
+        capture = cv2.VideoCapture(args.video)
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        capture.release()
+        stride = max(1, int(round(args.every * fps)))
+
+    # Split the cores between worker processes instead of oversubscribing them
+    threads = max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    detector_options = {
+        'confidence_threshold': args.confidence,
+        'iou_threshold': args.iou,
+        'inference_mode': args.inference_mode,
+        'input_size': args.input_size,
+        'tile_size': args.tile_size,
+        'tile_overlap': args.tile_overlap,
+        'intra_op_threads': threads,
+        'inter_op_threads': 1
+    }
+
+    seat_positions = load_seat_layout(args.seats)
+    try:
+        writer = open_timeline_writer(args.output, args.format)
+    except ImportError:
+        parser.error('Parquet output needs pyarrow (pip install pyarrow)')
+    started = time.perf_counter()
+    try:
+        processed, failed = analyze_video(
+            args.video, args.model, seat_positions, writer,
+            stride=stride, start=args.start, end=args.end, workers=args.workers,
+            queue_size=args.queue_size, detector_options=detector_options,
+            smoothing=not args.no_smoothing,
+            log_level=logging.INFO if args.verbose else logging.WARNING
+        )
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Wrote {args.output}: {processed} frames, {failed} failed, "
+                f"{len(seat_positions)} seats, {elapsed:.1f} s ({processed / max(elapsed, 1e-9):.1f} frames/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,410 +1,253 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import cv2
 import numpy as np
 import base64
-import torch
 import json
 import os
+import time
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 import sys
 
+from admission import AdmissionGate
+from detections import DetectionBatch
+from detector import INFERENCE_MODES, YOLODetector, seat_layouts, stage_latency
+from focus_history import FocusHistoryStore
+from inference_pool import InferencePool
+from inference_scheduler import InferenceScheduler
+from metrics import Counter, Gauge, MetricsRegistry, restart_queue_logging, session_context, setup_queue_logging
+from model_cache import QUANTIZATION_MODES
+from model_registry import ModelRegistry, ModelNotLoadedError
+from seat_state import SeatGateStore
+from stream_sessions import CameraCapture, StreamSessionManager
+
+
 app = Flask(__name__)
 CORS(app)
 
-# Configure logging
-logging.basicConfig(
+# Configure logging; records are handed to a queue so request threads never
+# wait on disk, and per-frame INFO lines are sampled per session.
+# LOG_FILE='' logs to stdout only; the file is created on the first record.
+log_handlers = [logging.StreamHandler(sys.stdout)]
+if os.environ.get('LOG_FILE', 'flask_server.log'):
+    log_handlers.insert(0, logging.FileHandler(os.environ.get('LOG_FILE', 'flask_server.log'), delay=True))
+log_listener = setup_queue_logging(
+    log_handlers,
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('flask_server.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
+    sample_every=int(os.environ.get('LOG_SAMPLE_EVERY', 100))
 )
 logger = logging.getLogger(__name__)
 
-# Global variables for model
-current_model = None
-model_config = {}
-
-class YOLODetector:
-    def __init__(self, model_path, confidence_threshold=0.5, iou_threshold=0.4):
-        self.model_path = model_path
-        self.confidence_threshold = confidence_threshold
-        self.iou_threshold = iou_threshold
-        self.model = None
-        self.model_type = 'unknown'
-        self.load_model()
-    
-    def load_model(self):
-        try:
-            logger.info(f"Loading model from {self.model_path}")
-            
-            # Check if model file exists
-            if not os.path.exists(self.model_path):
-                raise FileNotFoundError(f"Model file not found: {self.model_path}")
-            
-            # Get file size for logging
-            file_size = os.path.getsize(self.model_path) / (1024 * 1024)  # MB
-            logger.info(f"Model file size: {file_size:.2f} MB")
-            
-            # Try to load the model based on file extension
-            if self.model_path.endswith('.pt'):
-                self.model_type = 'pytorch'
-                self._load_pytorch_model()
-            elif self.model_path.endswith('.onnx'):
-                self.model_type = 'onnx'
-                self._load_onnx_model()
-            elif self.model_path.endswith('.pb'):
-                self.model_type = 'tensorflow'
-                self._load_tensorflow_model()
-            else:
-                logger.warning(f"Unknown model format: {self.model_path}")
-                self._use_mock_model()
-                
-        except Exception as e:
-            logger.error(f"Error loading model: {str(e)}")
-            self._use_mock_model()
-    
-    def _load_pytorch_model(self):
-        """Load PyTorch model (.pt file)"""
-        try:
-            # Try loading with ultralytics YOLOv8 first
-            try:
-                from ultralytics import YOLO
-                self.model = YOLO(self.model_path)
-                logger.info("Model loaded successfully with ultralytics YOLO")
-                return
-            except ImportError:
-                logger.info("Ultralytics not available, trying torch.hub")
-            except Exception as e:
-                logger.warning(f"Ultralytics loading failed: {e}")
-            
-            # Try loading with torch.hub (YOLOv5)
-            try:
-                self.model = torch.hub.load('ultralytics/yolov5', 'custom', path=self.model_path, force_reload=True)
-                logger.info("Model loaded successfully with torch.hub YOLOv5")
-                return
-            except Exception as e:
-                logger.warning(f"Torch.hub loading failed: {e}")
-            
-            # Try loading as raw PyTorch model
-            try:
-                self.model = torch.load(self.model_path, map_location='cpu')
-                logger.info("Model loaded as raw PyTorch model")
-                return
-            except Exception as e:
-                logger.warning(f"Raw PyTorch loading failed: {e}")
-            
-            # If all methods fail, use mock model
-            raise Exception("All PyTorch loading methods failed")
-            
-        except Exception as e:
-            logger.error(f"PyTorch model loading failed: {e}")
-            self._use_mock_model()
-    
-    def _load_onnx_model(self):
-        """Load ONNX model (.onnx file)"""
-        try:
-            import onnxruntime as ort
-            self.model = ort.InferenceSession(self.model_path)
-            logger.info("ONNX model loaded successfully")
-        except ImportError:
-            logger.error("ONNX Runtime not installed")
-            self._use_mock_model()
-        except Exception as e:
-            logger.error(f"ONNX model loading failed: {e}")
-            self._use_mock_model()
-    
-    def _load_tensorflow_model(self):
-        """Load TensorFlow model (.pb file)"""
-        try:
-            import tensorflow as tf
-            self.model = tf.saved_model.load(self.model_path)
-            logger.info("TensorFlow model loaded successfully")
-        except ImportError:
-            logger.error("TensorFlow not installed")
-            self._use_mock_model()
-        except Exception as e:
-            logger.error(f"TensorFlow model loading failed: {e}")
-            self._use_mock_model()
-    
-    def _use_mock_model(self):
-        """Use mock model for demonstration"""
-        self.model = "mock_model"
-        self.model_type = 'mock'
-        logger.info("Using mock model for demonstration")
-    
-    def detect_in_seats(self, frame, seat_positions):
-        """
-        Detect faces/heads within seat bounding boxes
-        Returns detection results for each seat
-        """
-        detections = []
-        
-        logger.info(f"Processing {len(seat_positions)} seats with {self.model_type} model")
-        
-        for seat in seat_positions:
-            seat_id = seat['seat_id']
-            x, y, w, h = seat['x'], seat['y'], seat['width'], seat['height']
-            
-            # Validate seat coordinates
-            if x < 0 or y < 0 or w <= 0 or h <= 0:
-                detections.append(self.create_empty_detection(seat_id))
-                continue
-            
-            # Extract ROI (Region of Interest) for this seat
-            try:
-                roi = frame[int(y):int(y+h), int(x):int(x+w)]
-                
-                if roi.size == 0:
-                    detections.append(self.create_empty_detection(seat_id))
-                    continue
-                
-                # Perform detection
-                if self.model == "mock_model":
-                    detection_result = self.simulate_detection(roi, seat_id)
-                else:
-                    detection_result = self.real_detection(roi, seat_id)
-                
-                detections.append(detection_result)
-                
-            except Exception as e:
-                logger.error(f"Error processing seat {seat_id}: {e}")
-                detections.append(self.create_empty_detection(seat_id))
-        
-        return detections
+# Prometheus metrics served on /metrics
+metrics = MetricsRegistry()
+metrics.register(stage_latency.histogram)
+seat_detections_total = metrics.register(Counter(
+    'detector_seat_detections_total', 'Seat detections by whether inference ran (fresh) or was reused',
+    ('model_type', 'result')
+))
+decode_fallbacks_total = metrics.register(Counter(
+    'detector_decode_fallbacks_total', 'Frames replaced by the dummy frame', ('reason',)
+))
+
+# Open streaming channels, one per session_id
+stream_sessions = StreamSessionManager()
+
+# Per-session seat change gates used to skip inference on static seats
+seat_gates = SeatGateStore()
+
+# Per-session focus/occupancy history with 1 s, 10 s and 1 min rollups
+focus_history = FocusHistoryStore(max_sessions=int(os.environ.get('FOCUS_HISTORY_MAX_SESSIONS', 256)))
+
+# Micro-batching of concurrent frames, used only for detectors whose mode shares
+# forward passes (see YOLODetector.batches_frames); disabled with INFERENCE_BATCH_MAX_SIZE=1
+inference_scheduler = None
+if int(os.environ.get('INFERENCE_BATCH_MAX_SIZE', 8)) > 1:
+    inference_scheduler = InferenceScheduler(
+        max_batch_size=int(os.environ.get('INFERENCE_BATCH_MAX_SIZE', 8)),
+        max_wait_ms=float(os.environ.get('INFERENCE_BATCH_MAX_WAIT_MS', 10))
+    )
+
+# Model replicas in worker processes fed through shared memory; off with INFERENCE_POOL_WORKERS=0.
+# The pool replaces the in-process micro-batching scheduler when enabled.
+inference_pool = None
+if int(os.environ.get('INFERENCE_POOL_WORKERS', 0)) > 0:
+    inference_pool = InferencePool(
+        workers=int(os.environ.get('INFERENCE_POOL_WORKERS')),
+        slots_per_worker=int(os.environ.get('INFERENCE_POOL_SLOTS_PER_WORKER', 2)),
+        slot_bytes=int(float(os.environ.get('INFERENCE_POOL_SLOT_MB', 6)) * 1024 * 1024),
+        job_timeout=float(os.environ.get('INFERENCE_POOL_JOB_TIMEOUT', 30)),
+        load_timeout=float(os.environ.get('INFERENCE_POOL_LOAD_TIMEOUT', 300))
+    )
+
+# Bounded admission for /api/detect-frame (503 when full); off unless DETECT_MAX_CONCURRENT is set
+admission_gate = None
+if int(os.environ.get('DETECT_MAX_CONCURRENT', 0)) > 0:
+    admission_gate = AdmissionGate(
+        int(os.environ.get('DETECT_MAX_CONCURRENT')),
+        max_queued=int(os.environ.get('DETECT_MAX_QUEUED', 0)),
+        queue_timeout=float(os.environ.get('DETECT_QUEUE_TIMEOUT', 1.0))
+    )
+requests_rejected_total = metrics.register(Counter(
+    'detector_requests_rejected_total', 'Detection requests turned away by admission control', ('reason',)
+))
+
+# Parallel JPEG decoding of the camera frames in /api/detect-bundle
+bundle_decoder = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BUNDLE_DECODE_THREADS', 4)), thread_name_prefix='bundle-decode'
+)
+
+DECODE_REDUCTION_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+def image_dimensions(buffer):
+    """
+    Read (width, height) from a JPEG or PNG header without decoding pixels
+    Returns None for unrecognised data
+    """
+    view = memoryview(buffer)
+    if view[:8] == b'\x89PNG\r\n\x1a\n' and len(view) >= 24:
+        return int.from_bytes(view[16:20], 'big'), int.from_bytes(view[20:24], 'big')
     
-    def real_detection(self, roi, seat_id):
-        """
-        Perform real YOLO detection on the ROI
-        """
-        try:
-            logger.debug(f"Running real detection for seat {seat_id}")
-            
-            # Run inference based on model type
-            if self.model_type == 'pytorch':
-                return self._pytorch_inference(roi, seat_id)
-            elif self.model_type == 'onnx':
-                return self._onnx_inference(roi, seat_id)
-            elif self.model_type == 'tensorflow':
-                return self._tensorflow_inference(roi, seat_id)
-            else:
-                return self.simulate_detection(roi, seat_id)
-                
-        except Exception as e:
-            logger.error(f"Error in real detection for seat {seat_id}: {str(e)}")
-            return self.simulate_detection(roi, seat_id)
+    if view[:2] != b'\xff\xd8':
+        return None
     
-    def _pytorch_inference(self, roi, seat_id):
-        """PyTorch model inference"""
+    # Walk JPEG segments until a start-of-frame marker
+    offset = 2
+    while offset + 9 < len(view):
+        if view[offset] != 0xFF:
+            return None
+        marker = view[offset + 1]
+        length = int.from_bytes(view[offset + 2:offset + 4], 'big')
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(view[offset + 5:offset + 7], 'big')
+            width = int.from_bytes(view[offset + 7:offset + 9], 'big')
+            return width, height
+        offset += 2 + length
+    return None
+
+def choose_decode_reduction(buffer, input_size):
+    """Largest JPEG reduction that still leaves the frame at least input_size wide"""
+    dimensions = image_dimensions(buffer)
+    if dimensions is None or bytes(buffer[:2]) != b'\xff\xd8':
+        return 1
+    longest = max(dimensions)
+    for factor in (8, 4, 2):
+        if longest // factor >= input_size:
+            return factor
+    return 1
+
+def decode_image_bytes(buffer, reduction=1):
+    """Decode encoded image bytes through a zero-copy numpy view"""
+    nparr = np.frombuffer(buffer, dtype=np.uint8)
+    frame = cv2.imdecode(nparr, DECODE_REDUCTION_FLAGS.get(reduction, cv2.IMREAD_COLOR))
+    if frame is None:
+        raise ValueError("Failed to decode image")
+    return frame
+
+def scale_seat_positions(seat_positions, factor):
+    """Shrink seat coordinates to match a frame decoded at 1/factor resolution"""
+    return [
+        dict(seat, x=seat['x'] / factor, y=seat['y'] / factor,
+             width=seat['width'] / factor, height=seat['height'] / factor)
+        for seat in seat_positions
+    ]
+
+def scale_detection_bboxes(detections, factor):
+    """Map seat-relative bboxes from a reduced frame back to camera pixels"""
+    for detection in detections:
+        bbox = detection.get('bbox')
+        if bbox:
+            detection['bbox'] = {key: int(value * factor) for key, value in bbox.items()}
+    return detections
+
+# Loaded detectors keyed by model path and options, shared by all sessions
+model_registry = ModelRegistry(
+    YOLODetector, memory_budget_mb=float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 2048))
+)
+# Sessions whose focus history is dropped no longer keep a model binding
+focus_history.on_drop = model_registry.unbind_session
+
+metrics.register(Gauge('detector_models_loaded', 'Detectors held by the model registry', lambda: len(model_registry)))
+metrics.register(Gauge(
+    'detector_scheduler_queue_depth', 'Frames waiting for the micro-batching scheduler',
+    lambda: inference_scheduler.queue_depth() if inference_scheduler else 0
+))
+metrics.register(Gauge(
+    'detector_pool_in_flight', 'Frames handed to inference worker processes and not yet returned',
+    lambda: inference_pool.in_flight() if inference_pool else 0
+))
+metrics.register(Gauge('detector_stream_sessions', 'Open streaming sessions', lambda: len(stream_sessions)))
+
+def admission_limited(view):
+    """Reject the request with 503 when the admission gate is full or draining"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if admission_gate is None:
+            return view(*args, **kwargs)
+        reason = admission_gate.acquire()
+        if reason is not None:
+            requests_rejected_total.inc(reason=reason)
+            response = jsonify({
+                'success': False,
+                'message': 'Server is draining' if reason == 'draining' else 'Server is overloaded, retry later'
+            })
+            response.headers['Retry-After'] = '1'
+            return response, 503
         try:
-            # Run inference
-            results = self.model(roi)
-            
-            # Process results based on model type
-            if hasattr(results, 'pandas'):
-                # YOLOv5 format
-                return self._process_yolov5_results(results, seat_id)
-            elif hasattr(results, 'boxes'):
-                # YOLOv8 format
-                return self._process_yolov8_results(results, seat_id)
-            else:
-                # Raw PyTorch model
-                return self._process_raw_pytorch_results(results, seat_id)
-                
-        except Exception as e:
-            logger.error(f"PyTorch inference error: {e}")
-            return self.simulate_detection(roi, seat_id)
-    
-    def _process_yolov5_results(self, results, seat_id):
-        """Process YOLOv5 results"""
-        detections = results.pandas().xyxy[0]
-        
-        if len(detections) > 0:
-            # Get highest confidence detection
-            best_detection = detections.loc[detections['confidence'].idxmax()]
-            confidence = float(best_detection['confidence'])
-            
-            # Determine detection type based on class
-            class_name = str(best_detection['name']).lower()
-            gesture_type = self.classify_gesture_from_class(class_name, confidence)
-            
-            bbox = {
-                'x': int(best_detection['xmin']),
-                'y': int(best_detection['ymin']),
-                'width': int(best_detection['xmax'] - best_detection['xmin']),
-                'height': int(best_detection['ymax'] - best_detection['ymin'])
-            }
-            
-            return {
-                'seat_id': seat_id,
-                'face_detected': 'face' in class_name or 'head' in class_name or 'person' in class_name,
-                'body_detected': True,
-                'gesture_type': gesture_type,
-                'confidence': confidence,
-                'bbox': bbox
-            }
-        
-        return self.create_empty_detection(seat_id)
-    
-    def _process_yolov8_results(self, results, seat_id):
-        """Process YOLOv8 results"""
-        if results.boxes is not None and len(results.boxes) > 0:
-            # Get highest confidence detection
-            confidences = results.boxes.conf.cpu().numpy()
-            best_idx = np.argmax(confidences)
-            confidence = float(confidences[best_idx])
-            
-            # Get class
-            classes = results.boxes.cls.cpu().numpy()
-            class_id = int(classes[best_idx])
-            
-            # Map class ID to gesture (this depends on your model's classes)
-            gesture_type = self.classify_gesture_from_class_id(class_id, confidence)
-            
-            # Get bbox
-            boxes = results.boxes.xyxy.cpu().numpy()
-            box = boxes[best_idx]
-            bbox = {
-                'x': int(box[0]),
-                'y': int(box[1]),
-                'width': int(box[2] - box[0]),
-                'height': int(box[3] - box[1])
-            }
-            
-            return {
-                'seat_id': seat_id,
-                'face_detected': True,
-                'body_detected': True,
-                'gesture_type': gesture_type,
-                'confidence': confidence,
-                'bbox': bbox
-            }
-        
-        return self.create_empty_detection(seat_id)
-    
-    def _onnx_inference(self, roi, seat_id):
-        """ONNX model inference"""
-        # Implement ONNX inference logic here
-        return self.simulate_detection(roi, seat_id)
-    
-    def _tensorflow_inference(self, roi, seat_id):
-        """TensorFlow model inference"""
-        # Implement TensorFlow inference logic here
-        return self.simulate_detection(roi, seat_id)
-    
-    def classify_gesture_from_class(self, class_name, confidence):
-        """Classify gesture based on class name"""
-        class_name = class_name.lower()
-        
-        if 'focused' in class_name or 'attention' in class_name:
-            return 'focused'
-        elif 'sleep' in class_name or 'drowsy' in class_name:
-            return 'sleeping'
-        elif 'phone' in class_name or 'mobile' in class_name:
-            return 'using_phone'
-        elif 'talk' in class_name or 'chat' in class_name:
-            return 'chatting'
-        elif 'write' in class_name or 'writing' in class_name:
-            return 'writing'
-        elif 'yawn' in class_name:
-            return 'yawning'
-        elif 'away' in class_name or 'distract' in class_name:
-            return 'looking_away'
-        elif 'face' in class_name or 'head' in class_name or 'person' in class_name:
-            # Default classification based on confidence
-            return self.classify_gesture_from_confidence(confidence)
-        else:
-            return 'unknown'
-    
-    def classify_gesture_from_class_id(self, class_id, confidence):
-        """Classify gesture based on class ID"""
-        # This mapping depends on your specific model
-        # Adjust according to your model's class definitions
-        gesture_map = {
-            0: 'focused',
-            1: 'looking_away',
-            2: 'sleeping',
-            3: 'using_phone',
-            4: 'chatting',
-            5: 'writing',
-            6: 'yawning'
-        }
-        
-        return gesture_map.get(class_id, self.classify_gesture_from_confidence(confidence))
-    
-    def classify_gesture_from_confidence(self, confidence):
-        """Classify gesture based on confidence level"""
-        if confidence > 0.8:
-            return 'focused'
-        elif confidence > 0.6:
-            gestures = ['focused', 'looking_away', 'writing']
-            return np.random.choice(gestures)
-        else:
-            return 'looking_away'
-    
-    def simulate_detection(self, roi, seat_id):
-        """
-        Simulate YOLO detection results for demonstration
-        """
-        import random
-        
-        # Simulate detection probabilities with realistic distribution
-        face_detected = random.random() > 0.25  # 75% chance of face detection
-        
-        if face_detected:
-            # Simulate gesture detection with realistic probabilities
-            gestures = ['focused', 'looking_away', 'sleeping', 'using_phone', 'chatting', 'writing', 'yawning']
-            # Focused is most likely, followed by looking_away
-            gesture_weights = [0.45, 0.25, 0.08, 0.08, 0.06, 0.06, 0.02]
-            gesture_type = random.choices(gestures, weights=gesture_weights)[0]
-            confidence = random.uniform(0.65, 0.95)
-        else:
-            gesture_type = 'absent'
-            confidence = 0.0
-        
-        return {
-            'seat_id': seat_id,
-            'face_detected': face_detected,
-            'body_detected': face_detected,
-            'gesture_type': gesture_type,
-            'confidence': confidence,
-            'bbox': {
-                'x': random.randint(0, 50),
-                'y': random.randint(0, 50),
-                'width': random.randint(30, 80),
-                'height': random.randint(40, 100)
-            } if face_detected else None
-        }
-    
-    def create_empty_detection(self, seat_id):
-        """Create empty detection result"""
-        return {
-            'seat_id': seat_id,
-            'face_detected': False,
-            'body_detected': False,
-            'gesture_type': 'absent',
-            'confidence': 0.0,
-            'bbox': None
-        }
+            return view(*args, **kwargs)
+        finally:
+            admission_gate.release()
+    return wrapper
+
+def after_fork():
+    """
+    Re-create per-process state in a worker forked from a process that
+    imported the app and preloaded models (see serve.py)
+    Threads do not survive fork: the log listener is restarted and ONNX
+    sessions, whose thread pools belong to the parent, are reopened.
+    """
+    restart_queue_logging(log_listener)
+    for detector in model_registry.detectors():
+        detector.after_fork()
+
+def shutdown(timeout=None):
+    """
+    Graceful stop of a serving process (see serve.py): new detections get a
+    503 'draining', admitted ones get up to timeout seconds to finish, then
+    stream sessions are closed so their SSE responses end
+    Returns True if no admitted detection was left running.
+    """
+    drained = True
+    if admission_gate is not None:
+        admission_gate.close()
+        drained = admission_gate.drain(timeout)
+    stream_sessions.close_all()
+    return drained
 
 @app.route('/api/initialize-model', methods=['POST'])
 def initialize_model():
-    global current_model, model_config
-    
     try:
         data = request.get_json()
         model_path = data.get('model_path')
         model_type = data.get('model_type', 'pytorch')
         confidence_threshold = data.get('confidence_threshold', 0.5)
         iou_threshold = data.get('iou_threshold', 0.4)
+        inference_mode = data.get('inference_mode', 'per_seat')
+        session_id = data.get('session_id')
         
         logger.info(f"Initializing model: {model_path}")
         logger.info(f"Model type: {model_type}")
         logger.info(f"Confidence threshold: {confidence_threshold}")
         logger.info(f"IoU threshold: {iou_threshold}")
+        logger.info(f"Inference mode: {inference_mode}")
         
         # Validate model path
         if not model_path:
@@ -419,29 +262,157 @@ def initialize_model():
                 'message': f'Model file not found: {model_path}'
             }), 400
         
-        # Initialize YOLO detector
-        current_model = YOLODetector(
-            model_path=model_path,
-            confidence_threshold=confidence_threshold,
-            iou_threshold=iou_threshold
-        )
+        if inference_mode not in INFERENCE_MODES:
+            return jsonify({
+                'success': False,
+                'message': f'Invalid inference mode: {inference_mode} (expected one of {", ".join(INFERENCE_MODES)})'
+            }), 400
         
-        model_config = {
+        quantization = data.get('quantization') or None
+        if quantization not in (None, 'none') + QUANTIZATION_MODES:
+            return jsonify({
+                'success': False,
+                'message': f'Invalid quantization: {quantization} (expected one of none, {", ".join(QUANTIZATION_MODES)})'
+            }), 400
+        if quantization == 'none':
+            quantization = None
+        
+        tile_size = int(data['tile_size']) if data.get('tile_size') else None
+        tile_overlap = float(data.get('tile_overlap', 0.2))
+        if (tile_size is not None and tile_size < 32) or not 0 <= tile_overlap < 0.9:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid tiling: tile_size must be at least 32 pixels and tile_overlap a fraction in [0, 0.9)'
+            }), 400
+        try:
+            decode_reduction = parse_decode_reduction(data.get('decode_reduction', 1)) or 1
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        if quantization == 'static' and not os.path.isdir(data.get('calibration_dir') or ''):
+            return jsonify({
+                'success': False,
+                'message': 'Static quantization needs an existing calibration_dir'
+            }), 400
+        
+        options = {
+            'confidence_threshold': confidence_threshold,
+            'iou_threshold': iou_threshold,
+            'inference_mode': inference_mode,
+            'input_size': int(data.get('input_size', 640)),
+            'max_batch_size': int(data.get('max_batch_size', 16)),
+            'intra_op_threads': int(data.get('intra_op_threads', 0)),
+            'inter_op_threads': int(data.get('inter_op_threads', 0)),
+            'graph_optimization': data.get('graph_optimization', 'all'),
+            'decode_reduction': decode_reduction,
+            'change_threshold': float(data.get('change_threshold', 0.02)),
+            'max_staleness': int(data.get('max_staleness', 10)),
+            'temporal_smoothing': bool(data.get('temporal_smoothing', True)),
+            'artifact_cache': bool(data.get('artifact_cache', True)),
+            'warmup_runs': int(data.get('warmup_runs', 1)),
+            'quantization': quantization,
+            'calibration_dir': data.get('calibration_dir'),
+            'calibration_samples': int(data.get('calibration_samples', 100)),
+            'simulation_seed': data.get('simulation_seed'),
+            'tile_size': tile_size,
+            'tile_overlap': tile_overlap
+        }
+        
+        config = {
             'model_path': model_path,
-            'model_type': current_model.model_type,
             'confidence_threshold': confidence_threshold,
             'iou_threshold': iou_threshold,
             'status': 'active',
             'initialized_at': datetime.now().isoformat()
         }
         
-        logger.info("Model initialized successfully")
+        def activate(handle):
+            entry = model_registry.get(handle)
+            detector = entry.detector
+            entry.config.update({
+                'model_type': detector.model_type,
+                'inference_mode': detector.inference_mode,
+                'input_size': detector.input_size,
+                'max_batch_size': detector.max_batch_size,
+                'decode_reduction': detector.decode_reduction,
+                'change_threshold': detector.change_threshold,
+                'max_staleness': detector.max_staleness,
+                'temporal_smoothing': detector.temporal_smoothing,
+                'artifact_path': detector.artifact_path,
+                'quantization': detector.quantization or 'none',
+                'quantized_path': detector.quantized_path,
+                'tile_size': detector.tile_size,
+                'tile_overlap': detector.tile_overlap,
+                'load_time_ms': round(detector.load_seconds * 1000, 1),
+                'warmup_time_ms': round(detector.warmup_seconds * 1000, 1)
+            })
+            
+            # Swapping the handle is atomic; requests holding the old detector finish on it.
+            # A session_id binds the model to that session only; otherwise it becomes the default
+            if session_id is not None:
+                model_registry.bind_session(session_id, handle)
+            else:
+                model_registry.set_default(handle)
+            logger.info(f"Model {handle} active ({detector.model_type})")
+            return entry
+        
+        # Already loaded with these options: swap it in right away
+        handle = model_registry.make_handle(model_path, options)
+        if model_registry.get(handle) is not None:
+            entry = activate(handle)
+            return jsonify({
+                'success': True,
+                'status': 'active',
+                'message': f'Model initialized successfully ({entry.detector.model_type})',
+                'model_handle': handle,
+                'config': entry.config
+            })
+        
+        # Load and warm up in the background; the current model keeps serving meanwhile.
+        # The response waits for the load unless the caller opts in with async=true and
+        # polls /api/model-status?job_id=... instead
+        job = model_registry.load_async(model_path, options, config=config, on_ready=activate)
+        if not data.get('async') or data.get('wait'):
+            wait_timeout = float(data.get('wait_timeout', 60))
+            job.wait(wait_timeout)
+            entry = model_registry.get(job.handle)
+            if job.pending:
+                # Still loading in the background; it becomes active once ready
+                return jsonify({
+                    'success': False,
+                    'status': job.status,
+                    'job_id': job.job_id,
+                    'model_handle': job.handle,
+                    'message': f'Model is still loading after {wait_timeout:g} s; poll /api/model-status?job_id={job.job_id}'
+                }), 504
+            if job.status != 'ready' or entry is None:
+                return jsonify({
+                    'success': False,
+                    'status': job.status,
+                    'job_id': job.job_id,
+                    'message': f'Failed to initialize model: {job.error or job.status}'
+                }), 500
+            return jsonify({
+                'success': True,
+                'status': 'active',
+                'message': f'Model initialized successfully ({entry.detector.model_type})',
+                'job_id': job.job_id,
+                'model_handle': job.handle,
+                'config': entry.config
+            })
+        
+        logger.info(f"Model load {job.job_id} started ({job.handle})")
         return jsonify({
             'success': True,
-            'message': f'Model initialized successfully ({current_model.model_type})',
-            'config': model_config
-        })
-        
+            'status': 'loading',
+            'message': 'Model loading started',
+            'job_id': job.job_id,
+            'model_handle': job.handle
+        }), 202
+    
     except Exception as e:
         logger.error(f"Error initializing model: {str(e)}")
         return jsonify({
@@ -450,115 +421,263 @@ def initialize_model():
         }), 500
 
 @app.route('/api/detect-frame', methods=['POST'])
+@admission_limited
 def detect_frame():
-    global current_model
-    
+    started = time.perf_counter()
     try:
-        if current_model is None:
-            return jsonify({
-                'success': False,
-                'message': 'Model not initialized'
-            }), 400
+        frame_data = None
+        img_data = None
+        reduction = None
         
-        data = request.get_json()
-        frame_data = data.get('frame_data')
-        seat_positions = data.get('seat_positions', [])
-        session_id = data.get('session_id')
+        if request.mimetype in ('application/octet-stream', 'multipart/form-data', 'image/jpeg', 'image/png'):
+            # Binary upload: image bytes in the body, layout in a side channel
+            if request.mimetype == 'multipart/form-data':
+                upload = request.files.get('frame')
+                img_data = upload.read() if upload else b''
+                side_channel = request.form
+            else:
+                img_data = request.get_data(cache=False)
+                side_channel = request.args
+            
+            seat_positions = side_channel.get('seat_positions') or request.headers.get('X-Seat-Positions') or '[]'
+            try:
+                seat_positions = json.loads(seat_positions)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': f'Invalid seat_positions JSON: {e}'
+                }), 400
+            session_id = side_channel.get('session_id') or request.headers.get('X-Session-Id')
+            model_handle = side_channel.get('model_handle') or request.headers.get('X-Model-Handle')
+            try:
+                reduction = parse_decode_reduction(
+                    side_channel.get('decode_reduction') or request.headers.get('X-Decode-Reduction')
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+            response_format = side_channel.get('format') or request.headers.get('X-Response-Format')
+        else:
+            data = request.get_json()
+            frame_data = data.get('frame_data')
+            seat_positions = data.get('seat_positions', [])
+            session_id = data.get('session_id')
+            model_handle = data.get('model_handle')
+            response_format = data.get('format')
         
         logger.debug(f"Processing frame for session {session_id} with {len(seat_positions)} seats")
+        parsed = time.perf_counter()
         
-        # Decode base64 frame data
-        frame = None
-        if frame_data:
-            try:
-                # Remove data URL prefix if present
-                if ',' in frame_data:
-                    frame_data = frame_data.split(',')[1]
-                
-                # Decode base64 to image
-                img_data = base64.b64decode(frame_data)
-                nparr = np.frombuffer(img_data, np.uint8)
-                frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                if frame is None:
-                    raise ValueError("Failed to decode image")
-                    
-                logger.debug(f"Frame decoded successfully: {frame.shape}")
-                    
-            except Exception as e:
-                logger.warning(f"Error decoding frame: {str(e)}, using dummy frame")
-                frame = np.zeros((480, 640, 3), dtype=np.uint8)
-        else:
-            # For simulation, create a dummy frame
-            frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            logger.debug("Using dummy frame")
+        handle = model_registry.resolve(model_handle, session_id)
+        with model_registry.acquire(handle) as detector, session_context(session_id, detector.model_type):
+            stage_latency.observe('parse', parsed - started)
+            decode_started = time.perf_counter()
+            frame, reduction = decode_frame(detector, img_data, frame_data, reduction)
+            stage_latency.observe('decode', time.perf_counter() - decode_started)
+            
+            # Perform detection within seat bounding boxes
+            detections = run_detection(detector, frame, seat_positions, reduction, session_id)
+            
+            with stage_latency.time('serialize'):
+                response = jsonify(build_frame_result(
+                    detections, seat_positions, session_id, columnar=response_format == 'columnar'
+                ))
+            stage_latency.observe('total', time.perf_counter() - started)
         
-        # Perform detection within seat bounding boxes
-        detections = current_model.detect_in_seats(frame, seat_positions)
+        return response
+    
+    except ModelNotLoadedError:
+        if model_registry.loading():
+            return jsonify({
+                'success': False,
+                'message': 'Model is loading'
+            }), 503
+        return jsonify({
+            'success': False,
+            'message': 'Model not initialized'
+        }), 400
+    
+    except Exception as e:
+        logger.error(f"Error processing frame: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Failed to process frame: {str(e)}'
+        }), 500
+
+@app.route('/api/detect-bundle', methods=['POST'])
+@admission_limited
+def detect_bundle():
+    """
+    Detect one hall seen by several cameras in a single request
+    frames is a list of {camera_id, frame_data} and every seat in
+    seat_positions names the camera_id it is visible from; a seat listed for
+    several cameras keeps the view with the highest confidence. Frames are
+    decoded in parallel and inferred in one batched pass.
+    """
+    started = time.perf_counter()
+    try:
+        data = request.get_json()
+        cameras = data.get('frames') or []
+        seat_positions = data.get('seat_positions', [])
+        session_id = data.get('session_id')
+        model_handle = data.get('model_handle')
+        response_format = data.get('format')
         
-        # Calculate summary statistics
-        total_seats = len(seat_positions)
-        occupied_seats = sum(1 for d in detections if d['face_detected'])
-        focused_count = sum(1 for d in detections if d['gesture_type'] == 'focused')
+        camera_ids = [camera.get('camera_id') for camera in cameras]
+        if not cameras or None in camera_ids or len(set(camera_ids)) != len(camera_ids):
+            return jsonify({
+                'success': False,
+                'message': 'frames must be a non-empty list of {camera_id, frame_data} with unique camera ids'
+            }), 400
         
-        # Analyze gestures
-        gesture_analysis = analyze_gestures(detections)
+        seats_by_camera = {camera_id: [] for camera_id in camera_ids}
+        for seat in seat_positions:
+            if seat.get('camera_id') not in seats_by_camera:
+                return jsonify({
+                    'success': False,
+                    'message': f"Seat {seat.get('seat_id')} refers to unknown camera {seat.get('camera_id')}"
+                }), 400
+            seats_by_camera[seat['camera_id']].append(seat)
         
-        summary = {
-            'total_seats': total_seats,
-            'occupied_seats': occupied_seats,
-            'focused_count': focused_count,
-            'focus_percentage': (focused_count / total_seats * 100) if total_seats > 0 else 0,
-            'timestamp': datetime.now().isoformat()
-        }
+        try:
+            reductions = [parse_decode_reduction(camera.get('decode_reduction')) for camera in cameras]
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': f'{e} in frames'
+            }), 400
         
-        logger.debug(f"Detection summary: {summary}")
+        parsed = time.perf_counter()
+        handle = model_registry.resolve(model_handle, session_id)
+        with model_registry.acquire(handle) as detector, session_context(session_id, detector.model_type):
+            stage_latency.observe('parse', parsed - started)
+            
+            # cv2.imdecode releases the GIL, so camera frames decode concurrently
+            with stage_latency.time('decode'):
+                decoded = list(bundle_decoder.map(
+                    lambda camera, reduction: decode_frame(
+                        detector, frame_data=camera.get('frame_data'), reduction=reduction
+                    ),
+                    cameras, reductions
+                ))
+            
+            views = [
+                (frame, seats_by_camera[camera_id], reduction)
+                for camera_id, (frame, reduction) in zip(camera_ids, decoded)
+            ]
+            # Each camera has its own change gate; its seat crops differ from the other cameras'
+            gate_keys = [None if session_id is None else f'{session_id}/{camera_id}' for camera_id in camera_ids]
+            detections = merge_camera_detections(
+                camera_ids, run_view_detection(detector, views, session_id, gate_keys)
+            )
+            
+            with stage_latency.time('serialize'):
+                result = build_frame_result(detections, detections, session_id, columnar=response_format == 'columnar')
+                result['cameras'] = [
+                    {
+                        'camera_id': camera_id,
+                        'frame_shape': list(frame.shape[:2]),
+                        'seats': len(seats_by_camera[camera_id]),
+                        'selected_seats': sum(1 for d in detections if d['camera_id'] == camera_id)
+                    }
+                    for camera_id, (frame, _) in zip(camera_ids, decoded)
+                ]
+                response = jsonify(result)
+            stage_latency.observe('total', time.perf_counter() - started)
         
+        return response
+    
+    except ModelNotLoadedError:
+        if model_registry.loading():
+            return jsonify({
+                'success': False,
+                'message': 'Model is loading'
+            }), 503
         return jsonify({
-            'success': True,
-            'detections': detections,
-            'summary': summary,
-            'gesture_analysis': gesture_analysis,
-            'session_id': session_id
-        })
-        
+            'success': False,
+            'message': 'Model not initialized'
+        }), 400
+    
     except Exception as e:
-        logger.error(f"Error processing frame: {str(e)}")
+        logger.error(f"Error processing frame bundle: {str(e)}")
         return jsonify({
             'success': False,
-            'message': f'Failed to process frame: {str(e)}'
+            'message': f'Failed to process frame bundle: {str(e)}'
         }), 500
 
 @app.route('/api/model-status', methods=['GET'])
 def get_model_status():
-    global model_config
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = model_registry.job(job_id)
+        if job is None:
+            return jsonify({
+                'status': 'unknown',
+                'message': f'Unknown load job: {job_id}'
+            }), 404
+        entry = model_registry.get(job.handle) if job.status == 'ready' else None
+        return jsonify({
+            'status': 'active' if entry else job.status,
+            'job': job.stats(),
+            'config': entry.config if entry else None
+        })
     
-    if current_model is None:
+    handle = model_registry.resolve(request.args.get('model_handle'), request.args.get('session_id'))
+    entry = model_registry.get(handle)
+    
+    scheduler_stats = inference_scheduler.stats() if inference_scheduler else {'enabled': False}
+    pool_stats = inference_pool.stats() if inference_pool else {'enabled': False}
+    
+    if entry is None:
+        loading = model_registry.loading()
         return jsonify({
-            'status': 'inactive',
-            'message': 'No model loaded'
+            'status': 'loading' if loading else 'inactive',
+            'message': 'Model is loading' if loading else 'No model loaded',
+            'registry': model_registry.stats(),
+            'scheduler': scheduler_stats,
+            'inference_pool': pool_stats,
+            'change_gate': seat_gates.stats(),
+            'seat_layouts': seat_layouts.stats(),
+            'focus_history': focus_history.stats()
         })
     
     return jsonify({
         'status': 'active',
-        'config': model_config,
-        'message': f'Model is running ({current_model.model_type})'
+        'config': entry.config,
+        'message': f'Model is running ({entry.detector.model_type})',
+        'registry': model_registry.stats(),
+        'scheduler': scheduler_stats,
+        'inference_pool': pool_stats,
+        'change_gate': seat_gates.stats(),
+        'seat_layouts': seat_layouts.stats(),
+        'focus_history': focus_history.stats()
     })
 
 @app.route('/api/stop-model', methods=['POST'])
 def stop_model():
-    global current_model, model_config
-    
     try:
-        current_model = None
-        model_config = {}
+        data = request.get_json(silent=True) or {}
+        model_handle = data.get('model_handle')
+        session_id = data.get('session_id')
+        
+        # In-flight detections keep their own detector reference until they finish.
+        # A session_id alone releases that session's binding; it falls back to the default model
+        if session_id is not None:
+            model_registry.unbind_session(session_id)
+        if model_handle:
+            model_registry.remove(model_handle)
+        elif session_id is None:
+            model_registry.clear()
+            seat_gates.clear()
         
         logger.info("Model stopped successfully")
         return jsonify({
             'success': True,
             'message': 'Model stopped successfully'
         })
-        
+    
     except Exception as e:
         logger.error(f"Error stopping model: {str(e)}")
         return jsonify({
@@ -566,38 +685,415 @@ def stop_model():
             'message': f'Failed to stop model: {str(e)}'
         }), 500
 
-def analyze_gestures(detections):
-    """Analyze gesture distribution from detections"""
-    gesture_counts = {}
+def infer_seats(detector, frame, seat_positions):
+    """Run the model on the given seats, through the worker pool or micro-batching scheduler when enabled"""
+    if not seat_positions:
+        return []
+    if inference_pool is not None:
+        return inference_pool.detect(detector, frame, seat_positions)
+    if inference_scheduler is not None and detector.batches_frames:
+        return inference_scheduler.detect(detector, frame, seat_positions)
+    return detector.detect_in_seats(frame, seat_positions)
+
+def infer_views(detector, items):
+    """
+    Run the model on several (frame, seat_positions) views at once: one
+    detect_batch pass in process, or one worker pool job per view
+    """
+    if len(items) == 1:
+        return [infer_seats(detector, *items[0])]
     
-    for detection in detections:
-        gesture = detection['gesture_type']
-        if gesture in gesture_counts:
-            gesture_counts[gesture] += 1
-        else:
-            gesture_counts[gesture] = 1
+    results = [[] for _ in items]
+    indices = [i for i, (_, seat_positions) in enumerate(items) if seat_positions]
+    if inference_pool is not None:
+        futures = [inference_pool.submit(detector, *items[i]) for i in indices]
+        for i, future in zip(indices, futures):
+            results[i] = inference_pool.result(future)
+    elif indices:
+        for i, detections in zip(indices, detector.detect_batch([items[i] for i in indices])):
+            results[i] = detections
+    return results
+
+def run_detection(detector, frame, seat_positions, reduction=1, session_id=None):
+    """
+    Run detection on a frame decoded at 1/reduction resolution
+    With a session_id, seats that have not changed since their last inference
+    reuse the previous detection (every result is marked fresh or reused) and
+    gestures are smoothed over time by the session's seat tracker
+    """
+    return run_view_detection(detector, [(frame, seat_positions, reduction)], session_id, [session_id])[0]
+
+def run_view_detection(detector, views, session_id=None, gate_keys=None):
+    """
+    run_detection for several (frame, seat_positions, reduction) views, such
+    as the cameras of one hall, inferred together
+    gate_keys names each view's seat change gate (None: no gating)
+    """
+    gate_keys = gate_keys or [None] * len(views)
+    scaled = [
+        (frame, scale_seat_positions(seat_positions, reduction) if reduction > 1 else seat_positions)
+        for frame, seat_positions, reduction in views
+    ]
+    
+    with session_context(session_id, detector.model_type):
+        results = _run_gated_detection(detector, scaled, gate_keys)
+    
+    for (_, _, reduction), detections in zip(views, results):
+        fresh_count = sum(1 for detection in detections if detection['fresh'])
+        seat_detections_total.inc(fresh_count, model_type=detector.model_type, result='fresh')
+        seat_detections_total.inc(len(detections) - fresh_count, model_type=detector.model_type, result='reused')
+        if reduction > 1:
+            scale_detection_bboxes(detections, reduction)
+    return results
+
+def _run_gated_detection(detector, views, gate_keys):
+    gates = [
+        None if key is None else seat_gates.get(key, detector.change_threshold, detector.max_staleness)
+        for key in gate_keys
+    ]
+    with contextlib.ExitStack() as locks:
+        # Gate locks are taken in key order so concurrent bundles cannot deadlock
+        for key, gate in sorted({key: gate for key, gate in zip(gate_keys, gates) if gate}.items()):
+            locks.enter_context(gate.lock)
+        
+        plans = []
+        for (frame, seat_positions), gate in zip(views, gates):
+            if gate is None:
+                plans.append((range(len(seat_positions)), {}, None))
+                continue
+            # Start over when the model or camera resolution changes
+            if gate.owner != id(detector) or gate.frame_shape != frame.shape:
+                gate.reset(id(detector), frame.shape)
+            plans.append(gate.plan(frame, seat_positions))
+        
+        fresh_views = infer_views(detector, [
+            (frame, [seat_positions[idx] for idx in infer])
+            for (frame, seat_positions), (infer, _, _) in zip(views, plans)
+        ])
+        
+        results = []
+        for (frame, seat_positions), gate, (infer, reused, signatures), fresh in zip(views, gates, plans, fresh_views):
+            for detection in fresh:
+                detection['fresh'] = True
+            if gate is None:
+                results.append(fresh)
+                continue
+            gate.commit(seat_positions, infer, signatures, fresh)
+            
+            detections = [None] * len(seat_positions)
+            for idx, detection in zip(infer, fresh):
+                detections[idx] = detection
+            for idx, detection in reused.items():
+                detections[idx] = detection
+            
+            if detector.temporal_smoothing:
+                with stage_latency.time('postprocess'):
+                    detections = gate.smooth(detections)
+            results.append(detections)
     
-    total_detections = len(detections)
+    return results
+
+def merge_camera_detections(camera_ids, view_detections):
+    """
+    One detection per seat across cameras: where cameras overlap, the view
+    with the highest confidence wins. Each result is tagged with its camera_id.
+    """
+    best = {}
+    for camera_id, detections in zip(camera_ids, view_detections):
+        for detection in detections:
+            detection['camera_id'] = camera_id
+            current = best.get(detection['seat_id'])
+            if current is None or detection['confidence'] > current['confidence']:
+                best[detection['seat_id']] = detection
+    return list(best.values())
+
+def build_frame_result(detections, seat_positions, session_id, columnar=False):
+    """
+    Summarise per-seat detections into the /api/detect-frame response body
+    With columnar=True detections are returned as parallel arrays
+    (DetectionBatch.to_columns) instead of one dict per seat
+    Frames with a session_id are also added to that session's focus history
+    """
+    batch = DetectionBatch.from_dicts(detections, with_boxes=columnar)
+    
+    summary = batch.summary(len(seat_positions))
+    if session_id is not None:
+        focus_history.record(session_id, summary, batch.gesture_counts())
+    summary['timestamp'] = datetime.now().isoformat()
+    
+    logger.debug(f"Detection summary: {summary}")
+    
+    result = {
+        'success': True,
+        'summary': summary,
+        'gesture_analysis': batch.gesture_analysis(),
+        'session_id': session_id
+    }
+    if columnar:
+        result['format'] = 'columnar'
+        result['columns'] = batch.to_columns()
+    else:
+        result['detections'] = detections
+    return result
+
+def decode_frame(detector, img_data=None, frame_data=None, reduction=None):
+    """
+    Decode raw image bytes or a base64 data URL; undecodable or missing
+    frames become a black frame. Raw bytes use the requested or configured
+    JPEG reduction, base64 frames only an explicitly requested one.
+    Returns (frame, reduction)
+    """
+    try:
+        if not img_data and frame_data:
+            # Remove data URL prefix if present
+            if ',' in frame_data:
+                frame_data = frame_data.split(',')[1]
+            img_data = base64.b64decode(frame_data)
+            reduction = reduction or 1
+        
+        if img_data:
+            reduction = resolve_decode_reduction(detector, img_data, reduction)
+            frame = decode_image_bytes(img_data, reduction)
+            logger.debug(f"Frame decoded successfully: {frame.shape} (1/{reduction})")
+            return frame, reduction
+    except Exception as e:
+        logger.warning(f"Error decoding frame: {str(e)}, using dummy frame")
+        decode_fallbacks_total.inc(reason='decode_error')
+        return np.zeros((480, 640, 3), dtype=np.uint8), 1
+    
+    # For simulation, create a dummy frame
+    decode_fallbacks_total.inc(reason='no_frame')
+    logger.debug("Using dummy frame")
+    return np.zeros((480, 640, 3), dtype=np.uint8), 1
+
+def parse_decode_reduction(value):
+    """
+    Validate a decode_reduction setting: 1, 2, 4, 8 (ints or numeric
+    strings) or 'auto'; None and '' mean unset. Raises ValueError otherwise
+    """
+    if value is None or value == '':
+        return None
+    if value == 'auto':
+        return value
+    if not isinstance(value, bool) and str(value).strip() in ('1', '2', '4', '8'):
+        return int(value)
+    raise ValueError(f"Invalid decode_reduction: {value!r} (expected one of 1, 2, 4, 8, auto)")
+
+def resolve_decode_reduction(detector, img_data, requested=None):
+    """Pick the JPEG decode reduction for a frame from the request or detector config"""
+    reduction = requested or detector.decode_reduction
+    if reduction == 'auto':
+        # Tiles exist to keep full resolution
+        reduction = 1 if detector.inference_mode == 'tiled' else choose_decode_reduction(img_data, detector.input_size)
+    return int(reduction) if int(reduction) in DECODE_REDUCTION_FLAGS else 1
+
+def process_stream_frame(img_data, seat_positions, session_id):
+    """
+    Decode and detect one frame taken from a stream session's latest-frame slot
+    Frames from a server-side CameraCapture arrive already decoded
+    """
+    handle = model_registry.resolve(session_id=session_id)
+    try:
+        with model_registry.acquire(handle) as detector:
+            if isinstance(img_data, np.ndarray):
+                frame, reduction = img_data, 1
+            else:
+                started = time.perf_counter()
+                reduction = resolve_decode_reduction(detector, img_data)
+                frame = decode_image_bytes(img_data, reduction)
+                stage_latency.observe('decode', time.perf_counter() - started, detector.model_type, session_id)
+            detections = run_detection(detector, frame, seat_positions, reduction, session_id)
+    except ModelNotLoadedError:
+        return {
+            'success': False,
+            'message': 'Model not initialized',
+            'session_id': session_id
+        }
     
-    analysis = []
-    for gesture, count in gesture_counts.items():
-        analysis.append({
-            'gesture_type': gesture,
-            'count': count,
-            'percentage': (count / total_detections * 100) if total_detections > 0 else 0
+    return build_frame_result(detections, seat_positions, session_id)
+
+@app.route('/api/stream/<session_id>/open', methods=['POST'])
+def open_stream(session_id):
+    """
+    Open (or update) a stream session
+    Frames are pushed by the client to /frame, or with source (an RTSP/HTTP
+    URL, camera index or video file) read by the server itself. inference_fps
+    caps how often the latest frame is run through the model.
+    """
+    try:
+        data = request.get_json() or {}
+        seat_positions = data.get('seat_positions', [])
+        source = data.get('source')
+        inference_fps = data.get('inference_fps')
+        interval = 1.0 / float(inference_fps) if inference_fps else None
+        
+        existed = stream_sessions.get(session_id) is not None
+        session = stream_sessions.open(session_id, seat_positions, process_stream_frame, interval=interval)
+        if source is not None:
+            try:
+                session.attach_capture(CameraCapture(source, loop=bool(data.get('loop', False))))
+            except IOError as e:
+                if not existed:
+                    stream_sessions.close(session_id)
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+        logger.info(f"Stream session {session_id} opened with {len(seat_positions)} seats"
+                    + (f" reading {source}" if source is not None else ""))
+        
+        return jsonify({
+            'success': True,
+            'message': 'Stream session opened',
+            'session': session.stats()
         })
+        
+    except Exception as e:
+        logger.error(f"Error opening stream session: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Failed to open stream session: {str(e)}'
+        }), 500
+
+@app.route('/api/stream/<session_id>/frame', methods=['POST'])
+def push_stream_frame(session_id):
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return jsonify({
+            'success': False,
+            'message': f'Stream session not open: {session_id}'
+        }), 404
+    
+    if request.mimetype == 'application/json':
+        frame_data = (request.get_json() or {}).get('frame_data') or ''
+        if ',' in frame_data:
+            frame_data = frame_data.split(',')[1]
+        img_data = base64.b64decode(frame_data)
+    elif request.mimetype == 'multipart/form-data':
+        upload = request.files.get('frame')
+        img_data = upload.read() if upload else b''
+    else:
+        img_data = request.get_data(cache=False)
     
-    return analysis
+    if not img_data:
+        return jsonify({
+            'success': False,
+            'message': 'Frame body is empty'
+        }), 400
+    
+    # Decoding happens on the session worker, so dropped frames are never decoded
+    session.submit(img_data)
+    return jsonify({
+        'success': True,
+        'frames_received': session.slot.received,
+        'frames_dropped': session.slot.dropped
+    }), 202
+
+@app.route('/api/stream/<session_id>/results', methods=['GET'])
+def stream_results(session_id):
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return jsonify({
+            'success': False,
+            'message': f'Stream session not open: {session_id}'
+        }), 404
+    
+    after_sequence = request.args.get('since', 0, type=int)
+    
+    def events():
+        sequence = after_sequence
+        while session.running:
+            result = session.wait_for_result(sequence, timeout=15)
+            if result is None:
+                # Keep-alive comment so proxies do not close an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            sequence = result['sequence']
+            yield f"id: {sequence}\ndata: {json.dumps(result)}\n\n"
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/stream/<session_id>/latest', methods=['GET'])
+def latest_stream_result(session_id):
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return jsonify({
+            'success': False,
+            'message': f'Stream session not open: {session_id}'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'result': session.latest(),
+        'session': session.stats()
+    })
+
+@app.route('/api/stream/<session_id>/close', methods=['POST'])
+def close_stream(session_id):
+    closed = stream_sessions.close(session_id)
+    seat_gates.drop(session_id)
+    model_registry.unbind_session(session_id)
+    stage_latency.forget(session_id)
+    logger.info(f"Stream session {session_id} closed")
+    return jsonify({
+        'success': closed,
+        'message': 'Stream session closed' if closed else f'Stream session not open: {session_id}'
+    })
+
+def analyze_gestures(detections):
+    """Analyze gesture distribution from detections"""
+    return DetectionBatch.from_dicts(detections, with_boxes=False).gesture_analysis()
 
 @app.route('/health', methods=['GET'])
 def health_check():
+    entry = model_registry.get(model_registry.default_handle)
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'model_loaded': current_model is not None,
-        'model_type': current_model.model_type if current_model else None
+        'model_loaded': entry is not None,
+        'model_type': entry.detector.model_type if entry else None,
+        'models_loaded': len(model_registry),
+        'admission': admission_gate.stats() if admission_gate else {'enabled': False}
     })
 
+@app.route('/api/sessions/<session_id>/focus-history', methods=['GET'])
+def get_focus_history(session_id):
+    series = focus_history.get(session_id)
+    if series is None:
+        return jsonify({
+            'success': False,
+            'message': f'No focus history for session: {session_id}'
+        }), 404
+    
+    try:
+        points, resolution = series.query(
+            start=request.args.get('start', type=float),
+            end=request.args.get('end', type=float),
+            resolution=request.args.get('resolution', type=int),
+            max_points=request.args.get('max_points', 500, type=int)
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'resolution_s': resolution,
+        'frames_recorded': series.frames,
+        'points': points
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
@@ -611,8 +1107,14 @@ if __name__ == '__main__':
     logger.info("Available endpoints:")
     logger.info("  POST /api/initialize-model")
     logger.info("  POST /api/detect-frame")
+    logger.info("  POST /api/detect-bundle")
     logger.info("  GET  /api/model-status")
+    logger.info("  POST /api/stream/<session_id>/open|frame|close")
+    logger.info("  GET  /api/stream/<session_id>/results|latest")
     logger.info("  POST /api/stop-model")
+    logger.info("  GET  /api/sessions/<session_id>/focus-history")
+    logger.info("  GET  /metrics")
     logger.info("  GET  /health")
     
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    # Development server only; serve.py is the production entry point
+    app.run(host='0.0.0.0', port=5001, debug=os.environ.get('FLASK_DEBUG') == '1')
\ No newline at end of file
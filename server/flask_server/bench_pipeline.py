@@ -0,0 +1,244 @@
+"""
+Micro-benchmarks for the detect-frame pipeline stages
+
+Runs offline on CPU: synthetic classroom frames are generated for each
+resolution and seat layout, and every stage (base64 decode, JPEG decode,
+ROI cropping, inference, gesture analysis, JSON serialization) is timed
+separately. Results are written as JSON so runs can be compared.
+
+    python bench_pipeline.py --output bench.json
+    python bench_pipeline.py --resolutions 1280x720 --seats 40,200 --models mock,onnx
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from detector import YOLODetector
+
+DEFAULT_RESOLUTIONS = '640x480,1280x720,1920x1080'
+DEFAULT_SEATS = '10,50,100,200'
+
+
+def synthetic_frame(width, height, seat_positions, rng):
+    """Noisy background with a head-and-shoulders blob drawn in most seats"""
+    frame = rng.integers(60, 120, size=(height, width, 3), dtype=np.uint8)
+    for seat in seat_positions:
+        if rng.random() < 0.2:
+            continue
+        cx = int(seat['x'] + seat['width'] / 2)
+        cy = int(seat['y'] + seat['height'] / 2)
+        color = tuple(int(c) for c in rng.integers(100, 255, size=3))
+        cv2.ellipse(frame, (cx, cy - seat['height'] // 6), (max(seat['width'] // 5, 1), max(seat['height'] // 5, 1)),
+                    0, 0, 360, color, -1)
+        cv2.rectangle(frame, (cx - seat['width'] // 3, cy), (cx + seat['width'] // 3, int(seat['y'] + seat['height'])),
+                      color, -1)
+    return frame
+
+
+def seat_grid(width, height, num_seats):
+    """Lay num_seats out as a near-square grid covering the frame"""
+    cols = int(np.ceil(np.sqrt(num_seats * width / height)))
+    rows = int(np.ceil(num_seats / cols))
+    seat_w, seat_h = width // cols, height // rows
+    return [
+        {
+            'seat_id': f'seat_{i}',
+            'x': (i % cols) * seat_w,
+            'y': (i // cols) * seat_h,
+            'width': seat_w,
+            'height': seat_h
+        }
+        for i in range(num_seats)
+    ]
+
+
+def time_stage(fn, repeat, warmup):
+    """Run fn warmup + repeat times and return latency statistics in ms"""
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(repeat, dtype=np.float64)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples[i] = (time.perf_counter() - start) * 1000
+    return {
+        'runs': repeat,
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'min_ms': float(samples.min()),
+        'max_ms': float(samples.max())
+    }
+
+
+def export_tiny_models(directory, input_size=320, num_classes=7):
+    """
+    Export a tiny YOLO-shaped network (output: 1 x (4 + classes) x anchors)
+    to ONNX. Returns (onnx path, torch module) or (None, None) without torch.
+    """
+    try:
+        import torch
+        from torch import nn
+    except ImportError:
+        return None, None
+
+    class TinyYOLO(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.features = nn.Sequential(
+                nn.Conv2d(3, 8, 3, stride=2, padding=1), nn.SiLU(),
+                nn.Conv2d(8, 16, 3, stride=2, padding=1), nn.SiLU(),
+                nn.Conv2d(16, 32, 3, stride=2, padding=1), nn.SiLU(),
+                nn.Conv2d(32, 32, 3, stride=4, padding=1), nn.SiLU()
+            )
+            self.head = nn.Conv2d(32, 4 + num_classes, 1)
+
+        def forward(self, x):
+            out = self.head(self.features(x))
+            boxes = out[:, :4].sigmoid() * x.shape[-1]
+            scores = out[:, 4:].sigmoid()
+            return torch.cat([boxes, scores], 1).flatten(2)
+
+    torch.manual_seed(0)
+    model = TinyYOLO().eval()
+    path = os.path.join(directory, 'tiny_yolo.onnx')
+    dummy = torch.zeros(1, 3, input_size, input_size)
+    try:
+        # Newer torch defaults to the dynamo exporter, which needs onnxscript
+        torch.onnx.export(model, dummy, path, input_names=['images'], output_names=['output0'], dynamo=False)
+    except TypeError:
+        torch.onnx.export(model, dummy, path, input_names=['images'], output_names=['output0'])
+    return path, model
+
+
+def run_benchmarks(resolutions, seat_counts, models, repeat, warmup, seed):
+    # Imported here so tools reusing the helpers above (load_replay --url) do not start the app
+    from app import analyze_gestures, build_frame_result
+
+    rng = np.random.default_rng(seed)
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        detectors = {}
+        torch_model = None
+        # Crops go through the detector's compiled seat layouts and reused letterbox batches
+        cropper = YOLODetector('mock.model')
+        if 'mock' in models:
+            detectors['mock'] = YOLODetector('mock.model')
+        if 'onnx' in models or 'torch' in models:
+            onnx_path, torch_model = export_tiny_models(directory)
+            if onnx_path is None:
+                print("torch not installed, skipping tiny ONNX/PyTorch models", file=sys.stderr)
+            elif 'onnx' in models:
+                for mode in ('per_seat', 'whole_frame', 'batched_roi', 'tiled'):
+                    detector = YOLODetector(onnx_path, confidence_threshold=0.25, inference_mode=mode)
+                    if detector.model_type == 'onnx':
+                        detectors[f'onnx_{mode}'] = detector
+
+        for width, height in resolutions:
+            for num_seats in seat_counts:
+                seats = seat_grid(width, height, num_seats)
+                frame = synthetic_frame(width, height, seats, rng)
+                jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+                frame_data = 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')
+                case = {'resolution': f'{width}x{height}', 'seats': num_seats, 'jpeg_bytes': len(jpeg)}
+
+                def record(stage, model, stats):
+                    results.append({**case, 'stage': stage, 'model': model, **stats})
+
+                record('base64_decode', None, time_stage(
+                    lambda: base64.b64decode(frame_data.split(',')[1]), repeat, warmup))
+                record('imdecode', None, time_stage(
+                    lambda: cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR), repeat, warmup))
+                record('roi_crop', None, time_stage(lambda: cropper.crop_rois(frame, seats), repeat, warmup))
+
+                detections = None
+                for name, detector in detectors.items():
+                    record('inference', name, time_stage(
+                        lambda: detector.detect_in_seats(frame, seats), repeat, warmup))
+                    detections = detector.detect_in_seats(frame, seats)
+
+                if torch_model is not None:
+                    import torch
+                    # Raw forward pass over one batch of seat crops, without pre/postprocessing
+                    batch = torch.zeros(min(num_seats, 16), 3, 320, 320)
+                    with torch.inference_mode():
+                        record('inference', f'torch_tiny_batch{len(batch)}', time_stage(
+                            lambda: torch_model(batch), repeat, warmup))
+
+                if detections is None:
+                    detections = YOLODetector('mock.model').detect_in_seats(frame, seats)
+                record('analyze_gestures', None, time_stage(lambda: analyze_gestures(detections), repeat, warmup))
+                body = build_frame_result(detections, seats, 'bench')
+                record('json_serialize', None, time_stage(lambda: json.dumps(body), repeat, warmup))
+
+    return results
+
+
+def parse_resolutions(value):
+    return [tuple(int(v) for v in item.lower().split('x')) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark detect-frame pipeline stages')
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS, help='comma-separated WxH list')
+    parser.add_argument('--seats', default=DEFAULT_SEATS, help='comma-separated seat counts')
+    parser.add_argument('--models', default='mock,onnx,torch', help='mock, onnx and/or torch')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    # Log to the console only; app.py writes flask_server.log unless LOG_FILE is empty
+    os.environ.setdefault('LOG_FILE', '')
+    from app import log_listener
+
+    # Keep stdout clean for the JSON report; app.py logs to stdout by default
+    for handler in log_listener.handlers:
+        if isinstance(handler, logging.StreamHandler) and getattr(handler, 'stream', None) is sys.stdout:
+            handler.setStream(sys.stderr)
+
+    results = run_benchmarks(
+        parse_resolutions(args.resolutions),
+        [int(s) for s in args.seats.split(',') if s],
+        set(args.models.split(',')),
+        args.repeat, args.warmup, args.seed
+    )
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Accept or reject an INT8 model against its FP32 original
+
+Quantizes the model (dynamic and/or static, calibrated on a folder of
+classroom frames), runs FP32 and INT8 detectors over a held-out folder of
+frames and reports per-seat gesture agreement, presence agreement,
+confidence drift and latency. A candidate is accepted when it meets all of
+--min-agreement, --max-drift and --min-speedup; the exit code is 1 if any
+candidate is rejected.
+
+    python compare_quantized.py models/best.onnx --holdout frames/holdout --calibration frames/calib
+    python compare_quantized.py models/best.pt --holdout frames/holdout --modes dynamic --seats layout.json --output q.json
+
+Calibration and held-out frames should come from different recordings.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Log to the console only; app.py writes flask_server.log unless LOG_FILE is empty
+os.environ.setdefault('LOG_FILE', '')
+
+from analyze_video import load_seat_layout
+from app import YOLODetector, log_listener
+from bench_pipeline import seat_grid
+from model_cache import QUANTIZATION_MODES, list_images
+
+
+def run_detector(detector, frames, seat_positions, repeat=1):
+    """Per-frame detections and per-frame latency (best of repeat runs) in ms"""
+    outputs, latencies = [], []
+    for frame in frames:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            detections = detector.detect_in_seats(frame, seat_positions)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        outputs.append(detections)
+        latencies.append(best)
+    return outputs, np.array(latencies)
+
+
+def latency_stats(samples):
+    return {
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95))
+    }
+
+
+def compare_detections(reference, candidate):
+    """Agreement and confidence drift between two runs over the same frames and seats"""
+    pairs = [(r, c) for ref_frame, cand_frame in zip(reference, candidate) for r, c in zip(ref_frame, cand_frame)]
+    gestures = np.array([r['gesture_type'] == c['gesture_type'] for r, c in pairs], dtype=bool)
+    presence = np.array([r['face_detected'] == c['face_detected'] for r, c in pairs], dtype=bool)
+    # Drift only means something where both models saw someone
+    drift = np.array([
+        abs(r['confidence'] - c['confidence']) for r, c in pairs if r['face_detected'] and c['face_detected']
+    ], dtype=np.float64)
+    return {
+        'seat_frames': len(pairs),
+        'gesture_agreement': float(gestures.mean()) if len(pairs) else 1.0,
+        'presence_agreement': float(presence.mean()) if len(pairs) else 1.0,
+        'compared_detections': len(drift),
+        'confidence_drift_mean': float(drift.mean()) if len(drift) else 0.0,
+        'confidence_drift_p95': float(np.percentile(drift, 95)) if len(drift) else 0.0,
+        'confidence_drift_max': float(drift.max()) if len(drift) else 0.0
+    }
+
+
+def evaluate(model_path, frames, seat_positions, modes, detector_options, calibration_dir=None,
+             calibration_samples=100, repeat=1, min_agreement=0.95, max_drift=0.05, min_speedup=1.2):
+    reference = YOLODetector(model_path, **detector_options)
+    if reference.model_type != 'onnx':
+        raise RuntimeError(f"FP32 model loaded as {reference.model_type}; quantization needs ONNX")
+    reference_out, reference_latency = run_detector(reference, frames, seat_positions, repeat)
+
+    report = {
+        'model_path': model_path,
+        'frames': len(frames),
+        'seats': len(seat_positions),
+        'fp32': {'path': reference.artifact_path or model_path, **latency_stats(reference_latency)},
+        'candidates': []
+    }
+    for mode in modes:
+        detector = YOLODetector(
+            model_path, quantization=mode, calibration_dir=calibration_dir,
+            calibration_samples=calibration_samples, **detector_options
+        )
+        candidate = {'mode': mode, 'path': detector.quantized_path}
+        if detector.quantization != mode:
+            candidate.update(accepted=False, reasons=['quantization failed'])
+            report['candidates'].append(candidate)
+            continue
+
+        output, latency = run_detector(detector, frames, seat_positions, repeat)
+        candidate.update(latency_stats(latency))
+        candidate['speedup'] = float(reference_latency.mean() / latency.mean())
+        candidate.update(compare_detections(reference_out, output))
+
+        reasons = []
+        if candidate['gesture_agreement'] < min_agreement:
+            reasons.append(f"gesture agreement {candidate['gesture_agreement']:.3f} < {min_agreement}")
+        if candidate['confidence_drift_p95'] > max_drift:
+            reasons.append(f"p95 confidence drift {candidate['confidence_drift_p95']:.3f} > {max_drift}")
+        if candidate['speedup'] < min_speedup:
+            reasons.append(f"speedup {candidate['speedup']:.2f}x < {min_speedup}x")
+        candidate.update(accepted=not reasons, reasons=reasons)
+        report['candidates'].append(candidate)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare INT8 quantized and FP32 detectors on held-out frames')
+    parser.add_argument('model', help='.onnx model or .pt checkpoint (exported to ONNX first)')
+    parser.add_argument('--holdout', required=True, help='folder of held-out classroom frames')
+    parser.add_argument('--calibration', help='folder of calibration frames (needed for static)')
+    parser.add_argument('--modes', default=None, help='comma-separated: dynamic, static')
+    parser.add_argument('--seats', help='seat layout JSON file (default: a grid over the frame)')
+    parser.add_argument('--grid', type=int, default=20, help='seats in the default grid')
+    parser.add_argument('--samples', type=int, default=200, help='held-out frames to use')
+    parser.add_argument('--calibration-samples', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=1, help='timed runs per frame (best is kept)')
+    parser.add_argument('--inference-mode', default='whole_frame', choices=('per_seat', 'whole_frame', 'batched_roi', 'tiled'))
+    parser.add_argument('--confidence', type=float, default=0.5)
+    parser.add_argument('--iou', type=float, default=0.4)
+    parser.add_argument('--input-size', type=int, default=640)
+    parser.add_argument('--min-agreement', type=float, default=0.95)
+    parser.add_argument('--max-drift', type=float, default=0.05, help='max p95 absolute confidence drift')
+    parser.add_argument('--min-speedup', type=float, default=1.2)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    # Keep stdout clean for the JSON report; app.py logs to stdout by default
+    for handler in log_listener.handlers:
+        if isinstance(handler, logging.StreamHandler) and getattr(handler, 'stream', None) is sys.stdout:
+            handler.setStream(sys.stderr)
+
+    modes = args.modes.split(',') if args.modes else ['dynamic'] + (['static'] if args.calibration else [])
+    unknown = set(modes) - set(QUANTIZATION_MODES)
+    if unknown:
+        parser.error(f"Unknown quantization modes: {', '.join(sorted(unknown))}")
+    if 'static' in modes and not args.calibration:
+        parser.error('static quantization needs --calibration')
+
+    frames = [cv2.imread(path, cv2.IMREAD_COLOR) for path in list_images(args.holdout, args.samples)]
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        parser.error(f"No readable images in {args.holdout}")
+    height, width = frames[0].shape[:2]
+    seat_positions = load_seat_layout(args.seats) if args.seats else seat_grid(width, height, args.grid)
+
+    report = evaluate(
+        args.model, frames, seat_positions, modes,
+        {
+            'confidence_threshold': args.confidence,
+            'iou_threshold': args.iou,
+            'inference_mode': args.inference_mode,
+            'input_size': args.input_size
+        },
+        calibration_dir=args.calibration, calibration_samples=args.calibration_samples, repeat=args.repeat,
+        min_agreement=args.min_agreement, max_drift=args.max_drift, min_speedup=args.min_speedup
+    )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    sys.exit(0 if all(c['accepted'] for c in report['candidates']) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import numpy as np
+
+from seat_state import GESTURE_TYPES, GESTURE_CODES
+
+# Class-name substrings mapped to gestures, checked in order
+GESTURE_KEYWORDS = (
+    (('focused', 'attention'), 'focused'),
+    (('sleep', 'drowsy'), 'sleeping'),
+    (('phone', 'mobile'), 'using_phone'),
+    (('talk', 'chat'), 'chatting'),
+    (('write', 'writing'), 'writing'),
+    (('yawn',), 'yawning'),
+    (('away', 'distract'), 'looking_away')
+)
+FACE_KEYWORDS = ('face', 'head', 'person')
+
+# Class ids of gesture models that ship without class names
+DEFAULT_CLASS_GESTURES = ('focused', 'looking_away', 'sleeping', 'using_phone', 'chatting', 'writing', 'yawning')
+
+# Lookup value for classes whose gesture depends on the detection confidence
+FROM_CONFIDENCE = -1
+FOCUSED_CONFIDENCE = 0.6
+
+
+def build_gesture_lut(class_names=None):
+    """
+    Map every class id of a model to a gesture code once, at load time
+    class_names is a list or an {id: name} dict (as stored by ultralytics).
+    Returns (gesture codes, face flags) indexed by class id; a gesture code of
+    FROM_CONFIDENCE means focused/looking_away is decided per detection.
+    Every class mapped to a gesture counts as a detected face. Models whose
+    names match no keyword at all (e.g. '0', '1', ...) use the default id map.
+    """
+    default = (
+        np.array([GESTURE_CODES[g] for g in DEFAULT_CLASS_GESTURES], dtype=np.int8),
+        np.ones(len(DEFAULT_CLASS_GESTURES), dtype=bool)
+    )
+    if not class_names:
+        return default
+
+    if not isinstance(class_names, dict):
+        class_names = dict(enumerate(class_names))
+    size = max(int(class_id) for class_id in class_names) + 1
+
+    gestures = np.full(size, GESTURE_CODES['unknown'], dtype=np.int8)
+    for class_id, name in class_names.items():
+        name = str(name).lower()
+        for keywords, gesture in GESTURE_KEYWORDS:
+            if any(keyword in name for keyword in keywords):
+                gestures[int(class_id)] = GESTURE_CODES[gesture]
+                break
+        else:
+            if any(keyword in name for keyword in FACE_KEYWORDS):
+                gestures[int(class_id)] = FROM_CONFIDENCE
+
+    faces = gestures != GESTURE_CODES['unknown']
+    if not faces.any():
+        return default
+    return gestures, faces
+
+
+def classify_gestures(gesture_lut, face_lut, class_ids, confidences):
+    """Vectorized class id -> (gesture codes, face flags); unknown ids fall back to confidence"""
+    class_ids = np.asarray(class_ids, dtype=np.int64)
+    confidences = np.asarray(confidences, dtype=np.float64)
+    known = (class_ids >= 0) & (class_ids < len(gesture_lut))
+    safe_ids = np.where(known, class_ids, 0)
+
+    codes = np.where(known, gesture_lut[safe_ids], FROM_CONFIDENCE).astype(np.int8)
+    by_confidence = np.where(
+        confidences > FOCUSED_CONFIDENCE, GESTURE_CODES['focused'], GESTURE_CODES['looking_away']
+    )
+    codes = np.where(codes == FROM_CONFIDENCE, by_confidence, codes).astype(np.int8)
+    faces = np.where(known, face_lut[safe_ids], True)
+    return codes, faces
+
+
+class DetectionBatch:
+    """
+    Columnar per-seat detections for one frame
+    boxes are seat-relative x1, y1, x2, y2 and NaN for seats without a box.
+    """
+
+    __slots__ = ('seat_ids', 'gesture_codes', 'confidences', 'boxes',
+                 'face_detected', 'body_detected', 'fresh')
+
+    def __init__(self, seat_ids, gesture_codes, confidences, boxes, face_detected, body_detected, fresh=None):
+        self.seat_ids = list(seat_ids)
+        self.gesture_codes = gesture_codes
+        self.confidences = confidences
+        self.boxes = boxes
+        self.face_detected = face_detected
+        self.body_detected = body_detected
+        self.fresh = fresh
+
+    @classmethod
+    def empty(cls, seat_ids):
+        """All seats absent"""
+        n = len(seat_ids)
+        return cls(
+            seat_ids,
+            np.full(n, GESTURE_CODES['absent'], dtype=np.int8),
+            np.zeros(n, dtype=np.float64),
+            np.full((n, 4), np.nan, dtype=np.float64),
+            np.zeros(n, dtype=bool),
+            np.zeros(n, dtype=bool)
+        )
+
+    @classmethod
+    def from_dicts(cls, detections, with_boxes=True):
+        """
+        Columnar view of a list of per-seat result dicts
+        Summaries only need gesture codes and face flags, so boxes and
+        confidences can be skipped with with_boxes=False
+        """
+        n = len(detections)
+        lookup = GESTURE_CODES.get
+        unknown = GESTURE_CODES['unknown']
+        batch = cls(
+            [d['seat_id'] for d in detections],
+            np.fromiter((lookup(d['gesture_type'], unknown) for d in detections), dtype=np.int8, count=n),
+            None, None,
+            np.fromiter((d['face_detected'] for d in detections), dtype=bool, count=n),
+            None
+        )
+        if n and all('fresh' in d for d in detections):
+            batch.fresh = np.fromiter((d['fresh'] for d in detections), dtype=bool, count=n)
+        if with_boxes:
+            batch.confidences = np.fromiter((d['confidence'] for d in detections), dtype=np.float64, count=n)
+            batch.body_detected = np.fromiter((d['body_detected'] for d in detections), dtype=bool, count=n)
+            boxes = [
+                (b['x'], b['y'], b['x'] + b['width'], b['y'] + b['height']) if b else (np.nan,) * 4
+                for b in (d.get('bbox') for d in detections)
+            ]
+            batch.boxes = np.array(boxes, dtype=np.float64).reshape(n, 4)
+        return batch
+
+    def __len__(self):
+        return len(self.seat_ids)
+
+    def to_dicts(self):
+        """Per-seat result dicts in the /api/detect-frame response format"""
+        detections = []
+        has_box = ~np.isnan(self.boxes[:, 0])
+        for i, seat_id in enumerate(self.seat_ids):
+            bbox = None
+            if has_box[i]:
+                x1, y1, x2, y2 = self.boxes[i]
+                bbox = {'x': int(x1), 'y': int(y1), 'width': int(x2 - x1), 'height': int(y2 - y1)}
+            detection = {
+                'seat_id': seat_id,
+                'face_detected': bool(self.face_detected[i]),
+                'body_detected': bool(self.body_detected[i]),
+                'gesture_type': GESTURE_TYPES[self.gesture_codes[i]],
+                'confidence': float(self.confidences[i]),
+                'bbox': bbox
+            }
+            if self.fresh is not None:
+                detection['fresh'] = bool(self.fresh[i])
+            detections.append(detection)
+        return detections
+
+    def gesture_counts(self):
+        return np.bincount(self.gesture_codes.astype(np.intp), minlength=len(GESTURE_TYPES))
+
+    def gesture_analysis(self):
+        """Gesture distribution in the analyze_gestures response format"""
+        counts = self.gesture_counts()
+        total = len(self)
+        return [
+            {
+                'gesture_type': GESTURE_TYPES[code],
+                'count': int(counts[code]),
+                'percentage': float(counts[code] / total * 100)
+            }
+            for code in np.flatnonzero(counts)
+        ]
+
+    def summary(self, total_seats=None):
+        total_seats = len(self) if total_seats is None else total_seats
+        focused = int(self.gesture_counts()[GESTURE_CODES['focused']])
+        return {
+            'total_seats': total_seats,
+            'occupied_seats': int(np.count_nonzero(self.face_detected)),
+            'focused_count': focused,
+            'focus_percentage': (focused / total_seats * 100) if total_seats > 0 else 0
+        }
+
+    def to_columns(self):
+        """
+        Compact columnar response body: parallel arrays instead of one dict
+        per seat; gesture codes index into gesture_types and seats without a
+        box have null in boxes
+        """
+        xyxy = np.nan_to_num(self.boxes)
+        boxes = np.column_stack([xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]]).astype(np.int64)
+        has_box = ~np.isnan(self.boxes[:, 0])
+        columns = {
+            'seat_ids': self.seat_ids,
+            'gesture_types': list(GESTURE_TYPES),
+            'gesture_codes': self.gesture_codes.tolist(),
+            'confidences': np.round(self.confidences, 4).tolist(),
+            'face_detected': self.face_detected.astype(np.uint8).tolist(),
+            'body_detected': self.body_detected.astype(np.uint8).tolist(),
+            'boxes': [box if present else None for box, present in zip(boxes.tolist(), has_box)]
+        }
+        if self.fresh is not None:
+            columns['fresh'] = self.fresh.astype(np.uint8).tolist()
+        return columns
@@ -0,0 +1,1028 @@
+import ast
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from detections import DetectionBatch, build_gesture_lut, classify_gestures
+from metrics import Histogram, StageTimer, session_context, suppress_metrics
+from model_cache import (
+    QUANTIZATION_MODES, ArtifactCache, export_ultralytics_onnx, folder_digest, list_images,
+    quantize_onnx, quantized_cache_for
+)
+from seat_layout import LetterboxBatchPool, SeatLayoutStore, letterbox_into, letterbox_plan
+from seat_state import GESTURE_CODES, GESTURE_TYPES
+
+logger = logging.getLogger(__name__)
+
+# Per-stage detector latency; the Flask app registers the histogram on /metrics.
+# METRICS_SESSION_LABELS=1 adds a series per session id (dropped when a stream closes)
+stage_latency = StageTimer(
+    Histogram(
+        'detector_stage_seconds', 'Latency of detect-frame pipeline stages',
+        ('stage', 'model_type', 'session')
+    ),
+    include_session=os.environ.get('METRICS_SESSION_LABELS', '0') != '0'
+)
+
+# Seat layouts validated, clipped and planned once per layout and frame size
+seat_layouts = SeatLayoutStore(max_layouts=int(os.environ.get('SEAT_LAYOUT_CACHE_SIZE', 256)))
+
+# Converted model artifacts (ultralytics .pt -> ONNX) keyed by checkpoint content hash
+model_artifacts = ArtifactCache()
+
+# Supported detection modes for YOLODetector.detect_in_seats
+INFERENCE_MODES = ('per_seat', 'whole_frame', 'batched_roi', 'tiled')
+
+# Gesture distribution of simulated (mock model) detections
+SIMULATED_GESTURE_CODES = np.array([GESTURE_CODES[g] for g in (
+    'focused', 'looking_away', 'sleeping', 'using_phone', 'chatting', 'writing', 'yawning'
+)])
+SIMULATED_GESTURE_WEIGHTS = np.array([0.45, 0.25, 0.08, 0.08, 0.06, 0.06, 0.02])
+
+# Map of graph_optimization names accepted by /api/initialize-model
+ONNX_GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL'
+}
+
+def nms(boxes, scores, iou_threshold):
+    """
+    Greedy non-maximum suppression over (N, 4) xyxy boxes
+    Returns indices of kept boxes ordered by descending score
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores)
+    
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        intersection = w * h
+        iou = intersection / np.maximum(areas[i] + areas[rest] - intersection, 1e-6)
+        order = rest[iou <= iou_threshold]
+    
+    return np.array(keep, dtype=np.int64)
+
+def decode_yolo_output(output, confidence_threshold, iou_threshold, max_detections=300):
+    """
+    Decode one image of raw YOLO output into (boxes xyxy, confidences, class ids)
+    Accepts YOLOv8/YOLO11 layout (4 + classes, anchors) and YOLOv5 layout
+    (anchors, 5 + classes) with an objectness column
+    """
+    if output.shape[0] < output.shape[1]:
+        # YOLOv8/YOLO11: cx, cy, w, h, class scores...
+        preds = output.T
+        class_scores = preds[:, 4:]
+    else:
+        # YOLOv5: cx, cy, w, h, objectness, class scores...
+        preds = output
+        class_scores = preds[:, 5:] * preds[:, 4:5]
+    
+    class_ids = np.argmax(class_scores, axis=1)
+    confidences = class_scores[np.arange(len(class_scores)), class_ids]
+    mask = confidences >= confidence_threshold
+    preds, confidences, class_ids = preds[mask], confidences[mask], class_ids[mask]
+    
+    if len(preds) == 0:
+        return np.zeros((0, 4), dtype=np.float32), confidences, class_ids
+    
+    boxes = np.empty((len(preds), 4), dtype=np.float32)
+    boxes[:, :2] = preds[:, :2] - preds[:, 2:4] / 2
+    boxes[:, 2:] = preds[:, :2] + preds[:, 2:4] / 2
+    
+    # Class-aware NMS by shifting each class into its own coordinate range
+    offsets = class_ids[:, None].astype(np.float32) * (boxes.max() + 1)
+    keep = nms(boxes + offsets, confidences, iou_threshold)[:max_detections]
+    return boxes[keep], confidences[keep], class_ids[keep]
+
+def merge_tile_predictions(parts, iou_threshold):
+    """
+    Concatenate (boxes, confidences, class ids) found in overlapping tiles
+    and drop duplicates of objects seen by more than one tile with
+    class-aware NMS
+    """
+    if not parts:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    boxes = np.concatenate([part[0] for part in parts]).astype(np.float32, copy=False)
+    confidences = np.concatenate([part[1] for part in parts])
+    class_ids = np.concatenate([part[2] for part in parts])
+    if len(parts) == 1 or len(boxes) == 0:
+        return boxes, confidences, class_ids
+    
+    offsets = class_ids[:, None].astype(np.float32) * (boxes.max() + 1)
+    keep = nms(boxes + offsets, confidences, iou_threshold)
+    return boxes[keep], confidences[keep], class_ids[keep]
+
+def letterbox(image, size, out=None, pad_value=114):
+    """
+    Resize image to fit a size x size square keeping aspect ratio, padding
+    the borders. Writes into `out` when given.
+    Returns (letterboxed image, scale, (pad_x, pad_y))
+    """
+    plan = letterbox_plan(image.shape[0], image.shape[1], size)
+    if out is None:
+        out = np.empty((size, size, 3), dtype=np.uint8)
+    letterbox_into(image, plan, out, pad_value)
+    scale, _, _, pad_x, pad_y = plan
+    return out, scale, (pad_x, pad_y)
+
+def box_seat_overlap(boxes, seat_boxes):
+    """
+    Fraction of each box area that lies inside each seat
+    boxes: (N, 4) xyxy, seat_boxes: (M, 4) xyxy -> (N, M) matrix in [0, 1]
+    """
+    ix1 = np.maximum(boxes[:, None, 0], seat_boxes[None, :, 0])
+    iy1 = np.maximum(boxes[:, None, 1], seat_boxes[None, :, 1])
+    ix2 = np.minimum(boxes[:, None, 2], seat_boxes[None, :, 2])
+    iy2 = np.minimum(boxes[:, None, 3], seat_boxes[None, :, 3])
+    intersection = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    box_area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(box_area, 1e-6)[:, None]
+
+def assign_boxes_to_seats(boxes, confidences, seat_boxes, min_overlap=0.5):
+    """
+    Assign each box to the seat containing most of it, then keep the
+    highest-confidence box per seat. Returns an (M,) array of box indices,
+    -1 for seats without a detection.
+    """
+    num_seats = len(seat_boxes)
+    if len(boxes) == 0 or num_seats == 0:
+        return np.full(num_seats, -1, dtype=np.int64)
+
+    overlap = box_seat_overlap(boxes, seat_boxes)
+    owner = np.argmax(overlap, axis=1)
+    owned = overlap[np.arange(len(boxes)), owner] >= min_overlap
+
+    # (N, M) score matrix: a box only scores for the one seat that owns it
+    scores = np.full(overlap.shape, -1.0, dtype=np.float32)
+    scores[np.flatnonzero(owned), owner[owned]] = confidences[owned]
+
+    best = np.argmax(scores, axis=0)
+    best[scores[best, np.arange(num_seats)] < 0] = -1
+    return best
+
+
+class YOLODetector:
+    def __init__(self, model_path, confidence_threshold=0.5, iou_threshold=0.4,
+                 inference_mode='per_seat', seat_overlap_threshold=0.5,
+                 input_size=640, max_batch_size=16, intra_op_threads=0,
+                 inter_op_threads=0, graph_optimization='all', decode_reduction=1,
+                 change_threshold=0.02, max_staleness=10, temporal_smoothing=True,
+                 artifact_cache=True, warmup_runs=1, quantization=None,
+                 calibration_dir=None, calibration_samples=100, simulation_seed=None,
+                 tile_size=None, tile_overlap=0.2):
+        # Constructor arguments, so worker processes can build identical replicas
+        self.options = {name: value for name, value in locals().items() if name not in ('self', 'model_path')}
+        self.model_path = model_path
+        self.confidence_threshold = confidence_threshold
+        self.iou_threshold = iou_threshold
+        self.inference_mode = inference_mode if inference_mode in INFERENCE_MODES else 'per_seat'
+        self.seat_overlap_threshold = seat_overlap_threshold
+        self.input_size = input_size
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.graph_optimization = graph_optimization
+        # 1/2/4/8 for a fixed JPEG reduction, 'auto' to pick one from the model input size
+        self.decode_reduction = decode_reduction
+        # Per-session seat change gate: 0 disables reuse of previous detections
+        self.change_threshold = change_threshold
+        self.max_staleness = max_staleness
+        self.temporal_smoothing = temporal_smoothing
+        # Serve .pt checkpoints from a cached ONNX export when possible
+        self.artifact_cache = artifact_cache
+        self.artifact_path = None
+        self.warmup_runs = max(0, int(warmup_runs))
+        # INT8 'dynamic' or 'static' (calibrated on calibration_dir) ONNX inference
+        self.quantization = quantization if quantization in QUANTIZATION_MODES else None
+        self.calibration_dir = calibration_dir
+        self.calibration_samples = int(calibration_samples)
+        self.quantized_path = None
+        # Seeded, vectorized mock detections (load testing); None keeps per-seat random results
+        self.simulation_rng = np.random.default_rng(simulation_seed) if simulation_seed is not None else None
+        self._simulation_lock = threading.Lock()
+        self.class_names = None
+        self.model = None
+        self.model_type = 'unknown'
+        self.model_size_bytes = 0
+        
+        started = time.perf_counter()
+        self.load_model()
+        # Reusable letterbox batches for batched_roi and whole_frame inputs
+        self._crop_batches = LetterboxBatchPool(self.max_batch_size, self.input_size)
+        # Tiled mode: tile side in frame pixels (default: the model input size) and overlap fraction
+        self.tile_size = int(tile_size) if tile_size else self.input_size
+        self.tile_overlap = min(max(float(tile_overlap), 0.0), 0.9)
+        # Class names are mapped to gesture codes once instead of per detection
+        self.gesture_lut, self.face_lut = build_gesture_lut(self.class_names)
+        self.load_seconds = time.perf_counter() - started
+        self.warmup_seconds = self.warm_up(self.warmup_runs)
+    
+    def load_model(self):
+        try:
+            logger.info(f"Loading model from {self.model_path}")
+            
+            # Check if model file exists
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"Model file not found: {self.model_path}")
+            
+            # Get file size for logging
+            self.model_size_bytes = os.path.getsize(self.model_path)
+            file_size = self.model_size_bytes / (1024 * 1024)  # MB
+            logger.info(f"Model file size: {file_size:.2f} MB")
+            
+            # Try to load the model based on file extension
+            if self.model_path.endswith('.pt'):
+                self.model_type = 'pytorch'
+                self._load_pytorch_model()
+            elif self.model_path.endswith('.onnx'):
+                self.model_type = 'onnx'
+                self._load_onnx_model()
+            elif self.model_path.endswith('.pb'):
+                self.model_type = 'tensorflow'
+                self._load_tensorflow_model()
+            else:
+                logger.warning(f"Unknown model format: {self.model_path}")
+                self._use_mock_model()
+            
+            if self.quantization:
+                self._load_quantized_model()
+                
+        except Exception as e:
+            logger.error(f"Error loading model: {str(e)}")
+            self._use_mock_model()
+    
+    def warm_up(self, runs=1):
+        """
+        Push dummy frames through the batched detection path so the first real
+        frame does not pay for lazy initialization; returns the seconds spent
+        """
+        if runs <= 0:
+            return 0.0
+        
+        started = time.perf_counter()
+        size = self.input_size
+        frame = np.full((size, size, 3), 114, dtype=np.uint8)
+        seats = [{'seat_id': 'warmup', 'x': 0, 'y': 0, 'width': size, 'height': size}]
+        try:
+            # Kept out of the stage histograms, which describe production frames
+            with session_context('warmup', self.model_type), suppress_metrics():
+                for _ in range(runs):
+                    self.detect_batch([(frame, seats)])
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {e}")
+        
+        elapsed = time.perf_counter() - started
+        logger.info(f"Model warm-up: {runs} run(s) in {elapsed * 1000:.0f} ms")
+        return elapsed
+    
+    def _load_cached_artifact(self):
+        """
+        Load the ONNX export of an ultralytics checkpoint from the artifact
+        cache, exporting it on first use. Returns False when no artifact can
+        be used and the checkpoint should be loaded directly.
+        """
+        try:
+            # Tagged 'dynamic' so earlier batch-1 exports are not picked up
+            tag = f'{self.input_size}-dynamic'
+            path = model_artifacts.lookup(self.model_path, tag, '.onnx')
+            if path is None:
+                path = model_artifacts.build(
+                    self.model_path, tag, '.onnx', export_ultralytics_onnx(self.input_size)
+                )
+            self._open_onnx_session(path)
+        except ImportError as e:
+            logger.info(f"Artifact cache unavailable ({e}), loading checkpoint directly")
+            return False
+        except Exception as e:
+            logger.warning(f"Could not use a cached ONNX artifact, loading checkpoint directly: {e}")
+            return False
+        
+        self.model_type = 'onnx'
+        self.artifact_path = path
+        self.model_size_bytes = os.path.getsize(path)
+        logger.info(f"Model loaded from cached ONNX artifact {path} (input size {self.input_size})")
+        return True
+    
+    def after_fork(self):
+        """Reopen the ONNX session in a forked worker and warm it up there"""
+        if self.model_type == 'onnx':
+            self._open_onnx_session(self.quantized_path or self.artifact_path or self.model_path)
+        self.warmup_seconds = self.warm_up(self.warmup_runs)
+    
+    def _load_quantized_model(self):
+        """
+        Swap the FP32 ONNX session for an INT8 copy, quantizing on first use
+        The artifact is cached next to the model; on failure the FP32 session is kept.
+        """
+        if self.model_type != 'onnx':
+            logger.warning(f"INT8 quantization needs an ONNX model or cached export, running {self.model_type}")
+            self.quantization = None
+            return
+        
+        source = self.artifact_path or self.model_path
+        try:
+            tag = f"int8-{self.quantization}"
+            calibration_images = None
+            if self.quantization == 'static':
+                if not self.calibration_dir or not os.path.isdir(self.calibration_dir):
+                    raise ValueError(f"Calibration folder not found: {self.calibration_dir}")
+                calibration_images = list_images(self.calibration_dir, self.calibration_samples)
+                tag += f"-{folder_digest(calibration_images)}"
+            
+            cache = quantized_cache_for(self.model_path, model_artifacts)
+            path = cache.lookup(source, tag, '.onnx')
+            if path is None:
+                started = time.perf_counter()
+                path = cache.build(source, tag, '.onnx', quantize_onnx(
+                    self.quantization, calibration_images, self._model_input
+                ))
+                logger.info(f"Quantized model ({self.quantization}) in {time.perf_counter() - started:.1f} s")
+            self._open_onnx_session(path)
+        except Exception as e:
+            logger.warning(f"INT8 quantization failed, keeping the FP32 model: {e}")
+            self.quantization = None
+            return
+        
+        self.quantized_path = path
+        self.model_size_bytes = os.path.getsize(path)
+        logger.info(f"Model loaded from INT8 artifact {path}")
+    
+    def _model_input(self, image):
+        """Letterboxed 1x3xHxW float32 network input for one BGR image"""
+        resized = letterbox(image, self.input_size)[0]
+        return np.ascontiguousarray(resized[..., ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+    
+    def _load_pytorch_model(self):
+        """Load PyTorch model (.pt file)"""
+        # A cache hit avoids importing torch and ultralytics altogether
+        if self.artifact_cache and self._load_cached_artifact():
+            return
+        
+        try:
+            # Try loading with ultralytics YOLOv8 first
+            import torch
+            
+            try:
+                from ultralytics import YOLO
+                self.model = YOLO(self.model_path)
+                self.class_names = self.model.names
+                logger.info("Model loaded successfully with ultralytics YOLO")
+                return
+            except ImportError:
+                logger.info("Ultralytics not available, trying torch.hub")
+            except Exception as e:
+                logger.warning(f"Ultralytics loading failed: {e}")
+            
+            # Try loading with torch.hub (YOLOv5); reuses the locally cached hub repo
+            try:
+                self.model = torch.hub.load('ultralytics/yolov5', 'custom', path=self.model_path)
+                self.class_names = self.model.names
+                logger.info("Model loaded successfully with torch.hub YOLOv5")
+                return
+            except Exception as e:
+                logger.warning(f"Torch.hub loading failed: {e}")
+            
+            # Try loading as raw PyTorch model
+            try:
+                self.model = torch.load(self.model_path, map_location='cpu')
+                logger.info("Model loaded as raw PyTorch model")
+                return
+            except Exception as e:
+                logger.warning(f"Raw PyTorch loading failed: {e}")
+            
+            # If all methods fail, use mock model
+            raise Exception("All PyTorch loading methods failed")
+            
+        except Exception as e:
+            logger.error(f"PyTorch model loading failed: {e}")
+            self._use_mock_model()
+    
+    def _load_onnx_model(self):
+        """Load ONNX model (.onnx file)"""
+        try:
+            self._open_onnx_session(self.model_path)
+            logger.info(f"ONNX model loaded successfully (input size {self.input_size})")
+        except ImportError:
+            logger.error("ONNX Runtime not installed")
+            self._use_mock_model()
+        except Exception as e:
+            logger.error(f"ONNX model loading failed: {e}")
+            self._use_mock_model()
+    
+    def _open_onnx_session(self, path):
+        """Create the ONNX Runtime session and its reusable input buffers"""
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(self.intra_op_threads)
+        options.inter_op_num_threads = int(self.inter_op_threads)
+        options.graph_optimization_level = getattr(
+            ort.GraphOptimizationLevel,
+            ONNX_GRAPH_OPTIMIZATION_LEVELS.get(self.graph_optimization, 'ORT_ENABLE_ALL')
+        )
+        session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        
+        model_input = session.get_inputs()[0]
+        self._onnx_input_name = model_input.name
+        # Fixed-shape exports define the input size; dynamic axes are strings
+        height = model_input.shape[2]
+        if isinstance(height, int):
+            self.input_size = height
+        # A fixed batch dimension (usually 1) means batches are run image by image
+        self._onnx_dynamic_batch = not isinstance(model_input.shape[0], int)
+        
+        # Reusable input buffers so steady-state frames do not allocate. They are
+        # per thread: InferenceSession.run is thread-safe, so sessions are not locked
+        self._onnx_buffers = threading.local()
+        
+        # Ultralytics exports store class names in the model metadata
+        names = session.get_modelmeta().custom_metadata_map.get('names')
+        if names:
+            self.class_names = ast.literal_eval(names)
+        self.model = session
+    
+    def _load_tensorflow_model(self):
+        """Load TensorFlow model (.pb file)"""
+        try:
+            import tensorflow as tf
+            self.model = tf.saved_model.load(self.model_path)
+            logger.info("TensorFlow model loaded successfully")
+        except ImportError:
+            logger.error("TensorFlow not installed")
+            self._use_mock_model()
+        except Exception as e:
+            logger.error(f"TensorFlow model loading failed: {e}")
+            self._use_mock_model()
+    
+    def _use_mock_model(self):
+        """Use mock model for demonstration"""
+        self.model = "mock_model"
+        self.model_type = 'mock'
+        logger.info("Using mock model for demonstration")
+    
+    @property
+    def batches_frames(self):
+        """Whether detect_batch shares forward passes between frames (else it loops detect_in_seats)"""
+        return self.model_type in ('pytorch', 'onnx') and self.inference_mode in ('whole_frame', 'batched_roi', 'tiled')
+    
+    def detect_in_seats(self, frame, seat_positions):
+        """
+        Detect faces/heads within seat bounding boxes
+        Returns detection results for each seat
+        """
+        logger.info(f"Processing {len(seat_positions)} seats with {self.model_type} model ({self.inference_mode})")
+        
+        if self.model == "mock_model" and self.simulation_rng is not None:
+            with stage_latency.time('inference', self.model_type):
+                return self.simulate_seats(frame, seat_positions)
+        
+        if self.inference_mode == 'whole_frame' and self.model_type in ('pytorch', 'onnx'):
+            try:
+                return self.detect_whole_frame(frame, seat_positions)
+            except Exception as e:
+                logger.error(f"Whole-frame detection failed, falling back to per-seat: {e}")
+        
+        if self.inference_mode == 'batched_roi' and self.model_type in ('pytorch', 'onnx'):
+            try:
+                return self.detect_batched_rois(frame, seat_positions)
+            except Exception as e:
+                logger.error(f"Batched ROI detection failed, falling back to per-seat: {e}")
+        
+        if self.inference_mode == 'tiled' and self.model_type in ('pytorch', 'onnx'):
+            try:
+                return self.detect_tiled(frame, seat_positions)
+            except Exception as e:
+                logger.error(f"Tiled detection failed, falling back to per-seat: {e}")
+        
+        detections = []
+        # Stage times are summed over seats and recorded once per frame;
+        # per-seat inference includes the model's own pre/postprocessing
+        started = time.perf_counter()
+        layout = seat_layouts.get(seat_positions, frame.shape, self.input_size)
+        crop_seconds, inference_seconds = time.perf_counter() - started, 0.0
+        
+        for seat_id, bounds in zip(layout.seat_ids, layout.slices):
+            # Seats without any area inside the frame
+            if bounds is None:
+                detections.append(self.create_empty_detection(seat_id))
+                continue
+            
+            # Extract ROI (Region of Interest) for this seat, already clipped to the frame
+            try:
+                started = time.perf_counter()
+                y1, y2, x1, x2 = bounds
+                roi = frame[y1:y2, x1:x2]
+                cropped = time.perf_counter()
+                crop_seconds += cropped - started
+                
+                # Perform detection
+                if self.model == "mock_model":
+                    detection_result = self.simulate_detection(roi, seat_id)
+                else:
+                    detection_result = self.real_detection(roi, seat_id)
+                inference_seconds += time.perf_counter() - cropped
+                
+                detections.append(detection_result)
+                
+            except Exception as e:
+                logger.error(f"Error processing seat {seat_id}: {e}")
+                detections.append(self.create_empty_detection(seat_id))
+        
+        stage_latency.observe('crop', crop_seconds, self.model_type)
+        stage_latency.observe('inference', inference_seconds, self.model_type)
+        return detections
+    
+    def detect_whole_frame(self, frame, seat_positions):
+        """
+        Run the model once on the region covering all seats and assign the
+        resulting boxes to seats with a vectorized containment matrix
+        """
+        with stage_latency.time('crop', self.model_type):
+            layout = seat_layouts.get(seat_positions, frame.shape, self.input_size)
+        if layout.union is None:
+            return [self.create_empty_detection(seat_id) for seat_id in layout.seat_ids]
+        
+        x1, y1, x2, y2 = layout.union
+        with stage_latency.time('inference', self.model_type):
+            boxes, confidences, class_ids = self._predict(frame[y1:y2, x1:x2])
+        with stage_latency.time('postprocess', self.model_type):
+            boxes = boxes + np.array([x1, y1, x1, y1], dtype=boxes.dtype)
+            return self._assign_predictions(layout, (boxes, confidences, class_ids))
+    
+    def detect_batched_rois(self, frame, seat_positions):
+        """
+        Letterbox every valid seat crop to the model input size and run them
+        through the model in batches of at most max_batch_size
+        """
+        return self._detect_rois_batched([(frame, seat_positions)])[0]
+    
+    def detect_tiled(self, frame, seat_positions):
+        """
+        Cover the seat region with overlapping tiles at full resolution, run
+        them as one batch and assign the merged boxes to seats
+        """
+        return self._detect_tiled([(frame, seat_positions)])[0]
+    
+    def detect_batch(self, items):
+        """
+        Detect seats for several (frame, seat_positions) pairs with as few
+        forward passes as the inference mode allows
+        Returns one detection list per item
+        """
+        if self.model_type in ('pytorch', 'onnx'):
+            try:
+                if self.inference_mode == 'whole_frame':
+                    return self._detect_whole_frames(items)
+                if self.inference_mode == 'batched_roi':
+                    return self._detect_rois_batched(items)
+                if self.inference_mode == 'tiled':
+                    return self._detect_tiled(items)
+            except Exception as e:
+                logger.error(f"Batched detection failed, falling back to per-frame: {e}")
+        
+        return [self.detect_in_seats(frame, seat_positions) for frame, seat_positions in items]
+    
+    def _detect_whole_frames(self, items):
+        """Letterbox the seat region of every frame into one batch and assign boxes per frame"""
+        with stage_latency.time('crop', self.model_type):
+            layouts = [seat_layouts.get(seat_positions, frame.shape, self.input_size) for frame, seat_positions in items]
+        # Frames without a valid seat need no inference
+        results = [
+            [self.create_empty_detection(seat_id) for seat_id in layout.seat_ids] if layout.union is None else None
+            for layout in layouts
+        ]
+        pending = [i for i, layout in enumerate(layouts) if layout.union is not None]
+        
+        with self._crop_batches.borrow() as batch:
+            for start in range(0, len(pending), self.max_batch_size):
+                chunk = pending[start:start + self.max_batch_size]
+                with stage_latency.time('crop', self.model_type):
+                    for slot, i in enumerate(chunk):
+                        x1, y1, x2, y2 = layouts[i].union
+                        batch.write(slot, items[i][0][y1:y2, x1:x2], layouts[i].union_plan)
+                
+                with stage_latency.time('inference', self.model_type):
+                    predictions = self._predict_batch(batch.images[:len(chunk)])
+                
+                with stage_latency.time('postprocess', self.model_type):
+                    for i, prediction in zip(chunk, predictions):
+                        layout = layouts[i]
+                        scale, _, _, pad_x, pad_y = layout.union_plan
+                        boxes = prediction[0].copy()
+                        boxes[:, 0::2] = (boxes[:, 0::2] - pad_x) / scale + layout.union[0]
+                        boxes[:, 1::2] = (boxes[:, 1::2] - pad_y) / scale + layout.union[1]
+                        results[i] = self._assign_predictions(layout, (boxes,) + tuple(prediction[1:]))
+        
+        return results
+    
+    def _assign_predictions(self, layout, prediction):
+        """Turn frame-coordinate predictions into one result dict per seat of a compiled layout"""
+        boxes, confidences, class_ids = prediction
+        
+        seat_boxes = layout.boxes
+        best = assign_boxes_to_seats(boxes, confidences, seat_boxes, self.seat_overlap_threshold)
+        hit = layout.valid & (best >= 0)
+        matched = best[hit]
+        
+        batch = DetectionBatch.empty(layout.seat_ids)
+        if len(matched):
+            # Report bboxes in seat-relative coordinates like the per-seat path
+            origin = seat_boxes[hit][:, :2]
+            extent = seat_boxes[hit][:, 2:] - origin
+            relative = boxes[matched].reshape(-1, 2, 2) - origin[:, None, :]
+            batch.boxes[hit] = np.clip(relative, 0, extent[:, None, :]).reshape(-1, 4)
+            
+            batch.confidences[hit] = confidences[matched]
+            batch.gesture_codes[hit], batch.face_detected[hit] = classify_gestures(
+                self.gesture_lut, self.face_lut, class_ids[matched], confidences[matched]
+            )
+            batch.body_detected[hit] = True
+        
+        return batch.to_dicts()
+    
+    def _detect_rois_batched(self, items):
+        """Crop the seats of every (frame, seat_positions) item and batch all ROIs together"""
+        with stage_latency.time('crop', self.model_type):
+            layouts = [seat_layouts.get(seat_positions, frame.shape, self.input_size) for frame, seat_positions in items]
+        results = [[self.create_empty_detection(seat_id) for seat_id in layout.seat_ids] for layout in layouts]
+        rois = [(item_idx, seat_idx) for item_idx, layout in enumerate(layouts) for seat_idx in layout.valid_indices]
+        
+        with self._crop_batches.borrow() as batch:
+            for start in range(0, len(rois), self.max_batch_size):
+                chunk = rois[start:start + self.max_batch_size]
+                with stage_latency.time('crop', self.model_type):
+                    self._write_rois(batch, items, layouts, chunk)
+                
+                with stage_latency.time('inference', self.model_type):
+                    predictions = self._predict_batch(batch.images[:len(chunk)])
+                
+                with stage_latency.time('postprocess', self.model_type):
+                    for (item_idx, seat_idx), (boxes, confidences, class_ids) in zip(chunk, predictions):
+                        if len(boxes) == 0:
+                            continue
+                        
+                        # Map the best box from letterbox space back into seat space
+                        layout = layouts[item_idx]
+                        scale, _, _, pad_x, pad_y = layout.plans[seat_idx]
+                        y1, y2, x1, x2 = layout.slices[seat_idx]
+                        best = int(np.argmax(confidences))
+                        bx1, by1, bx2, by2 = boxes[best]
+                        bx1, bx2 = np.clip([(bx1 - pad_x) / scale, (bx2 - pad_x) / scale], 0, x2 - x1)
+                        by1, by2 = np.clip([(by1 - pad_y) / scale, (by2 - pad_y) / scale], 0, y2 - y1)
+                        
+                        results[item_idx][seat_idx] = self._build_detection(
+                            layout.seat_ids[seat_idx], (bx1, by1, bx2, by2),
+                            float(confidences[best]), int(class_ids[best])
+                        )
+        
+        return results
+    
+    def _write_rois(self, batch, items, layouts, chunk):
+        """Letterbox the seats in chunk, [(item index, seat index), ...], into consecutive batch slots"""
+        for slot, (item_idx, seat_idx) in enumerate(chunk):
+            y1, y2, x1, x2 = layouts[item_idx].slices[seat_idx]
+            batch.write(slot, items[item_idx][0][y1:y2, x1:x2], layouts[item_idx].plans[seat_idx])
+    
+    def crop_rois(self, frame, seat_positions):
+        """
+        The crop stage of batched_roi inference on its own, for benchmarks:
+        layout lookup and letterboxing of every valid seat into the reused
+        batch buffers. Returns the number of seats cropped.
+        """
+        items = [(frame, seat_positions)]
+        layouts = [seat_layouts.get(seat_positions, frame.shape, self.input_size)]
+        rois = [(0, seat_idx) for seat_idx in layouts[0].valid_indices]
+        with self._crop_batches.borrow() as batch:
+            for start in range(0, len(rois), self.max_batch_size):
+                self._write_rois(batch, items, layouts, rois[start:start + self.max_batch_size])
+        return len(rois)
+    
+    def _detect_tiled(self, items):
+        """
+        Tile the seat region of every (frame, seat_positions) item, batch the
+        tiles of all items together and merge boxes across tile borders
+        """
+        with stage_latency.time('crop', self.model_type):
+            layouts = [seat_layouts.get(seat_positions, frame.shape, self.input_size) for frame, seat_positions in items]
+        tiles = [
+            (item_idx, bounds, plan)
+            for item_idx, layout in enumerate(layouts)
+            for bounds, plan in layout.tiles(self.tile_size, self.tile_overlap)
+        ]
+        
+        found = [[] for _ in items]
+        with self._crop_batches.borrow() as batch:
+            for start in range(0, len(tiles), self.max_batch_size):
+                chunk = tiles[start:start + self.max_batch_size]
+                with stage_latency.time('crop', self.model_type):
+                    for slot, (item_idx, (x1, y1, x2, y2), plan) in enumerate(chunk):
+                        batch.write(slot, items[item_idx][0][y1:y2, x1:x2], plan)
+                
+                with stage_latency.time('inference', self.model_type):
+                    predictions = self._predict_batch(batch.images[:len(chunk)])
+                
+                with stage_latency.time('postprocess', self.model_type):
+                    for (item_idx, (x1, y1, _, _), (scale, _, _, pad_x, pad_y)), (boxes, confidences, class_ids) in zip(
+                            chunk, predictions):
+                        if len(boxes) == 0:
+                            continue
+                        # Letterbox space of the tile -> frame coordinates
+                        boxes = (boxes - np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)) / scale
+                        boxes += np.array([x1, y1, x1, y1], dtype=np.float32)
+                        found[item_idx].append((boxes, confidences, class_ids))
+        
+        with stage_latency.time('postprocess', self.model_type):
+            return [
+                self._assign_predictions(layout, merge_tile_predictions(parts, self.iou_threshold))
+                for layout, parts in zip(layouts, found)
+            ]
+    
+    def _predict(self, image):
+        """Run the loaded model on one full image, returning numpy arrays"""
+        if self.model_type == 'onnx':
+            return self._onnx_predict(image)
+        return self._pytorch_predict(image)
+    
+    def _predict_batch(self, batch):
+        """Run the loaded model on a stacked batch of letterboxed images"""
+        if self.model_type == 'onnx':
+            if self._onnx_dynamic_batch and len(batch) > 1:
+                return self._onnx_predict_batch(batch)
+            return [self._onnx_predict(image, letterboxed=True) for image in batch]
+        return self._pytorch_predict_batch(batch)
+    
+    def _onnx_thread_buffers(self):
+        """This thread's letterbox image, single input and batched input (grown to the largest batch seen)"""
+        buffers = self._onnx_buffers
+        if not hasattr(buffers, 'single'):
+            buffers.letterbox = np.empty((self.input_size, self.input_size, 3), dtype=np.uint8)
+            buffers.single = np.zeros((1, 3, self.input_size, self.input_size), dtype=np.float32)
+            buffers.batch = None
+        return buffers
+    
+    def _onnx_predict_batch(self, batch):
+        """
+        Run the ONNX session once on a stacked (N, S, S, 3) letterboxed batch
+        Needs a model exported with a dynamic batch axis; boxes are returned
+        in letterbox coordinates
+        """
+        n = len(batch)
+        buffers = self._onnx_thread_buffers()
+        if buffers.batch is None or len(buffers.batch) < n:
+            buffers.batch = np.empty((n, 3, self.input_size, self.input_size), dtype=np.float32)
+        inputs = buffers.batch[:n]
+        np.multiply(batch[..., ::-1].transpose(0, 3, 1, 2), 1 / 255.0, out=inputs, casting='unsafe')
+        outputs = self.model.run(None, {self._onnx_input_name: inputs})[0]
+        
+        return [
+            decode_yolo_output(output, self.confidence_threshold, self.iou_threshold)
+            for output in outputs
+        ]
+    
+    def _onnx_predict(self, image, letterboxed=False):
+        """
+        Run the ONNX session on one image using the preallocated input buffer
+        Boxes are returned in image coordinates, or letterbox coordinates when
+        the image is already letterboxed to the input size
+        """
+        buffers = self._onnx_thread_buffers()
+        if letterboxed:
+            scale, (pad_x, pad_y) = 1.0, (0, 0)
+            resized = image
+        else:
+            resized, scale, (pad_x, pad_y) = letterbox(image, self.input_size, out=buffers.letterbox)
+        
+        # HWC BGR uint8 -> CHW RGB float32 in [0, 1], written in place
+        np.multiply(resized[..., ::-1].transpose(2, 0, 1), 1 / 255.0, out=buffers.single[0], casting='unsafe')
+        output = self.model.run(None, {self._onnx_input_name: buffers.single})[0][0]
+        
+        boxes, confidences, class_ids = decode_yolo_output(
+            output, self.confidence_threshold, self.iou_threshold
+        )
+        if not letterboxed and len(boxes):
+            h, w = image.shape[:2]
+            boxes[:, 0::2] = np.clip((boxes[:, 0::2] - pad_x) / scale, 0, w)
+            boxes[:, 1::2] = np.clip((boxes[:, 1::2] - pad_y) / scale, 0, h)
+        
+        return boxes, confidences, class_ids
+    
+    def _pytorch_predict(self, image):
+        """
+        Run the PyTorch model on one image and return raw numpy arrays:
+        boxes (N, 4) xyxy, confidences (N,) and class ids (N,)
+        """
+        if self.model.__class__.__name__ == 'YOLO':
+            results = self.model(image, conf=self.confidence_threshold,
+                                 iou=self.iou_threshold, verbose=False)
+        else:
+            results = self.model(image)
+        
+        if isinstance(results, (list, tuple)):
+            results = results[0]
+        
+        return self._parse_pytorch_result(results)
+    
+    def _pytorch_predict_batch(self, batch):
+        """
+        Run one forward pass over a stacked (B, S, S, 3) BGR uint8 batch of
+        letterboxed images. Returns one _pytorch_predict-style tuple per image,
+        with boxes in letterbox coordinates.
+        """
+        import torch
+        
+        if self.model.__class__.__name__ == 'YOLO':
+            # Ultralytics treats tensors as RGB, BCHW, 0-1 and already resized
+            tensor = torch.from_numpy(
+                np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2))
+            ).float().div_(255.0)
+            results = self.model(tensor, conf=self.confidence_threshold,
+                                 iou=self.iou_threshold, verbose=False)
+        else:
+            # YOLOv5 AutoShape batches a list of images itself
+            results = self.model(list(batch))
+            if hasattr(results, 'xyxy'):
+                return [self._parse_pytorch_result(results, i) for i in range(len(batch))]
+        
+        return [self._parse_pytorch_result(result) for result in results]
+    
+    def _parse_pytorch_result(self, results, index=0):
+        """Convert a YOLOv5 or YOLOv8/YOLO11 result object into numpy arrays"""
+        if hasattr(results, 'xyxy'):
+            # YOLOv5 format: rows of x1, y1, x2, y2, confidence, class
+            preds = results.xyxy[index].cpu().numpy()
+            preds = preds[preds[:, 4] >= self.confidence_threshold]
+            return preds[:, :4], preds[:, 4], preds[:, 5].astype(np.int64)
+        
+        if hasattr(results, 'boxes') and results.boxes is not None:
+            # YOLOv8/YOLO11 format
+            return (
+                results.boxes.xyxy.cpu().numpy(),
+                results.boxes.conf.cpu().numpy(),
+                results.boxes.cls.cpu().numpy().astype(np.int64)
+            )
+        
+        raise ValueError(f"Unsupported model output: {type(results).__name__}")
+    
+    def _build_detection(self, seat_id, box, confidence, class_id):
+        """Build a per-seat result dict from a single xyxy box"""
+        x1, y1, x2, y2 = box
+        codes, faces = classify_gestures(self.gesture_lut, self.face_lut, [class_id], [confidence])
+        gesture_type = GESTURE_TYPES[codes[0]]
+        
+        return {
+            'seat_id': seat_id,
+            'face_detected': bool(faces[0]),
+            'body_detected': True,
+            'gesture_type': gesture_type,
+            'confidence': confidence,
+            'bbox': {
+                'x': int(x1),
+                'y': int(y1),
+                'width': int(x2 - x1),
+                'height': int(y2 - y1)
+            }
+        }
+    
+    def real_detection(self, roi, seat_id):
+        """
+        Perform real YOLO detection on the ROI
+        """
+        try:
+            logger.debug(f"Running real detection for seat {seat_id}")
+            
+            # Run inference based on model type
+            if self.model_type == 'pytorch':
+                return self._pytorch_inference(roi, seat_id)
+            elif self.model_type == 'onnx':
+                return self._onnx_inference(roi, seat_id)
+            elif self.model_type == 'tensorflow':
+                return self._tensorflow_inference(roi, seat_id)
+            else:
+                return self.simulate_detection(roi, seat_id)
+                
+        except Exception as e:
+            logger.error(f"Error in real detection for seat {seat_id}: {str(e)}")
+            return self.simulate_detection(roi, seat_id)
+    
+    def _pytorch_inference(self, roi, seat_id):
+        """PyTorch model inference"""
+        try:
+            boxes, confidences, class_ids = self._pytorch_predict(roi)
+            
+            if len(boxes) > 0:
+                best = int(np.argmax(confidences))
+                return self._build_detection(
+                    seat_id, boxes[best], float(confidences[best]), int(class_ids[best])
+                )
+            
+            return self.create_empty_detection(seat_id)
+                
+        except Exception as e:
+            logger.error(f"PyTorch inference error: {e}")
+            return self.simulate_detection(roi, seat_id)
+    
+    def _onnx_inference(self, roi, seat_id):
+        """ONNX model inference"""
+        try:
+            boxes, confidences, class_ids = self._onnx_predict(roi)
+            
+            if len(boxes) > 0:
+                best = int(np.argmax(confidences))
+                return self._build_detection(
+                    seat_id, boxes[best], float(confidences[best]), int(class_ids[best])
+                )
+            
+            return self.create_empty_detection(seat_id)
+            
+        except Exception as e:
+            logger.error(f"ONNX inference error: {e}")
+            return self.simulate_detection(roi, seat_id)
+    
+    def _tensorflow_inference(self, roi, seat_id):
+        """TensorFlow model inference"""
+        # Implement TensorFlow inference logic here
+        return self.simulate_detection(roi, seat_id)
+    
+    def simulate_detection(self, roi, seat_id):
+        """
+        Simulate YOLO detection results for demonstration
+        """
+        import random
+        
+        # Simulate detection probabilities with realistic distribution
+        face_detected = random.random() > 0.25  # 75% chance of face detection
+        
+        if face_detected:
+            # Simulate gesture detection with realistic probabilities
+            gestures = ['focused', 'looking_away', 'sleeping', 'using_phone', 'chatting', 'writing', 'yawning']
+            # Focused is most likely, followed by looking_away
+            gesture_weights = [0.45, 0.25, 0.08, 0.08, 0.06, 0.06, 0.02]
+            gesture_type = random.choices(gestures, weights=gesture_weights)[0]
+            confidence = random.uniform(0.65, 0.95)
+        else:
+            gesture_type = 'absent'
+            confidence = 0.0
+        
+        return {
+            'seat_id': seat_id,
+            'face_detected': face_detected,
+            'body_detected': face_detected,
+            'gesture_type': gesture_type,
+            'confidence': confidence,
+            'bbox': {
+                'x': random.randint(0, 50),
+                'y': random.randint(0, 50),
+                'width': random.randint(30, 80),
+                'height': random.randint(40, 100)
+            } if face_detected else None
+        }
+    
+    def simulate_seats(self, frame, seat_positions):
+        """
+        simulate_detection for all seats at once from the seeded generator
+        Same distributions, but one draw per array instead of per seat, so
+        results depend only on the seed and the order of frames. Seats exist
+        by the same rule as for the real models: clipped to the frame, empty
+        after clipping means absent.
+        """
+        n = len(seat_positions)
+        valid = seat_layouts.get(seat_positions, frame.shape, self.input_size).valid
+        
+        with self._simulation_lock:
+            rng = self.simulation_rng
+            present = (rng.random(n) > 0.25) & valid
+            gestures = rng.choice(SIMULATED_GESTURE_CODES, size=n, p=SIMULATED_GESTURE_WEIGHTS)
+            confidences = rng.uniform(0.65, 0.95, n)
+            origins = rng.integers(0, 51, (n, 2))
+            sizes = np.column_stack([rng.integers(30, 81, n), rng.integers(40, 101, n)])
+        
+        boxes = np.hstack([origins, origins + sizes]).astype(np.float64)
+        boxes[~present] = np.nan
+        return DetectionBatch(
+            [seat['seat_id'] for seat in seat_positions],
+            np.where(present, gestures, GESTURE_CODES['absent']).astype(np.int8),
+            np.where(present, confidences, 0.0),
+            boxes, present, present
+        ).to_dicts()
+    
+    def create_empty_detection(self, seat_id):
+        """Create empty detection result"""
+        return {
+            'seat_id': seat_id,
+            'face_detected': False,
+            'body_detected': False,
+            'gesture_type': 'absent',
+            'confidence': 0.0,
+            'bbox': None
+        }
@@ -0,0 +1,203 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from seat_state import GESTURE_TYPES
+
+# (resolution in seconds, buckets kept): 15 min at 1 s, 3 h at 10 s, 24 h at 1 min
+DEFAULT_RESOLUTIONS = ((1, 900), (10, 1080), (60, 1440))
+
+
+class RollupRing:
+    """
+    Fixed-size ring of time buckets at one resolution
+    Each bucket accumulates sums so means can be computed at query time;
+    a slot is reset when a newer bucket lands on it.
+    """
+
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.bucket = np.full(capacity, -1, dtype=np.int64)
+        self.samples = np.zeros(capacity, dtype=np.int32)
+        self.focus_sum = np.zeros(capacity, dtype=np.float64)
+        self.focus_min = np.zeros(capacity, dtype=np.float32)
+        self.focus_max = np.zeros(capacity, dtype=np.float32)
+        self.occupied_sum = np.zeros(capacity, dtype=np.float64)
+        self.seats_sum = np.zeros(capacity, dtype=np.float64)
+        self.gesture_sum = np.zeros((capacity, len(GESTURE_TYPES)), dtype=np.float32)
+
+    def add(self, timestamp, focus_percentage, occupied, total_seats, gesture_counts):
+        bucket = int(timestamp // self.resolution)
+        slot = bucket % self.capacity
+        if self.bucket[slot] != bucket:
+            self.bucket[slot] = bucket
+            self.samples[slot] = 0
+            self.focus_sum[slot] = self.occupied_sum[slot] = self.seats_sum[slot] = 0
+            self.focus_min[slot] = self.focus_max[slot] = focus_percentage
+            self.gesture_sum[slot] = 0
+        self.samples[slot] += 1
+        self.focus_sum[slot] += focus_percentage
+        self.focus_min[slot] = min(self.focus_min[slot], focus_percentage)
+        self.focus_max[slot] = max(self.focus_max[slot], focus_percentage)
+        self.occupied_sum[slot] += occupied
+        self.seats_sum[slot] += total_seats
+        self.gesture_sum[slot] += gesture_counts
+
+    def oldest(self):
+        """Start time of the oldest bucket still held, or None when empty"""
+        held = self.bucket[self.bucket >= 0]
+        return float(held.min() * self.resolution) if len(held) else None
+
+    def query(self, start, end, max_points=None):
+        """Buckets overlapping [start, end], merged so at most max_points are returned"""
+        first, last = int(start // self.resolution), int(end // self.resolution)
+        slots = np.flatnonzero((self.bucket >= first) & (self.bucket <= last))
+        slots = slots[np.argsort(self.bucket[slots])]
+        if len(slots) == 0:
+            return []
+
+        buckets = self.bucket[slots]
+        factor = max(1, math.ceil((last - first + 1) / max_points)) if max_points else 1
+        groups = (buckets - first) // factor
+        # Boundaries of consecutive runs of the same output bucket
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+
+        samples = np.add.reduceat(self.samples[slots], starts)
+        focus = np.add.reduceat(self.focus_sum[slots], starts) / samples
+        focus_min = np.minimum.reduceat(self.focus_min[slots], starts)
+        focus_max = np.maximum.reduceat(self.focus_max[slots], starts)
+        occupied = np.add.reduceat(self.occupied_sum[slots], starts) / samples
+        seats = np.add.reduceat(self.seats_sum[slots], starts) / samples
+        gestures = np.add.reduceat(self.gesture_sum[slots], starts) / samples[:, None]
+
+        resolution = self.resolution * factor
+        return [
+            {
+                'timestamp': float((first + groups[i] * factor) * self.resolution),
+                'resolution_s': resolution,
+                'samples': int(samples[j]),
+                'focus_percentage': round(float(focus[j]), 2),
+                'focus_min': round(float(focus_min[j]), 2),
+                'focus_max': round(float(focus_max[j]), 2),
+                'occupied_seats': round(float(occupied[j]), 2),
+                'total_seats': round(float(seats[j]), 2),
+                'gesture_counts': {
+                    GESTURE_TYPES[code]: round(float(gestures[j, code]), 2)
+                    for code in np.flatnonzero(gestures[j])
+                }
+            }
+            for j, i in enumerate(starts)
+        ]
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (
+            self.bucket, self.samples, self.focus_sum, self.focus_min, self.focus_max,
+            self.occupied_sum, self.seats_sum, self.gesture_sum
+        ))
+
+
+class SessionFocusSeries:
+    """Focus, occupancy and gesture counts of one session at every rollup resolution"""
+
+    def __init__(self, resolutions=DEFAULT_RESOLUTIONS):
+        self.rings = [RollupRing(resolution, capacity) for resolution, capacity in resolutions]
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def record(self, timestamp, focus_percentage, occupied, total_seats, gesture_counts):
+        with self.lock:
+            for ring in self.rings:
+                ring.add(timestamp, focus_percentage, occupied, total_seats, gesture_counts)
+            self.frames += 1
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            self.last_timestamp = timestamp
+
+    def query(self, start=None, end=None, resolution=None, max_points=500):
+        """
+        Downsampled points for [start, end] (epoch seconds, default the last hour)
+        Without an explicit resolution the finest ring that still covers start is used
+        """
+        end = time.time() if end is None else end
+        start = end - 3600 if start is None else start
+        with self.lock:
+            # Nothing exists before the first frame, so do not pick a coarser ring for it
+            if self.first_timestamp is not None:
+                start = max(start, self.first_timestamp)
+            ring = None
+            if resolution is not None:
+                ring = next((r for r in self.rings if r.resolution == resolution), None)
+                if ring is None:
+                    raise ValueError(f"Unsupported resolution: {resolution}")
+            else:
+                for candidate in self.rings:
+                    oldest = candidate.oldest()
+                    ring = candidate
+                    if oldest is not None and oldest <= start:
+                        break
+            return ring.query(start, end, max_points), ring.resolution
+
+    @property
+    def nbytes(self):
+        return sum(ring.nbytes for ring in self.rings)
+
+
+class FocusHistoryStore:
+    """
+    Thread-safe, size-bounded map of session_id -> SessionFocusSeries
+    on_drop(session_id) is called for sessions dropped or evicted.
+    """
+
+    def __init__(self, max_sessions=256, resolutions=DEFAULT_RESOLUTIONS, on_drop=None):
+        self.max_sessions = max_sessions
+        self.resolutions = resolutions
+        self.on_drop = on_drop
+        self.bytes_per_session = SessionFocusSeries(resolutions).nbytes
+        self._lock = threading.Lock()
+        self._series = OrderedDict()
+
+    def record(self, session_id, summary, gesture_counts, timestamp=None):
+        """Add one frame's summary (see build_frame_result) to the session's history"""
+        evicted = []
+        with self._lock:
+            series = self._series.get(session_id)
+            if series is None:
+                series = self._series[session_id] = SessionFocusSeries(self.resolutions)
+                while len(self._series) > self.max_sessions:
+                    evicted.append(self._series.popitem(last=False)[0])
+            else:
+                self._series.move_to_end(session_id)
+        for dropped in evicted:
+            self._dropped(dropped)
+        series.record(
+            time.time() if timestamp is None else timestamp,
+            summary['focus_percentage'], summary['occupied_seats'], summary['total_seats'], gesture_counts
+        )
+
+    def get(self, session_id):
+        with self._lock:
+            return self._series.get(session_id)
+
+    def drop(self, session_id):
+        with self._lock:
+            self._series.pop(session_id, None)
+        self._dropped(session_id)
+
+    def _dropped(self, session_id):
+        if self.on_drop is not None:
+            self.on_drop(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._series),
+                'bytes_per_session': self.bytes_per_session,
+                'resolutions_s': [resolution for resolution, _ in self.resolutions]
+            }
@@ -0,0 +1,368 @@
+import atexit
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class SharedFrameRing:
+    """
+    Fixed slots in one shared memory block for handing decoded frames to
+    worker processes without pickling them; only the parent allocates slots
+    """
+
+    def __init__(self, slots, slot_bytes):
+        self.slot_bytes = int(slot_bytes)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, slots * self.slot_bytes))
+        self._free = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def put(self, frame, timeout=None):
+        """Copy a frame into a free slot; returns the slot or None if it does not fit"""
+        if frame.nbytes > self.slot_bytes:
+            return None
+        slot = self._free.get(timeout=timeout)
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.memory.buf, offset=slot * self.slot_bytes)
+        view[...] = frame
+        return slot
+
+    def release(self, slot):
+        self._free.put(slot)
+
+    def free_slots(self):
+        return self._free.qsize()
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+def _worker_main(worker_id, memory_name, slot_bytes, tasks, results, threads, max_models):
+    """Worker process: detectors built on 'load' messages, frames read from shared memory"""
+    from detector import YOLODetector
+
+    memory = shared_memory.SharedMemory(name=memory_name)
+    detectors = OrderedDict()
+    load_errors = {}
+    frame = None
+    results.put(('ready', worker_id, None, os.getpid()))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            if task[0] == 'load':
+                _, handle, (model_path, options) = task
+                error = None
+                try:
+                    if not options.get('intra_op_threads'):
+                        options = dict(options, intra_op_threads=threads)
+                    detectors[handle] = YOLODetector(model_path, **options)
+                    if detectors[handle].model_type == 'pytorch':
+                        import torch
+                        torch.set_num_threads(threads)
+                    while len(detectors) > max_models:
+                        detectors.popitem(last=False)
+                    load_errors.pop(handle, None)
+                except Exception as e:
+                    error = load_errors[handle] = str(e)
+                results.put(('loaded', worker_id, handle, error))
+                continue
+
+            _, job_id, handle, slot, shape, dtype, frame, seat_positions = task
+            try:
+                detector = detectors.get(handle)
+                if detector is None:
+                    raise RuntimeError(load_errors.get(handle, 'model is not loaded in this worker'))
+                detectors.move_to_end(handle)
+                if frame is None:
+                    frame = np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=slot * slot_bytes)
+                results.put(('done', worker_id, job_id, detector.detect_in_seats(frame, seat_positions)))
+            except Exception as e:
+                results.put(('error', worker_id, job_id, str(e)))
+            # Views into the shared block must be gone before it can be closed
+            frame = None
+    finally:
+        frame = None
+        memory.close()
+
+
+class _Worker:
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.process = None
+        self.tasks = None
+        # Each worker gets its own result queue: a worker killed while writing
+        # holds that queue's lock, which would block every other writer
+        self.results = None
+        self.in_flight = {}
+        self.restarts = 0
+        self.jobs = 0
+        self.ready = False
+        # Handles of the replicas the worker holds, least recently used first, and loads under way
+        self.models = OrderedDict()
+        self.loading = 0
+        self.load_started = None
+
+
+class InferencePool:
+    """
+    Model replicas in separate processes, fed through shared memory
+    A worker is sent a 'load' message before the first job for a model
+    (keyed by registry handle) and runs detect_in_seats; results come back
+    on a queue per worker. A monitor thread restarts workers that die,
+    exceed job_timeout on a job or load_timeout on a model load, failing
+    the jobs they held. Jobs queued behind a load start their job_timeout
+    clock once the replica is ready. Started lazily like InferenceScheduler,
+    so importing the app in a worker or before forking does not spawn
+    processes.
+    """
+
+    def __init__(self, workers=2, slots_per_worker=2, slot_bytes=1920 * 1080 * 3, job_timeout=30.0, max_models=2,
+                 load_timeout=300.0):
+        self.size = max(1, int(workers))
+        self.slots = self.size * max(1, int(slots_per_worker))
+        self.slot_bytes = int(slot_bytes)
+        self.job_timeout = job_timeout
+        self.load_timeout = load_timeout
+        # Replicas each worker keeps; older models are dropped least recently used first
+        self.max_models = max(1, int(max_models))
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.size)
+
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._running = False
+        self._job_ids = itertools.count()
+        self._futures = {}
+        self._workers = []
+        self.ring = None
+
+        self.jobs = 0
+        self.failures = 0
+        self.restarts = 0
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self.ring = SharedFrameRing(self.slots, self.slot_bytes)
+            self._workers = [_Worker(i) for i in range(self.size)]
+            self._running = True
+            for worker in self._workers:
+                self._spawn(worker)
+
+        atexit.register(self.stop)
+        threading.Thread(target=self._monitor, name='inference-pool-monitor', daemon=True).start()
+        logger.info(f"Inference pool started: {self.size} workers, {self.slots} shared frame slots")
+
+    def _spawn(self, worker):
+        if worker.tasks is not None:
+            # Whatever is still buffered for the old process is dropped, not flushed at exit
+            worker.tasks.cancel_join_thread()
+        worker.tasks = self._context.Queue()
+        worker.results = self._context.Queue()
+        worker.ready = False
+        worker.models.clear()
+        worker.loading = 0
+        worker.load_started = None
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.worker_id, self.ring.name, self.slot_bytes, worker.tasks, worker.results,
+                  self.threads_per_worker, self.max_models),
+            name=f'inference-worker-{worker.worker_id}', daemon=True
+        )
+        worker.process.start()
+        threading.Thread(target=self._collect, args=(worker, worker.results),
+                         name=f'inference-pool-results-{worker.worker_id}', daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            workers = list(self._workers)
+        for worker in workers:
+            worker.tasks.put(None)
+        for worker in workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.tasks.cancel_join_thread()
+        self.ring.close()
+
+    def submit(self, detector, frame, seat_positions):
+        """
+        Queue one frame for the least busy worker and return a Future
+        Workers build their replica from the detector's model_path and options,
+        loaded through a 'load' message the first time a worker sees the model.
+        Wait for it with result(), which bounds the wait.
+        """
+        if not self._running:
+            self.start()
+        handle = ModelRegistry.make_handle(detector.model_path, detector.options)
+        spec = (detector.model_path, detector.options)
+
+        try:
+            slot = self.ring.put(frame, timeout=self.job_timeout)
+        except queue.Empty:
+            raise RuntimeError('Inference pool has no free frame slot')
+        future = Future()
+        with self._lock:
+            job_id = next(self._job_ids)
+            worker = min(self._workers, key=lambda w: len(w.in_flight))
+            if handle in worker.models:
+                worker.models.move_to_end(handle)
+            else:
+                # Mirrors the worker's own least recently used eviction
+                worker.models[handle] = True
+                while len(worker.models) > self.max_models:
+                    worker.models.popitem(last=False)
+                if not worker.loading:
+                    worker.load_started = time.monotonic()
+                worker.loading += 1
+                worker.tasks.put(('load', handle, spec))
+            worker.in_flight[job_id] = (slot, time.monotonic())
+            # Give up after the job timeout, plus the load timeout when queued behind a load
+            future.timeout = self.job_timeout + (self.load_timeout if worker.loading else 0)
+            worker.jobs += 1
+            self._futures[job_id] = future
+            self.jobs += 1
+            # Frames larger than a slot are pickled instead
+            payload = frame if slot is None else None
+            worker.tasks.put(('job', job_id, handle, slot, frame.shape, frame.dtype.str, payload, seat_positions))
+        return future
+
+    def detect(self, detector, frame, seat_positions):
+        """Blocking helper with the same result as detector.detect_in_seats"""
+        return self.result(self.submit(detector, frame, seat_positions))
+
+    def result(self, future):
+        """Result of a submitted job; RuntimeError if it does not finish in time"""
+        try:
+            return future.result(timeout=future.timeout)
+        except FutureTimeoutError:
+            raise RuntimeError(f'Inference pool job did not finish within {future.timeout:g} s')
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._futures)
+
+    def _finish(self, worker, job_id, result=None, error=None):
+        with self._lock:
+            slot, _ = worker.in_flight.pop(job_id, (None, None))
+            future = self._futures.pop(job_id, None)
+            if error is not None:
+                self.failures += 1
+        if slot is not None:
+            self.ring.release(slot)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def _loaded(self, worker, handle, error):
+        with self._lock:
+            worker.loading = max(0, worker.loading - 1)
+            worker.load_started = time.monotonic() if worker.loading else None
+            if error is not None:
+                # Retried with the next job for this model
+                worker.models.pop(handle, None)
+                logger.error(f"Inference worker {worker.worker_id} failed to load {handle}: {error}")
+            if not worker.loading:
+                # Jobs queued behind the load start their clock now
+                now = time.monotonic()
+                for job_id, (slot, _) in worker.in_flight.items():
+                    worker.in_flight[job_id] = (slot, now)
+
+    def _collect(self, worker, results):
+        # Ends when the pool stops or the worker is respawned with a new queue
+        while self._running and worker.results is results:
+            try:
+                kind, _, job_id, payload = results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if kind == 'ready':
+                worker.ready = True
+            elif kind == 'loaded':
+                self._loaded(worker, job_id, payload)
+            elif kind == 'done':
+                self._finish(worker, job_id, result=payload)
+            else:
+                self._finish(worker, job_id, error=payload)
+
+    def _monitor(self, interval=1.0):
+        while self._running:
+            time.sleep(interval)
+            now = time.monotonic()
+            for worker in list(self._workers):
+                with self._lock:
+                    if worker.loading:
+                        stuck = now - worker.load_started > self.load_timeout
+                    else:
+                        stuck = any(now - started > self.job_timeout for _, started in worker.in_flight.values())
+                    loading = worker.loading
+                alive = worker.process.is_alive()
+                if alive and not stuck:
+                    continue
+
+                if not alive:
+                    reason = f'exited with code {worker.process.exitcode}'
+                else:
+                    reason = 'timed out loading a model' if loading else 'timed out'
+                logger.error(f"Inference worker {worker.worker_id} {reason}, restarting")
+                if alive:
+                    worker.process.kill()
+                    worker.process.join(timeout=5)
+                for job_id in list(worker.in_flight):
+                    self._finish(worker, job_id, error=f'inference worker {worker.worker_id} {reason}')
+                with self._lock:
+                    if not self._running:
+                        return
+                    worker.restarts += 1
+                    self.restarts += 1
+                    self._spawn(worker)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': True,
+                'running': self._running,
+                'workers': [
+                    {
+                        'worker_id': worker.worker_id,
+                        'pid': worker.process.pid if worker.process else None,
+                        'alive': bool(worker.process and worker.process.is_alive()),
+                        'ready': worker.ready,
+                        'models': len(worker.models),
+                        'loading': worker.loading,
+                        'in_flight': len(worker.in_flight),
+                        'jobs': worker.jobs,
+                        'restarts': worker.restarts
+                    }
+                    for worker in self._workers
+                ],
+                'threads_per_worker': self.threads_per_worker,
+                'free_slots': self.ring.free_slots() if self.ring else self.slots,
+                'jobs': self.jobs,
+                'failures': self.failures,
+                'restarts': self.restarts
+            }
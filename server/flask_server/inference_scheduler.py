@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+import logging
+from collections import defaultdict
+from concurrent.futures import Future
+
+from metrics import session_context
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ('detector', 'frame', 'seat_positions', 'future', 'enqueued_at')
+
+    def __init__(self, detector, frame, seat_positions):
+        self.detector = detector
+        self.frame = frame
+        self.seat_positions = seat_positions
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class InferenceScheduler:
+    """
+    Dynamic micro-batching across concurrent detect-frame requests
+    Request threads submit (detector, frame, seats) jobs and wait on a future.
+    A dedicated worker collects jobs until max_batch_size is reached or
+    max_wait_ms has passed since the first one, groups them per detector and
+    runs each group through YOLODetector.detect_batch in one call.
+    """
+
+    def __init__(self, max_batch_size=8, max_wait_ms=10):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._running = False
+
+        self.batches = 0
+        self.jobs = 0
+        self.batch_size_histogram = defaultdict(int)
+        self.total_wait_ms = 0.0
+        self.max_observed_wait_ms = 0.0
+
+    def start(self):
+        # Started lazily so pre-forking servers do not inherit a dead thread
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._worker = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+        self._queue.put(None)
+
+    def submit(self, detector, frame, seat_positions):
+        if not self._running:
+            self.start()
+        job = _Job(detector, frame, seat_positions)
+        self._queue.put(job)
+        return job.future
+
+    def detect(self, detector, frame, seat_positions, timeout=None):
+        """Blocking helper with the same result as detector.detect_in_seats"""
+        return self.submit(detector, frame, seat_positions).result(timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+
+        jobs = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(jobs) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                self._running = False
+                break
+            jobs.append(job)
+        return jobs
+
+    def _run(self):
+        while self._running:
+            jobs = self._collect()
+            if not jobs:
+                continue
+
+            # Jobs for different models cannot share a forward pass
+            groups = defaultdict(list)
+            for job in jobs:
+                groups[id(job.detector)].append(job)
+
+            for group in groups.values():
+                self._run_group(group)
+
+    def _run_group(self, group):
+        started = time.perf_counter()
+        waits = [(started - job.enqueued_at) * 1000 for job in group]
+
+        with self._lock:
+            self.batches += 1
+            self.jobs += len(group)
+            self.batch_size_histogram[len(group)] += 1
+            self.total_wait_ms += sum(waits)
+            self.max_observed_wait_ms = max(self.max_observed_wait_ms, max(waits))
+
+        detector = group[0].detector
+        try:
+            # Stage metrics from a shared batch cannot be attributed to one session
+            with session_context('batched', detector.model_type):
+                results = detector.detect_batch(
+                    [(job.frame, job.seat_positions) for job in group]
+                )
+        except Exception as e:
+            logger.error(f"Batched inference failed for {len(group)} frames: {e}")
+            for job in group:
+                job.future.set_exception(e)
+            return
+
+        for job, result in zip(group, results):
+            job.future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': True,
+                'running': self._running,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'queue_depth': self.queue_depth(),
+                'batches': self.batches,
+                'jobs': self.jobs,
+                'mean_batch_size': self.jobs / self.batches if self.batches else 0,
+                'mean_queue_wait_ms': self.total_wait_ms / self.jobs if self.jobs else 0,
+                'max_queue_wait_ms': self.max_observed_wait_ms,
+                'batch_size_histogram': {str(size): count for size, count in sorted(self.batch_size_histogram.items())}
+            }
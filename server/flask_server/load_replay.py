@@ -0,0 +1,276 @@
+"""
+Capacity test: replay classroom sessions against /api/detect-frame
+
+Each simulated classroom is a thread that posts a JPEG frame every
+--interval seconds, one request in flight at a time like the frontend. A
+frame whose send time has already passed by a full interval when the
+previous response arrives is dropped, as a camera would. Every concurrency
+level runs for --duration seconds and reports throughput, latency
+percentiles, error rate and dropped frames.
+
+By default requests go through Flask's test client in this process, with the
+mock model in its seeded, vectorized simulate mode, so only the request
+pipeline is measured. --url drives a running server instead (with whatever
+model it has, unless --model is given).
+
+    python load_replay.py --concurrency 1,4,16,32 --seats 40 --interval 0.5
+    python load_replay.py --url http://localhost:5001 --model models/best.onnx --frames lecture.mp4 --output load.json
+
+Frames are synthetic unless --frames names a video or a folder of images.
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from bench_pipeline import parse_resolutions, seat_grid, synthetic_frame
+from model_cache import list_images
+
+
+def load_frames(source, resolution, seat_positions, count, seed):
+    """JPEG bytes of up to count recorded frames (video or image folder), or synthetic ones"""
+    width, height = resolution
+    frames = []
+    if source and os.path.isdir(source):
+        frames = [cv2.imread(path, cv2.IMREAD_COLOR) for path in list_images(source, count)]
+    elif source:
+        capture = cv2.VideoCapture(source)
+        while len(frames) < count:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+        capture.release()
+    else:
+        rng = np.random.default_rng(seed)
+        frames = [synthetic_frame(width, height, seat_positions, rng) for _ in range(count)]
+
+    frames = [cv2.resize(frame, (width, height)) for frame in frames if frame is not None]
+    if not frames:
+        raise ValueError(f"No frames could be read from {source}")
+    return [cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes() for frame in frames]
+
+
+class TestClientTransport:
+    """Posts through Flask's test client; one client per session thread"""
+
+    def __init__(self):
+        from app import app
+        self.app = app
+
+    def client(self):
+        test_client = self.app.test_client()
+
+        def post(path, body):
+            response = test_client.post(path, json=body)
+            return response.status_code, response.get_json(silent=True)
+        return post
+
+
+class HttpTransport:
+    """Posts JSON to a running server with urllib"""
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def client(self):
+        def post(path, body):
+            request = urllib.request.Request(
+                self.url + path, data=json.dumps(body).encode('utf-8'),
+                headers={'Content-Type': 'application/json'}, method='POST'
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return response.status, json.loads(response.read() or b'null')
+            except urllib.error.HTTPError as e:
+                return e.code, None
+        return post
+
+
+def run_session(post, session_id, frames, seat_positions, interval, deadline, stats, offset):
+    """One classroom: a frame every interval until the deadline, dropping frames it falls behind on"""
+    payloads = ['data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii') for jpeg in frames]
+    # Stagger session start times so the levels do not begin with a burst
+    next_send = time.perf_counter() + offset
+    index = 0
+    while next_send < deadline:
+        now = time.perf_counter()
+        if now < next_send:
+            time.sleep(next_send - now)
+        elif now - next_send >= interval:
+            missed = int((now - next_send) // interval)
+            stats['dropped'] += missed
+            next_send += missed * interval
+            index += missed
+
+        started = time.perf_counter()
+        try:
+            status, _ = post('/api/detect-frame', {
+                'frame_data': payloads[index % len(payloads)],
+                'seat_positions': seat_positions,
+                'session_id': session_id
+            })
+        except Exception:
+            status = None
+        latency = time.perf_counter() - started
+
+        stats['sent'] += 1
+        if status == 200:
+            stats['latencies'].append(latency)
+        else:
+            stats['errors'] += 1
+            stats['status_codes'][str(status)] = stats['status_codes'].get(str(status), 0) + 1
+        index += 1
+        next_send += interval
+
+
+def run_level(transport, sessions, frames, seat_positions, interval, duration, level_id):
+    started = time.perf_counter()
+    deadline = started + duration
+    per_session = [{'sent': 0, 'errors': 0, 'dropped': 0, 'latencies': [], 'status_codes': {}} for _ in range(sessions)]
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(transport.client(), f'load-{level_id}-{i}', frames, seat_positions, interval, deadline,
+                  per_session[i], interval * i / sessions),
+            name=f'load-session-{i}', daemon=True
+        )
+        for i in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([l for s in per_session for l in s['latencies']], dtype=np.float64) * 1000
+    sent = sum(s['sent'] for s in per_session)
+    errors = sum(s['errors'] for s in per_session)
+    dropped = sum(s['dropped'] for s in per_session)
+    status_codes = {}
+    for s in per_session:
+        for code, count in s['status_codes'].items():
+            status_codes[code] = status_codes.get(code, 0) + count
+
+    def percentile(q):
+        return float(np.percentile(latencies, q)) if len(latencies) else None
+
+    return {
+        'sessions': sessions,
+        'offered_fps': sessions / interval,
+        'elapsed_s': elapsed,
+        'sent': sent,
+        'completed': int(len(latencies)),
+        'throughput_fps': len(latencies) / elapsed,
+        'mean_ms': float(latencies.mean()) if len(latencies) else None,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': float(latencies.max()) if len(latencies) else None,
+        'errors': errors,
+        'error_rate': errors / sent if sent else 0.0,
+        'error_status_codes': status_codes,
+        'dropped_frames': dropped,
+        'drop_rate': dropped / (sent + dropped) if sent + dropped else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay concurrent classroom sessions against /api/detect-frame')
+    parser.add_argument('--url', help='running server to drive (default: in-process Flask test client)')
+    parser.add_argument('--model', help='model to initialize first (default in-process: seeded mock model)')
+    parser.add_argument('--inference-mode', default='per_seat', choices=('per_seat', 'whole_frame', 'batched_roi', 'tiled'))
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='comma-separated session counts')
+    parser.add_argument('--seats', type=int, default=40, help='seats per classroom')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between frames per session')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per concurrency level')
+    parser.add_argument('--resolution', default='1280x720', help='WxH of the frames sent')
+    parser.add_argument('--frames', help='video file or image folder to replay (default: synthetic)')
+    parser.add_argument('--frame-count', type=int, default=16, help='distinct frames cycled through')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    width, height = parse_resolutions(args.resolution)[0]
+    seat_positions = seat_grid(width, height, args.seats)
+    frames = load_frames(args.frames, (width, height), seat_positions, args.frame_count, args.seed)
+
+    if args.url:
+        transport = HttpTransport(args.url)
+    else:
+        # In-process runs log to the console only, not to flask_server.log
+        os.environ.setdefault('LOG_FILE', '')
+        from app import log_listener
+
+        # Per-request logging would dominate an in-process run, and stdout holds the report
+        logging.getLogger().setLevel(logging.WARNING)
+        for handler in log_listener.handlers:
+            if isinstance(handler, logging.StreamHandler) and getattr(handler, 'stream', None) is sys.stdout:
+                handler.setStream(sys.stderr)
+        transport = TestClientTransport()
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = args.model
+        if model_path is None and not args.url:
+            # Any existing file with an unknown extension loads the mock model
+            model_path = os.path.join(directory, 'load_replay.mock')
+            open(model_path, 'w').close()
+        if model_path is not None:
+            status, body = transport.client()('/api/initialize-model', {
+                'model_path': os.path.abspath(model_path),
+                'inference_mode': args.inference_mode,
+                'simulation_seed': args.seed,
+                'wait': True
+            })
+            if status != 200:
+                parser.error(f"Model initialization failed ({status}): {body and body.get('message')}")
+
+        levels = []
+        for level_id, sessions in enumerate(int(c) for c in args.concurrency.split(',') if c):
+            result = run_level(transport, sessions, frames, seat_positions, args.interval, args.duration, level_id)
+            levels.append(result)
+            print(f"{sessions:4d} sessions: {result['throughput_fps']:7.1f} frames/s, "
+                  f"p50 {result['p50_ms'] or 0:7.1f} ms, p99 {result['p99_ms'] or 0:7.1f} ms, "
+                  f"{result['error_rate'] * 100:.1f}% errors, {result['drop_rate'] * 100:.1f}% dropped", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'target': args.url or 'test_client',
+            'model': args.model or 'mock (seeded simulation)',
+            'inference_mode': args.inference_mode,
+            'seats': args.seats,
+            'interval_s': args.interval,
+            'duration_s': args.duration,
+            'resolution': f'{width}x{height}',
+            'frames': args.frames or 'synthetic',
+            'frame_count': len(frames),
+            'jpeg_bytes_mean': int(np.mean([len(f) for f in frames])),
+            'seed': args.seed,
+            'cpu_count': os.cpu_count()
+        },
+        'levels': levels
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond decode up to slow model loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_context = threading.local()
+
+
+def current_session():
+    """Session id bound to the current thread by session_context, if any"""
+    return getattr(_context, 'session_id', None)
+
+
+def current_model_type():
+    return getattr(_context, 'model_type', None)
+
+
+@contextmanager
+def session_context(session_id, model_type=None):
+    """Label metrics and log records from this thread with a session and model type"""
+    previous = (current_session(), current_model_type())
+    _context.session_id, _context.model_type = session_id, model_type
+    try:
+        yield
+    finally:
+        _context.session_id, _context.model_type = previous
+
+
+@contextmanager
+def suppress_metrics():
+    """Drop StageTimer observations made from this thread, e.g. while a model warms up"""
+    previous = getattr(_context, 'suppressed', False)
+    _context.suppressed = True
+    try:
+        yield
+    finally:
+        _context.suppressed = previous
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.label_names, key)} {value:g}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram rendered in the Prometheus text format"""
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def remove(self, **labels):
+        """Drop every series whose labels match all of the given values"""
+        positions = [(self.label_names.index(name), str(value)) for name, value in labels.items()]
+        with self._lock:
+            for key in [key for key in self._series if all(str(key[i]) == value for i, value in positions)]:
+                del self._series[key]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.label_names, key, f'le="{bound:g}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {total:.6f}')
+                lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {count}')
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge',
+                f'{self.name} {float(self.read()):g}']
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    """
+    Per-stage latency histogram labelled by stage, model type and session
+    Session and model type default to the thread's session_context, so code
+    deep inside the detector can time stages without knowing the request.
+    With include_session, call forget() when a session ends so its series
+    do not accumulate; set include_session=False to keep label cardinality bounded.
+    """
+
+    def __init__(self, histogram, include_session=True):
+        self.histogram = histogram
+        self.include_session = include_session
+
+    @contextmanager
+    def time(self, stage, model_type=None, session_id=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, model_type, session_id)
+
+    def observe(self, stage, seconds, model_type=None, session_id=None):
+        if getattr(_context, 'suppressed', False):
+            return
+        session = session_id if session_id is not None else current_session()
+        self.histogram.observe(
+            seconds,
+            stage=stage,
+            model_type=model_type or current_model_type() or 'unknown',
+            session=(session or 'none') if self.include_session else 'all'
+        )
+
+    def forget(self, session_id):
+        """Remove the series of a session that has ended"""
+        if self.include_session:
+            self.histogram.remove(session=session_id)
+
+
+class SessionSamplingFilter(logging.Filter):
+    """
+    Pass only every Nth DEBUG/INFO record per session; warnings and errors
+    always pass. The session comes from the record's session_id attribute
+    or the thread's session_context.
+    """
+
+    def __init__(self, sample_every=1):
+        super().__init__()
+        self.sample_every = max(1, int(sample_every))
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+
+    def filter(self, record):
+        if self.sample_every == 1 or record.levelno >= logging.WARNING:
+            return True
+        session = getattr(record, 'session_id', None) or current_session()
+        if session is None:
+            return True
+        with self._lock:
+            self._counts[session] += 1
+            if len(self._counts) > 4096:
+                self._counts.clear()
+            return self._counts[session] % self.sample_every == 1
+
+
+def setup_queue_logging(handlers, level=logging.INFO, fmt='%(asctime)s - %(levelname)s - %(message)s',
+                        sample_every=1):
+    """
+    Route all logging through a QueueHandler so request threads never block
+    on file or console I/O; a QueueListener thread writes to the real handlers
+    Returns the started listener
+    """
+    log_queue = queue.SimpleQueue()
+    formatter = logging.Formatter(fmt)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SessionSamplingFilter(sample_every))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Flush queued records on interpreter exit
+    atexit.register(listener.stop)
+    return listener
+
+
+def restart_queue_logging(listener):
+    """Start a new listener thread in a forked child; the parent's thread does not survive fork"""
+    listener._thread = None
+    listener.start()
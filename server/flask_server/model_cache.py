@@ -0,0 +1,187 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'MODEL_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_cache')
+)
+
+_digest_lock = threading.Lock()
+_digests = {}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    SHA-256 of a file's content, memoised on (path, size, mtime) so repeated
+    initializations of the same model do not re-read it
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        if key in _digests:
+            return _digests[key]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    with _digest_lock:
+        _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+
+class ArtifactCache:
+    """
+    Converted model artifacts on disk, keyed by the source model's content
+    hash and the conversion settings, e.g. <sha256[:16]>-640.onnx
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # Targets whose conversion failed are not retried on every initialization
+        self._failed = set()
+
+    def path_for(self, model_path, tag, extension):
+        return os.path.join(self.directory, f"{file_digest(model_path)[:16]}-{tag}{extension}")
+
+    def lookup(self, model_path, tag, extension):
+        """Path of the cached artifact, or None if it has not been built yet"""
+        path = self.path_for(model_path, tag, extension)
+        return path if os.path.isfile(path) else None
+
+    def build(self, model_path, tag, extension, convert):
+        """
+        Convert model_path with convert(source_copy, work_dir) -> artifact path
+        and move the result into the cache atomically
+        The converter runs on a private copy of the model because exporters
+        such as ultralytics write their output next to the source file
+        """
+        target = self.path_for(model_path, tag, extension)
+        with self._lock:
+            if os.path.isfile(target):
+                return target
+            if target in self._failed:
+                raise RuntimeError(f"Conversion of {model_path} failed earlier")
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                with tempfile.TemporaryDirectory(dir=self.directory) as work_dir:
+                    source = os.path.join(work_dir, os.path.basename(model_path))
+                    shutil.copyfile(model_path, source)
+                    artifact = convert(source, work_dir)
+                    os.replace(artifact, target)
+            except ImportError:
+                raise
+            except Exception:
+                self._failed.add(target)
+                raise
+        logger.info(f"Cached converted model artifact {target}")
+        return target
+
+
+def export_ultralytics_onnx(input_size):
+    """
+    Converter for ArtifactCache.build exporting an ultralytics .pt checkpoint
+    to ONNX with a dynamic batch axis, so stacked crops run in one call
+    """
+    def convert(source, work_dir):
+        from ultralytics import YOLO
+        return YOLO(source).export(format='onnx', imgsz=input_size, dynamic=True, simplify=False, verbose=False)
+    return convert
+
+
+QUANTIZATION_MODES = ('dynamic', 'static')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def list_images(folder, limit=None):
+    """Sorted image files in folder (not recursive), at most limit of them"""
+    paths = sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def folder_digest(paths):
+    """Short hash of file names, sizes and mtimes, to key artifacts calibrated on them"""
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+    return digest.hexdigest()[:8]
+
+
+def quantized_cache_for(model_path, fallback):
+    """
+    Quantized artifacts live next to the model so they travel with it;
+    read-only model folders fall back to the shared cache
+    """
+    directory = os.path.dirname(os.path.abspath(model_path))
+    return ArtifactCache(directory) if os.access(directory, os.W_OK) else fallback
+
+
+def quantize_onnx(mode, calibration_images=None, preprocess=None):
+    """
+    Converter for ArtifactCache.build producing an INT8 copy of an FP32 ONNX model
+    dynamic quantizes weights only; static also quantizes activations with
+    ranges calibrated by running preprocess(image) over calibration_images.
+    Only Conv and MatMul are quantized so the box decoding at the end of
+    YOLO heads stays in float.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    if mode == 'static' and not calibration_images:
+        raise ValueError("Static quantization needs calibration images")
+
+    def convert(source, work_dir):
+        import onnxruntime.quantization as q
+
+        try:
+            # Shape inference and fusions give the quantizer a cleaner graph; optional
+            prepared = os.path.join(work_dir, 'prepared.onnx')
+            q.quant_pre_process(source, prepared, skip_symbolic_shape=True)
+            source = prepared
+        except Exception as e:
+            logger.info(f"Quantization pre-processing skipped: {e}")
+
+        target = os.path.join(work_dir, f'int8-{mode}.onnx')
+        if mode == 'dynamic':
+            q.quantize_dynamic(source, target, weight_type=q.QuantType.QUInt8, op_types_to_quantize=['Conv', 'MatMul'])
+        else:
+            q.quantize_static(
+                source, target, ImageCalibrationReader(source, calibration_images, preprocess),
+                quant_format=q.QuantFormat.QDQ, activation_type=q.QuantType.QUInt8,
+                weight_type=q.QuantType.QInt8, per_channel=True, op_types_to_quantize=['Conv', 'MatMul']
+            )
+        return target
+    return convert
+
+
+class ImageCalibrationReader:
+    """onnxruntime CalibrationDataReader feeding preprocessed images one at a time"""
+
+    def __init__(self, model_path, image_paths, preprocess):
+        import onnxruntime as ort
+
+        session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.input_name = session.get_inputs()[0].name
+        self.preprocess = preprocess
+        self._paths = iter(image_paths)
+
+    def get_next(self):
+        import cv2
+
+        for path in self._paths:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                logger.warning(f"Skipping unreadable calibration image {path}")
+                continue
+            return {self.input_name: self.preprocess(image)}
+        return None
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotLoadedError(KeyError):
+    """Raised when a handle does not refer to a loaded model"""
+
+
+class ModelEntry:
+    """A loaded detector plus the bookkeeping the registry needs for LRU eviction"""
+
+    def __init__(self, handle, detector, config, size_bytes):
+        self.handle = handle
+        self.detector = detector
+        self.config = config
+        self.size_bytes = size_bytes
+        self.in_use = 0
+        self.loaded_at = time.time()
+        self.last_used = time.time()
+        self.requests = 0
+
+    def stats(self):
+        return {
+            'model_handle': self.handle,
+            'model_path': self.config.get('model_path'),
+            'model_type': self.detector.model_type,
+            'size_mb': round(self.size_bytes / (1024 * 1024), 2),
+            'in_use': self.in_use,
+            'requests': self.requests,
+            'loaded_at': self.loaded_at,
+            'last_used': self.last_used
+        }
+
+
+class LoadJob:
+    """A model load running in the background, pollable by job id"""
+
+    def __init__(self, model_path, options, generation):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.model_path = model_path
+        self.options = options
+        self.generation = generation
+        self.handle = ModelRegistry.make_handle(model_path, options)
+        self.status = 'pending'
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+
+    @property
+    def pending(self):
+        return self.status in ('pending', 'loading')
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def stats(self):
+        return {
+            'job_id': self.job_id,
+            'model_handle': self.handle,
+            'model_path': self.model_path,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+
+class ModelRegistry:
+    """
+    Thread-safe cache of loaded detectors keyed by model path and options
+    Sessions refer to models through a handle. Idle models are evicted in
+    least-recently-used order once the estimated memory exceeds the budget;
+    models with detections in flight, the default model and models bound
+    to a session are never evicted.
+    """
+
+    def __init__(self, factory, memory_budget_mb=2048):
+        self.factory = factory
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._entries = {}
+        self._sessions = {}
+        self._default_handle = None
+        self._jobs = OrderedDict()
+        self._generation = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_handle(model_path, options):
+        key = json.dumps({'model_path': os.path.abspath(model_path), **options}, sort_keys=True, default=str)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+
+    def load(self, model_path, options, config=None):
+        """Return the handle for model_path/options, loading the detector if needed"""
+        handle = self.make_handle(model_path, options)
+
+        with self._lock:
+            if handle in self._entries:
+                self._entries[handle].last_used = time.time()
+                return handle, False
+
+        # Loads are serialised so the same model is never loaded twice at once
+        with self._load_lock:
+            with self._lock:
+                if handle in self._entries:
+                    return handle, False
+
+            detector = self.factory(model_path, **options)
+            size_bytes = getattr(detector, 'model_size_bytes', 0)
+            entry = ModelEntry(handle, detector, dict(config or {}, model_handle=handle), size_bytes)
+
+            with self._lock:
+                self._entries[handle] = entry
+                self._evict(keep=handle)
+
+        logger.info(f"Registered model {handle} ({detector.model_type}, {size_bytes / (1024 * 1024):.1f} MB)")
+        return handle, True
+
+    def load_async(self, model_path, options, config=None, on_ready=None, max_jobs=64):
+        """
+        Load (and warm up) a detector on a background thread
+        on_ready(handle) runs once the detector is registered, which is where
+        callers swap it in; requests already holding the previous detector
+        finish on it. Returns the LoadJob, reusing a pending job for the same
+        model and options.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.pending and job.handle == self.make_handle(model_path, options):
+                    return job
+            job = LoadJob(model_path, options, self._generation)
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > max_jobs:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest].pending:
+                    break
+                self._jobs.pop(oldest)
+
+        thread = threading.Thread(
+            target=self._run_job, args=(job, config, on_ready), name=f'model-load-{job.job_id}', daemon=True
+        )
+        thread.start()
+        return job
+
+    def _run_job(self, job, config, on_ready):
+        job.status = 'loading'
+        try:
+            handle, _ = self.load(job.model_path, job.options, config)
+            with self._lock:
+                # stop-model cleared the registry while this job was loading
+                if job.generation != self._generation:
+                    job.status = 'cancelled'
+                    self._remove(handle)
+                    return
+            if on_ready is not None:
+                on_ready(handle)
+            job.status = 'ready'
+        except Exception as e:
+            logger.error(f"Background load of {job.model_path} failed: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+
+    def job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def loading(self):
+        """True while any background load is still running"""
+        with self._lock:
+            return any(job.pending for job in self._jobs.values())
+
+    def _evict(self, keep=None):
+        """Drop idle entries, oldest first, until the memory budget is met"""
+        while self.total_bytes() > self.memory_budget_bytes:
+            # The next frame of the default or a bound session would otherwise reload it on the request path
+            pinned = {keep, self._default_handle, *self._sessions.values()}
+            idle = [
+                entry for entry in self._entries.values()
+                if entry.in_use == 0 and entry.handle not in pinned
+            ]
+            if not idle:
+                break
+            victim = min(idle, key=lambda entry: entry.last_used)
+            self._remove(victim.handle)
+            self.evictions += 1
+            logger.info(f"Evicted idle model {victim.handle} ({victim.config.get('model_path')})")
+
+    def _remove(self, handle):
+        self._entries.pop(handle, None)
+        self._sessions = {s: h for s, h in self._sessions.items() if h != handle}
+        if self._default_handle == handle:
+            self._default_handle = None
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._entries.values())
+
+    def resolve(self, handle=None, session_id=None):
+        """Pick an explicit handle, then the session's binding, then the default"""
+        with self._lock:
+            if handle:
+                return handle
+            if session_id is not None and session_id in self._sessions:
+                return self._sessions[session_id]
+            return self._default_handle
+
+    @contextmanager
+    def acquire(self, handle):
+        """
+        Borrow a detector for the duration of a detection
+        Raises ModelNotLoadedError when the handle is unknown or was evicted
+        """
+        with self._lock:
+            entry = self._entries.get(handle) if handle else None
+            if entry is None:
+                raise ModelNotLoadedError(handle)
+            entry.in_use += 1
+            entry.requests += 1
+            entry.last_used = time.time()
+        try:
+            yield entry.detector
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def get(self, handle):
+        with self._lock:
+            return self._entries.get(handle) if handle else None
+
+    def set_default(self, handle):
+        with self._lock:
+            self._default_handle = handle
+
+    @property
+    def default_handle(self):
+        with self._lock:
+            return self._default_handle
+
+    def bind_session(self, session_id, handle):
+        with self._lock:
+            self._sessions[session_id] = handle
+
+    def unbind_session(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def remove(self, handle):
+        with self._lock:
+            existed = handle in self._entries
+            self._remove(handle)
+            return existed
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._sessions.clear()
+            self._default_handle = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def detectors(self):
+        with self._lock:
+            return [entry.detector for entry in self._entries.values()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'models': [entry.stats() for entry in self._entries.values()],
+                'default_handle': self._default_handle,
+                'sessions': dict(self._sessions),
+                'total_mb': round(self.total_bytes() / (1024 * 1024), 2),
+                'memory_budget_mb': round(self.memory_budget_bytes / (1024 * 1024), 2),
+                'evictions': self.evictions,
+                'load_jobs': [job.stats() for job in self._jobs.values()]
+            }
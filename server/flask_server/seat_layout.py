@@ -0,0 +1,253 @@
+import contextlib
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def letterbox_plan(height, width, size):
+    """(scale, new_w, new_h, pad_x, pad_y) fitting a height x width image into a size x size square"""
+    scale = min(size / height, size / width)
+    new_w, new_h = max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+    return scale, new_w, new_h, (size - new_w) // 2, (size - new_h) // 2
+
+
+def letterbox_into(image, plan, out, pad_value=114, padded=False):
+    """
+    Resize image into out as planned; cv2 writes straight into the view of
+    out, so no intermediate image is allocated. The borders around the
+    image are filled unless padded says they already hold pad_value.
+    """
+    _, new_w, new_h, pad_x, pad_y = plan
+    if not padded:
+        out[:pad_y] = pad_value
+        out[pad_y + new_h:] = pad_value
+        out[pad_y:pad_y + new_h, :pad_x] = pad_value
+        out[pad_y:pad_y + new_h, pad_x + new_w:] = pad_value
+    cv2.resize(image, (new_w, new_h), dst=out[pad_y:pad_y + new_h, pad_x:pad_x + new_w],
+               interpolation=cv2.INTER_LINEAR)
+    return out
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """
+    (x1, y1, x2, y2) tiles of at most tile_size x tile_size covering a
+    width x height region; neighbours overlap by at least overlap (a
+    fraction of the tile) and the last row and column end on the border
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(tile_size * (1 - overlap)))
+        count = -(-(length - tile_size) // stride) + 1
+        return np.rint(np.linspace(0, length - tile_size, count)).astype(np.int64).tolist()
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height) for x in starts(width)
+    ]
+
+
+def layout_key(seat_positions):
+    """Hashable identity of a seat layout: ids and coordinates in order"""
+    return tuple((seat['seat_id'], seat['x'], seat['y'], seat['width'], seat['height']) for seat in seat_positions)
+
+
+class CompiledSeatLayout:
+    """
+    A seat layout validated and clipped against one frame size, with the
+    letterbox plan of every seat crop for one model input size
+    Seats need a positive size and are clipped to the frame; seats left
+    empty by clipping are invalid. Coordinates are kept as NumPy arrays
+    (boxes: float xyxy, bounds: integer xyxy) and as plain tuples for
+    slicing, so per-frame code only indexes.
+    """
+
+    def __init__(self, seat_ids, boxes, bounds, valid, frame_shape, input_size):
+        self.seat_ids = seat_ids
+        self.boxes = boxes
+        self.bounds = bounds
+        self.valid = valid
+        self.frame_shape = frame_shape
+        self.input_size = input_size
+        self.valid_indices = np.flatnonzero(valid).tolist()
+
+        # (y1, y2, x1, x2) crop of each seat and the letterbox plan for it, None for invalid seats
+        self.slices = [None] * len(seat_ids)
+        self.plans = [None] * len(seat_ids)
+        if self.valid_indices:
+            kept = bounds[valid].astype(np.float64)
+            widths, heights = kept[:, 2] - kept[:, 0], kept[:, 3] - kept[:, 1]
+            scales = np.minimum(input_size / heights, input_size / widths)
+            new_w = np.maximum(1, np.rint(widths * scales)).astype(np.int64)
+            new_h = np.maximum(1, np.rint(heights * scales)).astype(np.int64)
+            plans = zip(scales.tolist(), new_w.tolist(), new_h.tolist(),
+                        ((input_size - new_w) // 2).tolist(), ((input_size - new_h) // 2).tolist())
+            for idx, (x1, y1, x2, y2), plan in zip(self.valid_indices, bounds[valid].tolist(), plans):
+                self.slices[idx] = (y1, y2, x1, x2)
+                self.plans[idx] = plan
+
+            x1, y1 = bounds[valid, :2].min(axis=0).tolist()
+            x2, y2 = bounds[valid, 2:].max(axis=0).tolist()
+            self.union = (x1, y1, x2, y2)
+            # Letterbox plan for the union region (whole-frame inference)
+            self.union_plan = letterbox_plan(y2 - y1, x2 - x1, input_size)
+        else:
+            self.union = self.union_plan = None
+        self._tiles = {}
+
+    @classmethod
+    def compile(cls, seat_positions, frame_shape, input_size):
+        frame_h, frame_w = frame_shape[:2]
+        xywh = np.array(
+            [[seat['x'], seat['y'], seat['width'], seat['height']] for seat in seat_positions],
+            dtype=np.float64
+        ).reshape(-1, 4)
+        xyxy = xywh.copy()
+        xyxy[:, 2:] += xyxy[:, :2]
+        limits = np.array([frame_w, frame_h, frame_w, frame_h], dtype=np.float64)
+        boxes = np.clip(xyxy, 0, limits)
+        bounds = np.clip(np.floor(xyxy), 0, limits).astype(np.int32)
+        valid = (
+            (xywh[:, 2] > 0) & (xywh[:, 3] > 0) &
+            (bounds[:, 2] > bounds[:, 0]) & (bounds[:, 3] > bounds[:, 1])
+        )
+        return cls([seat['seat_id'] for seat in seat_positions], boxes.astype(np.float32), bounds, valid,
+                   (frame_h, frame_w), input_size)
+
+    def tiles(self, tile_size, overlap):
+        """
+        Overlapping tiles over the union of the seats, in frame coordinates,
+        each with its letterbox plan: [((x1, y1, x2, y2), plan), ...]
+        """
+        key = (tile_size, overlap)
+        tiles = self._tiles.get(key)
+        if tiles is None:
+            tiles = []
+            if self.union is not None:
+                ux1, uy1, ux2, uy2 = self.union
+                for x1, y1, x2, y2 in tile_grid(ux2 - ux1, uy2 - uy1, tile_size, overlap):
+                    tiles.append((
+                        (ux1 + x1, uy1 + y1, ux1 + x2, uy1 + y2),
+                        letterbox_plan(y2 - y1, x2 - x1, self.input_size)
+                    ))
+            self._tiles[key] = tiles
+        return tiles
+
+    def take(self, indices):
+        """The layout restricted to the seats at indices, in that order"""
+        indices = np.asarray(indices, dtype=np.int64)
+        return CompiledSeatLayout([self.seat_ids[i] for i in indices.tolist()], self.boxes[indices],
+                                  self.bounds[indices], self.valid[indices], self.frame_shape, self.input_size)
+
+
+class SeatLayoutStore:
+    """
+    Thread-safe, size-bounded cache of compiled seat layouts keyed by the
+    seats, frame size and model input size
+    Sessions sending the same layout at the same resolution share an entry.
+    A subset of a cached layout's seats (those the change gate leaves for
+    inference) is taken from that layout instead of being compiled again.
+    """
+
+    def __init__(self, max_layouts=256):
+        self.max_layouts = max_layouts
+        self._lock = threading.Lock()
+        self._layouts = OrderedDict()
+        # (frame size, input size, seat) -> (layout key, index in that layout)
+        self._seats = {}
+        self.hits = 0
+        self.subsets = 0
+        self.compiled = 0
+
+    def get(self, seat_positions, frame_shape, input_size):
+        seats = layout_key(seat_positions)
+        shape = tuple(frame_shape[:2])
+        key = (shape, input_size, seats)
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self._layouts.move_to_end(key)
+                self.hits += 1
+                return layout
+
+            found = [self._seats.get((shape, input_size, seat)) for seat in seats]
+            parent = None
+            if seats and all(found) and len({owner for owner, _ in found}) == 1:
+                parent = self._layouts[found[0][0]]
+                self.subsets += 1
+        if parent is not None:
+            return parent.take([idx for _, idx in found])
+
+        layout = CompiledSeatLayout.compile(seat_positions, shape, input_size)
+        with self._lock:
+            self.compiled += 1
+            self._layouts[key] = layout
+            for idx, seat in enumerate(seats):
+                self._seats[(shape, input_size, seat)] = (key, idx)
+            while len(self._layouts) > self.max_layouts:
+                evicted, _ = self._layouts.popitem(last=False)
+                for seat in evicted[2]:
+                    seat_key = (evicted[0], evicted[1], seat)
+                    if self._seats.get(seat_key, (None,))[0] == evicted:
+                        del self._seats[seat_key]
+        return layout
+
+    def clear(self):
+        with self._lock:
+            self._layouts.clear()
+            self._seats.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'layouts': len(self._layouts),
+                'hits': self.hits,
+                'subsets': self.subsets,
+                'compiled': self.compiled
+            }
+
+
+class LetterboxBatch:
+    """
+    Reusable (capacity, size, size, 3) uint8 batch of letterboxed images
+    Each slot remembers where its last image went, so a slot refilled with
+    an image of the same shape only has the resized region rewritten.
+    """
+
+    def __init__(self, capacity, size, pad_value=114):
+        self.images = np.full((capacity, size, size, 3), pad_value, dtype=np.uint8)
+        self.pad_value = pad_value
+        self._regions = [None] * capacity
+
+    def write(self, slot, image, plan):
+        region = plan[1:]
+        previous = self._regions[slot]
+        letterbox_into(image, plan, self.images[slot], self.pad_value,
+                       padded=previous is None or previous == region)
+        self._regions[slot] = region
+
+
+class LetterboxBatchPool:
+    """Batches lent to one caller at a time and kept for reuse, so steady-state frames allocate none"""
+
+    def __init__(self, capacity, size, max_idle=4):
+        self.capacity = capacity
+        self.size = size
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = []
+
+    @contextlib.contextmanager
+    def borrow(self):
+        with self._lock:
+            batch = self._idle.pop() if self._idle else None
+        if batch is None:
+            batch = LetterboxBatch(self.capacity, self.size)
+        try:
+            yield batch
+        finally:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(batch)
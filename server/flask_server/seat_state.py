@@ -0,0 +1,268 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Gesture vocabulary shared by the temporal tracker; index = gesture code
+GESTURE_TYPES = (
+    'focused', 'looking_away', 'sleeping', 'using_phone', 'chatting',
+    'writing', 'yawning', 'absent', 'unknown'
+)
+GESTURE_CODES = {gesture: code for code, gesture in enumerate(GESTURE_TYPES)}
+
+
+def seat_signature(frame, seat, size=16):
+    """Small grayscale thumbnail of a seat ROI, or None for invalid seats"""
+    x, y, w, h = seat['x'], seat['y'], seat['width'], seat['height']
+    if w <= 0 or h <= 0:
+        return None
+    # Seats reaching past the frame edges are clipped like in the detector
+    roi = frame[max(int(y), 0):max(int(y+h), 0), max(int(x), 0):max(int(x+w), 0)]
+    if roi.size == 0:
+        return None
+    small = cv2.resize(roi, (size, size), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+
+class SeatTrack:
+    """Ring buffer of recent gesture codes plus smoothed probabilities for one seat"""
+
+    __slots__ = ('history', 'position', 'probabilities', 'gesture', 'reuse_budget')
+
+    def __init__(self, history_size):
+        self.history = np.full(history_size, -1, dtype=np.int8)
+        self.position = 0
+        self.probabilities = np.zeros(len(GESTURE_TYPES), dtype=np.float32)
+        self.gesture = None
+        self.reuse_budget = 0
+
+
+class SeatTracker:
+    """
+    Temporal smoothing of per-seat gestures for one session
+    Fresh detections update an exponential moving average over gesture
+    probabilities; the reported gesture only switches when another gesture
+    leads the current one by more than the hysteresis margin. Seats whose
+    gesture stays stable may reuse their detection for more frames (the
+    reuse budget doubles up to max_reuse), seats that change go back to
+    being inferred every frame.
+    """
+
+    def __init__(self, alpha=0.4, hysteresis=0.2, history_size=16, stable_ratio=0.8, max_reuse=10):
+        self.alpha = alpha
+        self.hysteresis = hysteresis
+        self.history_size = history_size
+        self.stable_ratio = stable_ratio
+        self.max_reuse = max_reuse
+        self.tracks = {}
+
+    def reuse_budget(self, seat_id):
+        """Consecutive frames this seat may reuse its last detection"""
+        track = self.tracks.get(seat_id)
+        return track.reuse_budget if track is not None else 0
+
+    def update(self, detection):
+        """Fold a fresh detection into its seat's track and return the smoothed gesture"""
+        seat_id = detection['seat_id']
+        track = self.tracks.get(seat_id)
+        if track is None:
+            track = self.tracks[seat_id] = SeatTrack(self.history_size)
+
+        code = GESTURE_CODES.get(detection['gesture_type'], GESTURE_CODES['unknown'])
+        track.history[track.position] = code
+        track.position = (track.position + 1) % self.history_size
+
+        observation = np.zeros(len(GESTURE_TYPES), dtype=np.float32)
+        observation[code] = 1.0
+        if track.gesture is None:
+            track.probabilities[:] = observation
+        else:
+            track.probabilities *= (1 - self.alpha)
+            track.probabilities += self.alpha * observation
+
+        leader = int(np.argmax(track.probabilities))
+        current = GESTURE_CODES[track.gesture] if track.gesture is not None else leader
+        if leader != current and track.probabilities[leader] - track.probabilities[current] > self.hysteresis:
+            current = leader
+        changed = track.gesture is not None and GESTURE_TYPES[current] != track.gesture
+        track.gesture = GESTURE_TYPES[current]
+
+        # Adapt the sampling rate to how consistent the recent history is
+        seen = track.history[track.history >= 0]
+        stability = float(np.mean(seen == current)) if len(seen) else 0.0
+        if changed or code != current:
+            track.reuse_budget = 0
+        elif stability >= self.stable_ratio:
+            track.reuse_budget = min(max(1, track.reuse_budget * 2), self.max_reuse)
+
+        return track.gesture, stability
+
+    def smooth(self, detection, fresh):
+        """Return the detection with its gesture replaced by the tracked gesture"""
+        raw_gesture = detection['gesture_type']
+        if fresh:
+            gesture, stability = self.update(detection)
+        else:
+            track = self.tracks.get(detection['seat_id'])
+            if track is None or track.gesture is None:
+                return detection
+            gesture = track.gesture
+            seen = track.history[track.history >= 0]
+            stability = float(np.mean(seen == GESTURE_CODES[gesture])) if len(seen) else 0.0
+
+        # Arrivals and departures pass through unsmoothed, so a record never
+        # pairs a gesture with no face, or 'absent' with a detected face
+        present = bool(detection.get('face_detected'))
+        if present == (gesture == 'absent'):
+            gesture = raw_gesture
+
+        return dict(
+            detection,
+            gesture_type=gesture,
+            raw_gesture_type=detection.get('raw_gesture_type', raw_gesture),
+            stability=round(stability, 3)
+        )
+
+
+class SeatChangeGate:
+    """
+    Per-session record of what each seat looked like when it was last inferred
+    Seats whose thumbnail changed less than change_threshold (mean absolute
+    difference, 0-1) reuse their previous detection, until max_staleness
+    frames have passed without a fresh inference.
+    """
+
+    def __init__(self, change_threshold=0.02, max_staleness=10, signature_size=16):
+        self.change_threshold = change_threshold
+        self.max_staleness = max_staleness
+        self.signature_size = signature_size
+        self.tracker = SeatTracker(max_reuse=max_staleness)
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        self.owner = None
+        self.frame_shape = None
+
+        self.signatures = {}
+        self.detections = {}
+        self.age = {}
+        self.fresh_count = 0
+        self.reused_count = 0
+
+    def reset(self, owner=None, frame_shape=None):
+        self.owner = owner
+        self.frame_shape = frame_shape
+        self.signatures.clear()
+        self.detections.clear()
+        self.age.clear()
+        self.tracker = SeatTracker(max_reuse=self.max_staleness)
+
+    def plan(self, frame, seat_positions):
+        """
+        Split seats into those needing inference and those that can be reused
+        A seat is due again once it has reused its detection for as many frames
+        as the tracker's reuse budget allows, capped at max_staleness
+        Returns (indices to infer, {index: reused detection}, signatures)
+        """
+        if self.change_threshold <= 0:
+            self.fresh_count += len(seat_positions)
+            return list(range(len(seat_positions))), {}, [None] * len(seat_positions)
+
+        signatures = [seat_signature(frame, seat, self.signature_size) for seat in seat_positions]
+
+        candidates = [
+            idx for idx, seat in enumerate(seat_positions)
+            if signatures[idx] is not None
+            and seat['seat_id'] in self.signatures
+            and self.age.get(seat['seat_id'], 0) < min(self.max_staleness, self._reuse_budget(seat['seat_id']))
+        ]
+
+        unchanged = set()
+        if candidates:
+            current = np.stack([signatures[idx] for idx in candidates])
+            previous = np.stack([self.signatures[seat_positions[idx]['seat_id']] for idx in candidates])
+            diff = np.abs(current - previous).mean(axis=(1, 2)) / 255.0
+            unchanged = {idx for idx, d in zip(candidates, diff) if d < self.change_threshold}
+
+        infer = [idx for idx in range(len(seat_positions)) if idx not in unchanged]
+        reused = {}
+        for idx in unchanged:
+            seat_id = seat_positions[idx]['seat_id']
+            self.age[seat_id] += 1
+            reused[idx] = dict(self.detections[seat_id], fresh=False)
+
+        self.fresh_count += len(infer)
+        self.reused_count += len(reused)
+        self.last_used = time.time()
+        return infer, reused, signatures
+
+    def _reuse_budget(self, seat_id):
+        # Without temporal tracking every seat may go stale for max_staleness frames
+        if self.tracker.tracks:
+            return self.tracker.reuse_budget(seat_id)
+        return self.max_staleness
+
+    def commit(self, seat_positions, indices, signatures, detections):
+        """Remember signatures and detections of freshly inferred seats"""
+        for idx, detection in zip(indices, detections):
+            seat_id = seat_positions[idx]['seat_id']
+            if signatures[idx] is None:
+                self.signatures.pop(seat_id, None)
+                continue
+            # Stagger new seats so periodic refreshes do not all land on one frame
+            first_seen = seat_id not in self.signatures
+            self.signatures[seat_id] = signatures[idx]
+            # A copy: callers rewrite the returned detection (bboxes scaled back to camera pixels)
+            self.detections[seat_id] = dict(detection)
+            self.age[seat_id] = idx % max(self.max_staleness, 1) if first_seen else 0
+
+    def smooth(self, detections):
+        """Apply temporal smoothing to a merged list of fresh and reused detections"""
+        return [self.tracker.smooth(detection, detection.get('fresh', True)) for detection in detections]
+
+
+class SeatGateStore:
+    """Thread-safe, size-bounded map of session_id -> SeatChangeGate"""
+
+    def __init__(self, max_sessions=256):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._gates = OrderedDict()
+
+    def get(self, session_id, change_threshold, max_staleness):
+        with self._lock:
+            gate = self._gates.get(session_id)
+            if gate is None:
+                gate = SeatChangeGate(change_threshold, max_staleness)
+                self._gates[session_id] = gate
+                while len(self._gates) > self.max_sessions:
+                    self._gates.popitem(last=False)
+            else:
+                self._gates.move_to_end(session_id)
+                gate.change_threshold = change_threshold
+                gate.max_staleness = max_staleness
+                gate.tracker.max_reuse = max_staleness
+            return gate
+
+    def drop(self, session_id):
+        with self._lock:
+            self._gates.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._gates.clear()
+
+    def stats(self):
+        with self._lock:
+            fresh = sum(gate.fresh_count for gate in self._gates.values())
+            reused = sum(gate.reused_count for gate in self._gates.values())
+            return {
+                'sessions': len(self._gates),
+                'fresh_detections': fresh,
+                'reused_detections': reused,
+                'reuse_ratio': reused / (fresh + reused) if fresh + reused else 0
+            }
@@ -0,0 +1,203 @@
+"""
+Production server: gunicorn with pre-forked workers sharing a preloaded model
+
+The app is imported and the configured model loaded once in the master
+process, then gunicorn forks the workers, so checkpoint weights and cached
+artifacts are shared copy-on-write and workers serve from their first
+request. ONNX sessions are reopened in each worker (their thread pools do
+not survive fork) from the artifact already resolved by the master.
+
+Each worker runs `threads` request threads behind an admission gate: at
+most `max_concurrent` detections run per worker and `max_queued` more may
+wait up to `queue_timeout` seconds, anything else gets a 503 with
+Retry-After. On SIGTERM a worker stops accepting connections, answers
+new detections with a 503 'draining', gives admitted frames
+`graceful_timeout` seconds to finish and then closes stream sessions so
+open SSE result streams end instead of holding the worker until the
+timeout.
+
+    python serve.py --config serving.json
+    SERVE_WORKERS=4 SERVE_THREADS=4 MODEL_PATH=models/best.onnx python serve.py
+
+Configuration comes from the defaults below, then the JSON file given with
+--config or SERVE_CONFIG, then environment variables (SERVE_BIND,
+SERVE_WORKERS, SERVE_THREADS, SERVE_MAX_CONCURRENT, SERVE_MAX_QUEUED,
+SERVE_QUEUE_TIMEOUT, SERVE_TIMEOUT, SERVE_GRACEFUL_TIMEOUT, SERVE_BACKLOG,
+MODEL_PATH and MODEL_OPTIONS, a JSON object of /api/initialize-model
+options). Example file:
+
+    {"workers": 4, "threads": 4, "max_queued": 8,
+     "model": {"model_path": "models/best.onnx", "inference_mode": "whole_frame"}}
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+
+DEFAULT_CONFIG = {
+    'bind': '0.0.0.0:5001',
+    'workers': 2,
+    'threads': 4,
+    # Detections running at once per worker (default: threads) and waiting behind them
+    'max_concurrent': None,
+    'max_queued': 4,
+    'queue_timeout': 1.0,
+    'timeout': 60,
+    'graceful_timeout': 30,
+    'backlog': 128,
+    # /api/initialize-model body loaded before forking; None starts without a model
+    'model': None
+}
+
+ENV_OVERRIDES = (
+    ('SERVE_BIND', 'bind', str),
+    ('SERVE_WORKERS', 'workers', int),
+    ('SERVE_THREADS', 'threads', int),
+    ('SERVE_MAX_CONCURRENT', 'max_concurrent', int),
+    ('SERVE_MAX_QUEUED', 'max_queued', int),
+    ('SERVE_QUEUE_TIMEOUT', 'queue_timeout', float),
+    ('SERVE_TIMEOUT', 'timeout', int),
+    ('SERVE_GRACEFUL_TIMEOUT', 'graceful_timeout', int),
+    ('SERVE_BACKLOG', 'backlog', int)
+)
+
+logger = logging.getLogger('serve')
+
+
+def load_serving_config(path=None, environ=os.environ):
+    """Defaults, overridden by the JSON file, overridden by environment variables"""
+    config = dict(DEFAULT_CONFIG)
+    path = path or environ.get('SERVE_CONFIG')
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown serving options in {path}: {', '.join(sorted(unknown))}")
+        config.update(overrides)
+
+    for variable, key, cast in ENV_OVERRIDES:
+        if environ.get(variable):
+            config[key] = cast(environ[variable])
+
+    if environ.get('MODEL_PATH') or environ.get('MODEL_OPTIONS'):
+        model = dict(config['model'] or {})
+        model.update(json.loads(environ.get('MODEL_OPTIONS') or '{}'))
+        if environ.get('MODEL_PATH'):
+            model['model_path'] = environ['MODEL_PATH']
+        config['model'] = model
+
+    if config['max_concurrent'] is None:
+        config['max_concurrent'] = config['threads']
+    return config
+
+
+def preload_model(flask_app, model):
+    """Load the startup model through /api/initialize-model so options are validated the same way"""
+    response = flask_app.test_client().post('/api/initialize-model', json=dict(model, wait=True))
+    body = response.get_json(silent=True) or {}
+    if response.status_code != 200:
+        raise RuntimeError(f"Startup model failed to load: {body.get('message', response.status_code)}")
+    logger.info(f"Preloaded model {body.get('model_handle')} ({body.get('config', {}).get('model_type')})")
+
+
+def post_fork(server, worker):
+    import app
+    app.after_fork()
+
+
+def post_worker_init(worker):
+    """Start draining the app as soon as SIGTERM arrives, alongside gunicorn's own graceful shutdown"""
+    import app
+
+    handle_exit = worker.handle_exit
+
+    def drain_and_exit(sig, frame):
+        handle_exit(sig, frame)
+        # The signal handler runs on the worker's event loop thread, which must keep finishing requests
+        threading.Thread(target=app.shutdown, args=(worker.cfg.graceful_timeout,),
+                         name='drain', daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain_and_exit)
+
+
+def worker_int(worker):
+    import app
+    app.shutdown(timeout=0)
+
+
+def worker_exit(server, worker):
+    import app
+    app.shutdown(timeout=0)
+    if app.inference_pool is not None:
+        app.inference_pool.stop()
+    if app.inference_scheduler is not None:
+        app.inference_scheduler.stop()
+    app.log_listener.stop()
+
+    # Native runtimes initialized before fork (onnxruntime's global thread
+    # pools) abort or hang in their exit-time destructors in the child, so
+    # the worker leaves without running them, keeping gunicorn's exit code
+    code = getattr(sys.exc_info()[1], 'code', 0)
+    os._exit(code if isinstance(code, int) else 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the detector with pre-forked gunicorn workers')
+    parser.add_argument('--config', help='JSON serving config (also SERVE_CONFIG)')
+    parser.add_argument('--check', action='store_true', help='print the resolved config and exit')
+    args = parser.parse_args()
+
+    config = load_serving_config(args.config)
+    if args.check:
+        print(json.dumps(config, indent=2))
+        return
+
+    # app.py reads its admission settings from the environment at import
+    os.environ['DETECT_MAX_CONCURRENT'] = str(config['max_concurrent'])
+    os.environ['DETECT_MAX_QUEUED'] = str(config['max_queued'])
+    os.environ['DETECT_QUEUE_TIMEOUT'] = str(config['queue_timeout'])
+
+    from gunicorn.app.base import BaseApplication
+
+    import app
+
+    if config['model']:
+        try:
+            preload_model(app.app, config['model'])
+        except Exception as e:
+            logger.error(str(e))
+            sys.exit(1)
+
+    class DetectorServer(BaseApplication):
+        def load_config(self):
+            settings = {
+                'bind': config['bind'],
+                'workers': config['workers'],
+                'threads': config['threads'],
+                'worker_class': 'gthread',
+                'preload_app': True,
+                'backlog': config['backlog'],
+                'timeout': config['timeout'],
+                'graceful_timeout': config['graceful_timeout'],
+                'post_fork': post_fork,
+                'post_worker_init': post_worker_init,
+                'worker_int': worker_int,
+                'worker_exit': worker_exit
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app.app
+
+    logger.info(f"Serving on {config['bind']}: {config['workers']} workers x {config['threads']} threads, "
+                f"{config['max_concurrent']} concurrent + {config['max_queued']} queued detections per worker")
+    DetectorServer().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import os
+import threading
+import time
+import logging
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class LatestFrameSlot:
+    """
+    Single-slot mailbox for incoming frames
+    A new frame replaces any frame that has not been picked up yet, so a slow
+    consumer always works on the most recent frame instead of a backlog
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._condition:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self.received += 1
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        """Wait for the next frame; returns None on timeout or when closed"""
+        with self._condition:
+            if self._frame is None and not self._closed:
+                self._condition.wait(timeout)
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._frame = None
+            self._condition.notify_all()
+
+
+class CameraCapture:
+    """
+    Server-side video source (RTSP/HTTP URL, device index or file) read on
+    its own thread; every decoded frame goes to the session's LatestFrameSlot,
+    so inference always sees the newest frame. Network sources are reopened
+    after read failures; files are paced to their frame rate and optionally
+    looped, so they behave like a live camera.
+    """
+
+    def __init__(self, source, loop=False, reconnect_delay=2.0):
+        self.source = int(source) if str(source).isdigit() else source
+        self.is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        self.loop = loop
+        self.reconnect_delay = reconnect_delay
+        self.frames = 0
+        self.reconnects = 0
+        self.fps = None
+        self.last_error = None
+        self._capture = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _open(self):
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            raise IOError(f"Cannot open video source: {self.source}")
+        # Live sources buffer frames internally; keep that queue as short as possible
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or None
+        return capture
+
+    def start(self, session):
+        """Open the source (raising IOError if that fails) and start reading into session"""
+        self._capture = self._open()
+        self._thread = threading.Thread(
+            target=self._run, args=(session,), name=f"capture-{session.session_id}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, session):
+        frame_time = 1.0 / self.fps if self.is_file and self.fps else 0
+        next_frame = time.monotonic()
+        while not self._stopped.is_set():
+            ok, frame = self._capture.read()
+            if not ok:
+                if self.is_file and not self.loop:
+                    logger.info(f"Video source {self.source} ended")
+                    break
+                self._capture.release()
+                if not self.is_file:
+                    self.reconnects += 1
+                    logger.warning(f"Video source {self.source} stopped delivering frames, reconnecting")
+                    if self._stopped.wait(self.reconnect_delay):
+                        break
+                try:
+                    self._capture = self._open()
+                except IOError as e:
+                    self.last_error = str(e)
+                continue
+
+            self.frames += 1
+            session.submit(frame)
+            if frame_time:
+                next_frame += frame_time
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    self._stopped.wait(delay)
+                else:
+                    next_frame = time.monotonic()
+        self._capture.release()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    def stats(self):
+        return {
+            'source': str(self.source),
+            'running': bool(self._thread and self._thread.is_alive()),
+            'frames_captured': self.frames,
+            'source_fps': self.fps,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error
+        }
+
+
+class StreamSession:
+    """
+    Long-lived detection channel for one classroom session
+    The seat layout is registered once; frames go through a LatestFrameSlot
+    to a dedicated worker thread and results are published to subscribers
+    """
+
+    def __init__(self, session_id, seat_positions, process_frame, idle_timeout=300, interval=None):
+        self.session_id = session_id
+        self.seat_positions = seat_positions
+        self.process_frame = process_frame
+        self.idle_timeout = idle_timeout
+        # Minimum seconds between inferences (None: as fast as frames arrive)
+        self.interval = interval
+        self.capture = None
+        self.slot = LatestFrameSlot()
+        self.created_at = time.time()
+        self.last_activity = time.time()
+        self.processed = 0
+        self.errors = 0
+
+        self._results = threading.Condition()
+        self._latest_result = None
+        self._sequence = 0
+        self._running = True
+        self._worker = threading.Thread(
+            target=self._run, name=f"stream-{session_id}", daemon=True
+        )
+        self._worker.start()
+
+    @property
+    def running(self):
+        return self._running
+
+    def submit(self, frame):
+        self.last_activity = time.time()
+        self.slot.put(frame)
+
+    def update_layout(self, seat_positions):
+        self.seat_positions = seat_positions
+        self.last_activity = time.time()
+
+    def attach_capture(self, capture):
+        """Feed the session from a server-side CameraCapture, replacing any previous one"""
+        if self.capture is not None:
+            self.capture.stop()
+        self.capture = capture
+        capture.start(self)
+
+    def _run(self):
+        while self._running:
+            frame = self.slot.take(timeout=1.0)
+            if frame is None:
+                if time.time() - self.last_activity > self.idle_timeout:
+                    logger.info(f"Stream session {self.session_id} idle, closing")
+                    self.close()
+                continue
+
+            started = time.monotonic()
+            try:
+                result = self.process_frame(frame, self.seat_positions, self.session_id)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Stream session {self.session_id} failed to process frame: {e}")
+                result = {
+                    'success': False,
+                    'message': f'Failed to process frame: {str(e)}',
+                    'session_id': self.session_id
+                }
+
+            self._publish(result)
+
+            if self.interval:
+                # The slot keeps only the newest frame, so waiting here sets the inference rate
+                delay = self.interval - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def _publish(self, result):
+        with self._results:
+            self._sequence += 1
+            result['sequence'] = self._sequence
+            self._latest_result = result
+            self._results.notify_all()
+
+    def latest(self):
+        with self._results:
+            return self._latest_result
+
+    def wait_for_result(self, after_sequence, timeout=None):
+        """Block until a result newer than after_sequence exists; None on timeout/close"""
+        with self._results:
+            if self._sequence <= after_sequence and self._running:
+                self._results.wait(timeout)
+            if self._sequence > after_sequence:
+                return self._latest_result
+            return None
+
+    def stats(self):
+        return {
+            'session_id': self.session_id,
+            'seats': len(self.seat_positions),
+            'running': self._running,
+            'interval_s': self.interval,
+            'capture': self.capture.stats() if self.capture else None,
+            'frames_received': self.slot.received,
+            'frames_dropped': self.slot.dropped,
+            'frames_processed': self.processed,
+            'errors': self.errors,
+            'last_sequence': self._sequence,
+            'created_at': self.created_at,
+            'last_activity': self.last_activity
+        }
+
+    def close(self):
+        self._running = False
+        if self.capture is not None:
+            self.capture.stop()
+        self.slot.close()
+        with self._results:
+            self._results.notify_all()
+
+
+class StreamSessionManager:
+    """Thread-safe registry of open StreamSessions keyed by session_id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def open(self, session_id, seat_positions, process_frame, interval=None):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and session.running:
+                session.update_layout(seat_positions)
+                if interval is not None:
+                    session.interval = interval
+                return session
+            session = StreamSession(session_id, seat_positions, process_frame, interval=interval)
+            self._sessions[session_id] = session
+            return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and not session.running:
+                del self._sessions[session_id]
+                return None
+            return session
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+        return session is not None
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return [session.stats() for session in self._sessions.values()]
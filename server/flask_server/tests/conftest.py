@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the server modules directly and should not write flask_server.log
+os.environ.setdefault('LOG_FILE', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
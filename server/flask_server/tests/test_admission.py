@@ -0,0 +1,29 @@
+import threading
+
+import app
+from admission import AdmissionGate
+
+
+def test_drain_rejects_new_work_and_waits_for_admitted():
+    gate = AdmissionGate(2)
+    assert gate.acquire() is None
+    threading.Timer(0.2, gate.release).start()
+
+    assert gate.drain(timeout=5)
+    assert gate.acquire() == 'draining'
+    assert gate.stats()['rejected']['draining'] == 1
+
+
+def test_shutdown_drains_detections_and_closes_streams(monkeypatch):
+    monkeypatch.setattr(app, 'admission_gate', AdmissionGate(2))
+    client = app.app.test_client()
+    seats = [{'seat_id': 's1', 'x': 0, 'y': 0, 'width': 10, 'height': 10}]
+    assert client.post('/api/stream/drain-test/open', json={'seat_positions': seats}).status_code == 200
+
+    assert app.shutdown(timeout=1)
+
+    response = client.post('/api/detect-frame', json={'seat_positions': seats})
+    assert response.status_code == 503
+    assert response.json['message'] == 'Server is draining'
+    assert response.headers['Retry-After'] == '1'
+    assert app.stream_sessions.get('drain-test') is None
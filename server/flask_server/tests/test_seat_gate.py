@@ -0,0 +1,17 @@
+import numpy as np
+
+import app
+from detector import YOLODetector
+
+
+def test_reused_seat_keeps_camera_bbox_with_decode_reduction():
+    detector = YOLODetector('mock.model', temporal_smoothing=False, change_threshold=0.5, simulation_seed=0)
+    frame = np.full((240, 320, 3), 90, dtype=np.uint8)
+    seats = [{'seat_id': f's{i}', 'x': i * 80, 'y': 40, 'width': 80, 'height': 160} for i in range(4)]
+
+    fresh, = app.run_view_detection(detector, [(frame, seats, 2)], gate_keys=['gate-test'])
+    reused, = app.run_view_detection(detector, [(frame, seats, 2)], gate_keys=['gate-test'])
+
+    assert all(d['fresh'] for d in fresh)
+    assert not any(d['fresh'] for d in reused)
+    assert [d['bbox'] for d in reused] == [d['bbox'] for d in fresh]
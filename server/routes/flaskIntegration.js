@@ -6,6 +6,8 @@ const router = express.Router();
 
 // Flask server configuration
 const FLASK_SERVER_URL = process.env.FLASK_SERVER_URL || 'http://localhost:5001';
+// Seconds Flask waits for a model load before answering initialize-model
+const MODEL_LOAD_WAIT_SECONDS = Number(process.env.MODEL_LOAD_WAIT_SECONDS) || 60;
 
 // Check Flask server status
 router.get('/status', auth, async (req, res) => {
@@ -42,16 +44,18 @@ router.post('/initialize-model', auth, async (req, res) => {
       model_path: model_path,
       model_type: model_type || 'pytorch',
       confidence_threshold: confidence_threshold || 0.5,
-      iou_threshold: iou_threshold || 0.4
-    }, { timeout: 30000 }); // 30 second timeout for model loading
+      iou_threshold: iou_threshold || 0.4,
+      wait_timeout: MODEL_LOAD_WAIT_SECONDS
+    }, { timeout: (MODEL_LOAD_WAIT_SECONDS + 30) * 1000 }); // Longer than Flask's own wait, so Flask reports slow loads
     
     console.log('Flask model initialization response:', response.data);
     res.json(response.data);
   } catch (error) {
     console.error('Error initializing model:', error.response?.data || error.message);
-    res.status(500).json({ 
+    // 504: the model is still loading on the Flask server
+    res.status(error.response?.status === 504 ? 504 : 500).json({ 
       success: false,
-      message: 'Failed to initialize model on Flask server',
+      message: error.response?.data?.message || 'Failed to initialize model on Flask server',
       error: error.response?.data || error.message,
       details: error.response?.status ? `HTTP ${error.response.status}` : 'Network error'
     });